@@ -0,0 +1,72 @@
+"""
+Local stand-in for the external websites linked to from the wikis, so that link checking can be benchmarked
+without touching the network.
+
+Paths are of the form /<behaviour>/<anything>, where the behaviour is one of:
+    ok       - 200 OK
+    missing  - 404 Not Found
+    moved    - 301 redirect to the equivalent /ok/ path
+    timeout  - does not respond until well after the link checker has given up
+Every response is delayed by the configured latency.
+"""
+
+import http.server
+import threading
+import time
+
+
+class LinkServer(object):
+    def __init__(self, latency=0.05, timeout_delay=2.0):
+        """
+        Args:
+            latency: Seconds to wait before every response
+            timeout_delay: Seconds to wait before responding to /timeout/ paths
+        """
+        self.latency = latency
+        self.timeout_delay = timeout_delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_HEAD(self):  # noqa: N802
+                with server._lock:
+                    server.requests += 1
+                behaviour = self.path.strip("/").split("/")[0]
+                time.sleep(server.latency)
+                if behaviour == "timeout":
+                    time.sleep(server.timeout_delay)
+                if behaviour == "missing":
+                    self.send_response(404)
+                elif behaviour == "moved":
+                    self.send_response(301)
+                    self.send_header("Location", self.path.replace("/moved/", "/ok/", 1))
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):  # noqa: N802
+                self.do_HEAD()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
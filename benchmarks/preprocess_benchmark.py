@@ -0,0 +1,94 @@
+"""
+Compares the spelling preprocessor against the original multi-pass version on pages of increasing size, checking that
+they agree and that the time taken grows linearly with the size of the page.
+
+Run with: python -m benchmarks.preprocess_benchmark
+"""
+
+import random
+import re
+import timeit
+
+from tests.legacy_preprocess import (
+    legacy_preprocess_for_spelling,
+    legacy_strip_inline_code_blocks,
+)
+from utils.spelling_preprocessor import (
+    preprocess_for_spelling,
+    strip_inline_code_blocks,
+    strip_markdown_links,
+)
+
+PROSE = "Some prose about the *instrument* with a [link](https://example.com) and `inline code`. "
+CODE_BLOCK = "```\nsome_code = `not closed\n```\n<pre>more code</pre> <code>and more</code>\n"
+
+
+def unclosed_backticks(runs):
+    # Backtick runs getting longer along a line never close, the worst case for a backtracking expression
+    return " ".join("`" * length for length in range(1, runs + 1)) + "\n"
+
+
+def unclosed_brackets(count):
+    # Every "[" is tried against every later "](" on the line by a backtracking expression, and none of them close
+    return "[a" * count + "](b \n"
+
+
+def link_heavy(count):
+    # Link targets which are never closed, so every "[" looks for a closer to the end of the line
+    return "[a](b " * count + "\n"
+
+
+def legacy_strip_markdown_links(text):
+    return re.sub(r"\[(.+?)\]\([\S]+\)", r"\1", text)
+
+
+def generate_page(size, rng):
+    parts = []
+    while sum(len(part) for part in parts) < size:
+        parts.append(rng.choice([PROSE] * 20 + [CODE_BLOCK] * 4 + [unclosed_backticks(9)]))
+    return "".join(parts)
+
+
+def compare(original_function, new_function, pages):
+    print("{:>10} {:>12} {:>12} {:>12}".format("chars", "original/s", "new/s", "new us/char"))
+    for page in pages:
+        assert new_function(page, "bench") == original_function(page, "bench")
+        original = min(timeit.repeat(lambda: original_function(page, "bench"), number=1, repeat=3))
+        new = min(timeit.repeat(lambda: new_function(page, "bench"), number=1, repeat=3))
+        print(
+            "{:>10} {:>12.4f} {:>12.4f} {:>12.4f}".format(
+                len(page), original, new, new / len(page) * 1e6
+            )
+        )
+
+
+def main():
+    rng = random.Random(0)
+    print("Typical pages")
+    compare(
+        legacy_preprocess_for_spelling,
+        preprocess_for_spelling,
+        [generate_page(size, rng) for size in [10_000, 20_000, 40_000, 80_000, 160_000]],
+    )
+    print("\nInline code stripping of a single line of unclosed inline code")
+    compare(
+        lambda text, page: legacy_strip_inline_code_blocks(text),
+        lambda text, page: strip_inline_code_blocks(text),
+        [unclosed_backticks(runs) for runs in [10, 20, 40, 60]],
+    )
+    print("\nLink stripping of a single line of unclosed brackets")
+    compare(
+        lambda text, page: legacy_strip_markdown_links(text),
+        lambda text, page: strip_markdown_links(text),
+        [unclosed_brackets(count) for count in [1_000, 2_000, 4_000, 8_000]],
+    )
+    print("\nLink stripping of a single line of links with unclosed targets")
+    compare(
+        lambda text, page: legacy_strip_markdown_links(text),
+        lambda text, page: strip_markdown_links(text),
+        [link_heavy(count) for count in [500, 1_000, 2_000, 4_000]],
+    )
+
+
+if __name__ == "__main__":
+    main()
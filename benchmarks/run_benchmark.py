@@ -0,0 +1,192 @@
+"""
+Benchmarks the page tests on a synthetic wiki whose external links point at a local server, so that changes to the
+checker can be compared without touching the network.
+
+Two scenarios are run:
+    folder - the pages are checked in place, as with run_tests.py --folder
+    remote - the wiki is committed to a local git repository, cloned and then checked, as with run_tests.py --remote
+
+Each phase reports its wall time, pages/sec, URLs/sec and peak Python memory. Memory is traced with tracemalloc, which
+slows everything down; use --no-memory for timings closer to a real run.
+
+Run with: python -m benchmarks.run_benchmark --pages 200
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+import git
+
+import utils.global_vars
+from benchmarks.link_server import LinkServer
+from benchmarks.synthetic_wiki import generate_wiki
+from tests.page_tests import PageTests
+from utils.ignored_words import IGNORED_ITEMS
+from utils.link_engine import LinkCheckEngine
+from wiki import Wiki, acquire_wikis
+
+SPELLING_TEST = PageTests.test_GIVEN_a_page_THEN_its_spelling_conforms_to_UK_English.__name__
+LINK_TEST = PageTests.test_GIVEN_a_page_IF_it_contains_urls_WHEN_url_loaded_THEN_response_is_http_ok.__name__
+
+
+class LocalWiki(Wiki):
+    """
+    A wiki cloned from a local repository rather than from Github.
+    """
+
+    def __init__(self, name, origin):
+        super(LocalWiki, self).__init__(name)
+        self.origin = origin
+
+    def clone_wiki_from_web(self):
+        repo_path = self.get_path()
+        if not os.path.exists(repo_path):
+            os.makedirs(repo_path)
+        git.Git(repo_path).clone("file://{}".format(self.origin), repo_path, depth=1)
+
+
+class PhaseTimer(object):
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.phases = []
+
+    def run(self, name, function, pages=0):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.phases.append(
+            {
+                "phase": name,
+                "seconds": elapsed,
+                "pages_per_second": pages / elapsed if pages and elapsed else None,
+                "urls_per_second": None,
+                "peak_memory_mb": peak / 2**20 if peak is not None else None,
+            }
+        )
+        return result
+
+    def set_urls(self, urls):
+        """
+        Records the number of URLs handled by the last phase, which is often only known once it has finished.
+        """
+        phase = self.phases[-1]
+        phase["urls_per_second"] = urls / phase["seconds"] if phase["seconds"] else None
+
+    def report(self):
+        print(
+            "{:<24} {:>10} {:>10} {:>10} {:>10}".format(
+                "phase", "seconds", "pages/s", "URLs/s", "peak MB"
+            )
+        )
+
+        def number(value, digits):
+            return "{:>10.{}f}".format(value, digits) if value is not None else "{:>10}".format("-")
+
+        for phase in self.phases:
+            print(
+                "{:<24} {} {} {} {}".format(
+                    phase["phase"],
+                    number(phase["seconds"], 3),
+                    number(phase["pages_per_second"], 1),
+                    number(phase["urls_per_second"], 1),
+                    number(phase["peak_memory_mb"], 1),
+                )
+            )
+
+
+def run_page_test(test_name, pages, wiki_dir):
+    """
+    Runs one of the page tests on every page, returning the number of failures. Failures are expected as the
+    synthetic wiki links to missing and timing out URLs.
+    """
+    suite = unittest.TestSuite(
+        PageTests(test_name, IGNORED_ITEMS, (page, pages, wiki_dir)) for page in pages
+    )
+    with open(os.devnull, "w") as devnull:
+        result = unittest.TextTestRunner(stream=devnull, verbosity=0).run(suite)
+    return len(result.failures) + len(result.errors)
+
+
+def check_pages(timer, scenario, pages, wiki_dir, link_timeout):
+    # Each scenario starts with empty caches, so it measures a cold run
+    engine = LinkCheckEngine(timeout=link_timeout)
+    utils.global_vars.init(engine=engine)
+    try:
+        timer.run(
+            "{}: spelling".format(scenario),
+            lambda: run_page_test(SPELLING_TEST, pages, wiki_dir),
+            pages=len(pages),
+        )
+        timer.run(
+            "{}: links".format(scenario),
+            lambda: run_page_test(LINK_TEST, pages, wiki_dir),
+            pages=len(pages),
+        )
+        timer.set_urls(len(utils.global_vars.link_registry))
+    finally:
+        engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__.splitlines()[1]
+    )
+    parser.add_argument("--pages", type=int, default=200, help="Number of pages in the wiki")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds the link server waits per request"
+    )
+    parser.add_argument(
+        "--link-timeout", type=float, default=0.5, help="Seconds before a link check times out"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for generating the wiki")
+    parser.add_argument(
+        "--no-memory", action="store_true", default=False, help="Don't measure peak memory"
+    )
+    parser.add_argument("--json", type=str, default=None, help="File to write the results to")
+    args = parser.parse_args()
+
+    timer = PhaseTimer(trace_memory=not args.no_memory)
+    original_directory = os.getcwd()
+    with LinkServer(args.latency, timeout_delay=args.link_timeout * 4) as server:
+        with tempfile.TemporaryDirectory() as directory:
+            origin = os.path.join(directory, "origin", "synthetic")
+            pages = timer.run(
+                "generate",
+                lambda: generate_wiki(origin, args.pages, server.url, seed=args.seed, commit=True),
+                pages=args.pages,
+            )
+            check_pages(timer, "folder", pages, origin, args.link_timeout)
+
+            os.chdir(directory)
+            try:
+                wiki = LocalWiki("synthetic", origin)
+                checkout = acquire_wikis([wiki])
+                timer.run("remote: clone", checkout.__enter__, pages=args.pages)
+                try:
+                    check_pages(
+                        timer, "remote", wiki.get_pages(), wiki.get_path(), args.link_timeout
+                    )
+                finally:
+                    checkout.__exit__(None, None, None)
+            finally:
+                os.chdir(original_directory)
+
+    timer.report()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "phases": timer.phases}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures how long checking a single page takes to give its first result, from starting Python to the first test
+result being printed, as it is when the checker is run by a pre-commit hook or an editor.
+
+Run with: python -m benchmarks.startup_benchmark
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PAGE = """# A page
+
+Some prose about the instrument, with a [link to another section](#a-page) and a [link](https://example.com).
+"""
+# The first character printed for each test result, once the tests have started running
+RESULT_MARKERS = (".", "F", "E", "s", "=")
+
+
+def time_single_file_check(directory, page, extra_args):
+    """
+    Returns:
+        The seconds to the first result being printed, and to the run finishing
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-u", os.path.join(os.getcwd(), "run_tests.py"), "--file", page]
+        + extra_args,
+        cwd=directory,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    first_result = None
+    output = ""
+    # Read a character at a time, as a passing test only prints a "." without a new line
+    while True:
+        character = process.stdout.read(1)
+        if not character:
+            break
+        if first_result is None:
+            output += character
+            running, _, results = output.partition("Running tests...")
+            if results and results.lstrip("\n-").startswith(RESULT_MARKERS):
+                first_result = time.perf_counter() - started
+    process.wait()
+    return first_result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__.splitlines()[1]
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Number of times to check the page")
+    parser.add_argument("--json", type=str, default=None, help="File to write the results to")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        # The checker reads its word lists from the folder it is run in
+        for file_name in ["words.txt", "ignored_urls.txt"]:
+            shutil.copy(file_name, directory)
+        page = os.path.join(directory, "page.md")
+        with open(page, "w", encoding="utf-8") as f:
+            f.write(PAGE)
+        for _ in range(args.runs):
+            results.append(
+                time_single_file_check(directory, page, ["--offline", "--no-link-cache"])
+            )
+
+    first_results = [first for first, _ in results if first is not None]
+    totals = [total for _, total in results]
+    print("{:<24} {:>10} {:>10}".format("", "median/s", "best/s"))
+    if first_results:
+        print(
+            "{:<24} {:>10.3f} {:>10.3f}".format(
+                "first result", statistics.median(first_results), min(first_results)
+            )
+        )
+    print("{:<24} {:>10.3f} {:>10.3f}".format("whole run", statistics.median(totals), min(totals)))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "runs": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Generates synthetic wikis with a realistic mix of prose, code blocks, inline code, images, .rest pages, links between
+pages and external links.
+"""
+
+import os
+import random
+
+import git
+
+WORDS = (
+    "the instrument control system uses a motor to move the sample stage and the detector records the neutron "
+    "beam while the scientist watches the experiment from the cabin and checks the temperature of the cryostat "
+    "before changing the configuration of the beamline and saving the results"
+).split()
+EXTERNAL_BEHAVIOURS = ["ok"] * 16 + ["moved"] * 2 + ["missing", "timeout"]
+
+
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def _page_name(index):
+    return "Page_{}".format(index)
+
+
+def _markdown_page(index, pages, distinct_external_links, link_server_url, rng):
+    lines = ["# {}".format(_page_name(index).replace("_", " ")), ""]
+    for section in range(rng.randint(2, 6)):
+        lines.append("## Section {}".format(section))
+        lines.append("")
+        for _ in range(rng.randint(1, 4)):
+            parts = [_sentence(rng) for _ in range(rng.randint(2, 5))]
+            choice = rng.random()
+            if choice < 0.3:
+                target = rng.randrange(pages)
+                parts.append("See [page {}]({}).".format(target, _page_name(target)))
+            elif choice < 0.4:
+                target = rng.randrange(pages)
+                parts.append("See [section](%s#section-0)." % _page_name(target))
+            elif choice < 0.7:
+                link = rng.randrange(distinct_external_links)
+                behaviour = EXTERNAL_BEHAVIOURS[link % len(EXTERNAL_BEHAVIOURS)]
+                parts.append("[External]({}/{}/{}).".format(link_server_url, behaviour, link))
+            elif choice < 0.8:
+                parts.append("Run `caput {}:MOTOR 1` first.".format(rng.randint(0, 99)))
+            elif choice < 0.9:
+                parts.append("![diagram](images/image_{}.png)".format(rng.randrange(10)))
+            lines.append(" ".join(parts))
+            lines.append("")
+        if rng.random() < 0.4:
+            lines.extend(["```python", "set_pv('MOTOR', {})".format(section), "```", ""])
+        if rng.random() < 0.1:
+            lines.extend(["<pre>", "raw output {}".format(section), "</pre>", ""])
+    return "\n".join(lines)
+
+
+def _rest_page(index, pages, distinct_external_links, link_server_url, rng):
+    lines = []
+    for _ in range(rng.randint(2, 6)):
+        target = rng.randrange(pages)
+        link = rng.randrange(distinct_external_links)
+        behaviour = EXTERNAL_BEHAVIOURS[link % len(EXTERNAL_BEHAVIOURS)]
+        lines.append(
+            "{} [[{}]] and `external site <{}/{}/{}>`_".format(
+                _sentence(rng), _page_name(target), link_server_url, behaviour, link
+            )
+        )
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_wiki(
+    directory,
+    pages,
+    link_server_url,
+    distinct_external_links=None,
+    rest_fraction=0.05,
+    seed=0,
+    commit=False,
+):
+    """
+    Writes a synthetic wiki into a directory.
+
+    Args:
+        directory: Where to write the wiki, created if it doesn't exist
+        pages: The number of pages to generate
+        link_server_url: Base URL of the local link server that external links point to
+        distinct_external_links: The number of distinct external URLs to spread over the pages, by default a third
+            of the number of pages
+        rest_fraction: The fraction of pages to write as .rest pages rather than markdown
+        seed: Seed for the random generator, so the same arguments always give the same wiki
+        commit: Whether to make the directory a git repository and commit the pages
+
+    Returns:
+        The paths of the generated pages
+    """
+    rng = random.Random(seed)
+    if distinct_external_links is None:
+        distinct_external_links = max(1, pages // 3)
+    os.makedirs(os.path.join(directory, "images"), exist_ok=True)
+    for image in range(10):
+        with open(os.path.join(directory, "images", "image_{}.png".format(image)), "wb") as f:
+            f.write(b"\x89PNG")
+
+    paths = []
+    for index in range(pages):
+        if rng.random() < rest_fraction:
+            path = os.path.join(directory, "{}.rest".format(_page_name(index)))
+            text = _rest_page(index, pages, distinct_external_links, link_server_url, rng)
+        else:
+            path = os.path.join(directory, "{}.md".format(_page_name(index)))
+            text = _markdown_page(index, pages, distinct_external_links, link_server_url, rng)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        paths.append(path)
+
+    if commit:
+        repo = git.Repo.init(directory)
+        repo.git.add(A=True)
+        actor = git.Actor("Benchmark", "benchmark@localhost")
+        repo.index.commit("Synthetic wiki", author=actor, committer=actor)
+    return paths
@@ -0,0 +1,61 @@
+"""
+Compares the ignored URL matcher against the original scan of every entry for every link, with ignore lists of
+increasing size and links which repeat across pages as they do on the wikis.
+
+Run with: python -m benchmarks.url_matcher_benchmark
+"""
+
+import random
+import timeit
+
+from utils.url_matcher import UrlMatcher
+
+HOSTS = ["github.com", "example.com", "isis.stfc.ac.uk", "docs.python.org", "www.mksinst.com"]
+
+
+def generate_entries(count, rng):
+    return [
+        "https://{}/{}/{}".format(rng.choice(HOSTS), rng.randrange(1000), rng.randrange(1000))
+        for _ in range(count)
+    ]
+
+
+def generate_links(count, distinct, rng):
+    urls = [
+        "https://{}/{}/{}".format(rng.choice(HOSTS), rng.randrange(1000), rng.randrange(1000))
+        for _ in range(distinct)
+    ]
+    return [rng.choice(urls) for _ in range(count)]
+
+
+def main():
+    rng = random.Random(0)
+    links = generate_links(10_000, 1_000, rng)
+    print("{:>10} {:>12} {:>12}".format("entries", "original/s", "new/s"))
+    for size in [40, 400, 2_000]:
+        entries = generate_entries(size, rng) + links[:10]
+        original_outcomes = [any(entry in link for entry in entries) for link in links]
+        matcher = UrlMatcher(entries)
+        assert [matcher.matches(link) for link in links] == original_outcomes
+        original = min(
+            timeit.repeat(
+                lambda: [any(entry in link for entry in entries) for link in links],
+                number=1,
+                repeat=3,
+            )
+        )
+        # Includes compiling the matcher, which is done once per run
+        new = min(
+            timeit.repeat(
+                lambda: [
+                    matcher.matches(link) for matcher in [UrlMatcher(entries)] for link in links
+                ],
+                number=1,
+                repeat=3,
+            )
+        )
+        print("{:>10} {:>12.4f} {:>12.4f}".format(len(entries), original, new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+
+from utils.sharding import (
+    REPORTS_FOLDER,
+    merge_junit_reports,
+    merge_link_failures,
+    merge_page_timings,
+    merge_skipped_links,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="""Combines the reports of the shards of a run of the tests into one result""",
+    )
+    parser.add_argument(
+        "reports", nargs="+", type=str, help="The test-reports folder of each shard"
+    )
+    parser.add_argument(
+        "--output",
+        required=False,
+        type=str,
+        default=os.path.join(os.getcwd(), REPORTS_FOLDER),
+        help="Folder to write the combined reports to",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    problems = merge_junit_reports(args.reports, args.output)
+    link_failures = merge_link_failures(args.reports, args.output)
+    skipped_links = merge_skipped_links(args.reports, args.output)
+    timings = merge_page_timings(args.reports, args.output)
+
+    print(link_failures.render())
+    print(
+        "Combined {} shards: {} failed tests, {} link failures, {} skipped links, timings for {} pages".format(
+            len(args.reports), problems, len(link_failures), len(skipped_links), len(timings)
+        )
+    )
+    sys.exit(0 if problems == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,284 @@
 import argparse
-import json
+import concurrent.futures
+import cProfile
 import locale
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
 import unittest
 
-import git
-import requests
-from xmlrunner import XMLTestRunner
-
 import utils.global_vars
-from tests.page_tests import IBEX_MANUAL, USER_MANUAL, PageTests
-from tests.shadow_mirroring_tests import ShadowReplicationTests
+from tests.page_tests import PageTests
+from tests.shadow_mirroring_tests import ShadowReplicationTests, prefetch_shadow_pages
+from utils.check_runner import run_checks
+from utils.host_health import DEFAULT_FAILURE_THRESHOLD, DEFAULT_RETRIES, HostHealth
 from utils.ignored_words import IGNORED_ITEMS
+from utils.incremental import DEFAULT_INCREMENTAL_STATE_PATH, IncrementalState
+from utils.issue_index import DEFAULT_ISSUE_INDEX_PATH, DEFAULT_REFRESH_HOURS, IssueIndex
+from utils.link_cache import (
+    DEFAULT_FAILURE_TTL_HOURS,
+    DEFAULT_LINK_CACHE_PATH,
+    DEFAULT_SUCCESS_TTL_HOURS,
+    LinkCache,
+)
+from utils.link_engine import (
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_MAX_CONNECTIONS_PER_HOST,
+    LinkCheckEngine,
+)
+from utils.link_failures import LinkFailures
+from utils.link_scheduler import SKIPPED_LINKS_FILE, LinkScheduler
+from utils.page import Page, as_page
+from utils.parallel_spelling import SpellingPool
+from utils.run_profile import RunProfile
+from utils.sharding import (
+    PAGE_TIMINGS_FILE,
+    REPORTS_FOLDER,
+    Shard,
+    load_page_timings,
+    page_key,
+    parse_shard,
+    save_page_timings,
+)
+from utils.spelling_cache import DEFAULT_SPELLING_CACHE_PATH, SpellingCache
+from utils.url_matcher import get_url_matcher, unused_entries
+from utils.wiki_config import (
+    DEFAULT_WIKI_CONFIG_PATH,
+    LINKS_CHECK,
+    SHADOW_CHECK,
+    SPELLING_CHECK,
+    load_wiki_config,
+)
+from utils.wiki_index import get_wiki_index
+from watch import WatchSession, watch
+from wiki import acquire_wikis
 
-GITHUB_API_ISSUE_CALL = "https://api.github.com/repos/ISISComputingGroup/IBEX/issues?per_page=1"
+SPELLING_TEST = PageTests.test_GIVEN_a_page_THEN_its_spelling_conforms_to_UK_English.__name__
+LINK_TEST = PageTests.test_GIVEN_a_page_IF_it_contains_urls_WHEN_url_loaded_THEN_response_is_http_ok.__name__
+PAGE_TESTS_FOR_CHECKS = {SPELLING_CHECK: SPELLING_TEST, LINKS_CHECK: LINK_TEST}
 
+# Wikis are checked at the same time, so each one's console output is printed in one go once it has finished
+_output_lock = threading.Lock()
 
-def run_tests_on_pages(reports_path, pages, wiki_dir, highest_issue_num, test_class):
-    suite = unittest.TestSuite()
-    loader = unittest.TestLoader()
 
-    # Add spelling test suite a dynamic number of times with an argument of the page name.
-    # unittest's test loader is unable to take arguments to test classes by default so have
-    # to use the getTestCaseNames() syntax and explicitly add the argument ourselves.
-    for page in pages:
-        suite.addTests(
-            [
-                test_class(test, IGNORED_ITEMS, (page, pages, wiki_dir, highest_issue_num))
-                for test in loader.getTestCaseNames(test_class)
-            ]
+def run_tests_on_pages(
+    reports_path,
+    pages,
+    wiki_dir,
+    test_class,
+    test_names=None,
+    ignored_items=IGNORED_ITEMS,
+    stream=sys.stdout,
+    tested_pages=None,
+    test_kwargs=None,
+):
+    # Run each test method once per page, passing the page name to the test class. unittest's test loader is unable
+    # to take arguments to test classes by default so have to use the getTestCaseNames() syntax and explicitly add
+    # the argument ourselves. Each test is only created just before it runs, so they are never all held at once.
+    # test_kwargs are passed to every test, e.g. the results a test class fetched for all of the pages ahead of time.
+    # When sharding, only some of the pages are tested but links to any page of the wiki can still be followed.
+    if test_names is None:
+        test_names = unittest.TestLoader().getTestCaseNames(test_class)
+    if tested_pages is None:
+        tested_pages = pages
+
+    def checks():
+        for page in tested_pages:
+            # Every test of the page shares what is read and parsed from it
+            page = as_page(page)
+            for test in test_names:
+                yield test_class(
+                    test, ignored_items, (page, pages, wiki_dir), **(test_kwargs or {})
+                )
+            # Only the anchors of the page are kept once all of its tests have run
+            page.release()
+
+    suite_name = "{}.{}".format(test_class.__module__, test_class.__qualname__)
+    return run_checks(checks(), str(reports_path), suite_name, stream)
+
+
+def check_spelling_ahead(
+    pages, spelling_pool, incremental_state, wiki_name=None, ignored_words=IGNORED_ITEMS["WORDS"]
+):
+    """
+    With a pool of processes, checks the spelling of the pages across it before their tests run.
+    """
+    if spelling_pool is None:
+        return
+    if incremental_state is not None:
+        pages = [
+            page for page in pages if not incremental_state.previous_result(page, SPELLING_TEST)[0]
+        ]
+    print("Checking spelling of {} pages with {} processes".format(len(pages), spelling_pool.jobs))
+    with utils.global_vars.run_profile.phase("parallel spelling", wiki_name):
+        spelling_pool.check(pages, ignored_words)
+
+
+def check_wiki(config, reports_path, incremental_state, spelling_pool, shard=None):
+    """
+    Runs the configured checks on a wiki which has already been cloned and indexed.
+
+    Args:
+        config: The wiki and the checks to run on it
+        reports_path: The folder to write the reports to
+        incremental_state: State of the previous run, or None to check every page
+        spelling_pool: The processes shared by every wiki to check spelling with, or None to check it in the tests
+        shard: The shard of the pages to check, or None to check every page
+
+    Returns:
+        Whether each set of tests run on the wiki passed
+    """
+    wiki = config.wiki
+    pages = wiki.get_pages()
+    wiki_dir = wiki.get_path()
+    tested_pages = (
+        pages
+        if shard is None
+        else [page for page in pages if shard.includes(page_key(wiki.name, wiki_dir, page))]
+    )
+    run_profile = utils.global_vars.run_profile
+    return_values = []
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as output:
+        if incremental_state is not None:
+            incremental_state.plan(wiki.name, wiki_dir, pages, config.ignored_items)
+        test_names = [PAGE_TESTS_FOR_CHECKS[c] for c in config.checks if c in PAGE_TESTS_FOR_CHECKS]
+        if test_names:
+            if SPELLING_CHECK in config.checks:
+                check_spelling_ahead(
+                    tested_pages,
+                    spelling_pool,
+                    incremental_state,
+                    wiki.name,
+                    config.ignored_items["WORDS"],
+                )
+            output.write("Running spelling tests on {}\n".format(wiki.name))
+            with run_profile.phase("page tests", wiki.name):
+                return_values.append(
+                    run_tests_on_pages(
+                        os.path.join(reports_path, wiki.name),
+                        pages,
+                        wiki_dir,
+                        PageTests,
+                        test_names,
+                        config.ignored_items,
+                        output,
+                        tested_pages,
+                    )
+                )
+            output.write("\n")
+        if incremental_state is not None:
+            incremental_state.finish(wiki.name)
+        if SHADOW_CHECK in config.checks:
+            output.write("Running shadow replication tests on {}\n".format(wiki.name))
+            with run_profile.phase("shadow replication tests", wiki.name):
+                # Shadow is slow to respond, so every page is requested concurrently before the tests report
+                prefetched_results = prefetch_shadow_pages(tested_pages)
+                return_values.append(
+                    run_tests_on_pages(
+                        os.path.join(reports_path, wiki.name),
+                        pages,
+                        wiki_dir,
+                        ShadowReplicationTests,
+                        stream=output,
+                        tested_pages=tested_pages,
+                        test_kwargs={"prefetched_results": prefetched_results},
+                    )
+                )
+            output.write("\n")
+        output.seek(0)
+        with _output_lock:
+            shutil.copyfileobj(output, sys.stdout)
+            sys.stdout.flush()
+    return return_values
+
+
+def print_unused_ignored_urls(wiki_configs):
+    """
+    Lists the ignored URLs which no link of any wiki needed, so they can be removed from the ignore lists.
+    """
+    matchers = [
+        get_url_matcher(config.ignored_items["URLS"])
+        for config in wiki_configs
+        if LINKS_CHECK in config.checks
+    ]
+    unused = unused_entries(matchers)
+    if unused:
+        print(
+            "The following ignored URLs did not match any link and could be removed:\n    {}\n".format(
+                "\n    ".join(unused)
+            )
         )
 
-    runner = XMLTestRunner(output=str(reports_path), stream=sys.stdout)
-    return runner.run(suite).wasSuccessful()
+
+def check_scheduled_links(link_scheduler, link_engine, reports_path):
+    """
+    Checks the external links queued by the page tests, if they were queued to meet a deadline.
+    """
+    if link_scheduler is None:
+        return
+    with utils.global_vars.run_profile.phase("link checks"):
+        link_scheduler.run(link_engine)
+    link_scheduler.write_skipped(os.path.join(reports_path, SKIPPED_LINKS_FILE))
+    print(link_scheduler.summary())
+
+
+def print_shard(shard, page_keys):
+    if shard is None:
+        return
+    keys = list(page_keys.values())
+    print(
+        "Shard {} of {}: checking {} of {} pages, expected to take {:.0f}s\n".format(
+            shard.index + 1,
+            shard.count,
+            sum(1 for key in keys if shard.includes(key)),
+            len(keys),
+            shard.expected_seconds(keys),
+        )
+    )
 
 
-def run_all_tests(single_file, remote, folder):
+def run_all_tests(
+    single_file,
+    remote,
+    folder,
+    link_cache=None,
+    link_engine=None,
+    incremental_state=None,
+    jobs=1,
+    run_profile=None,
+    issue_index=None,
+    wiki_configs=None,
+    spelling_cache=None,
+    shard=None,
+    link_scheduler=None,
+):
     """
     Runs all of the tests
 
+    Args:
+        link_cache: Persistent cache of link check outcomes, or None to check every link over the network
+        link_engine: HTTP engine used to check links, a default one is created if None
+        incremental_state: State of the previous remote run, if given the wiki clones are kept and only pages
+            affected by changes since then are checked again
+        jobs: The number of processes to check spelling with
+        run_profile: Profile to record where the time in the run goes in, a new one is created if None
+        issue_index: Index of the issues that links to GitHub issues are checked against, an in memory one is
+            created if None
+        wiki_configs: The wikis to check in remote mode and how to check them, read from the default config file
+            if None
+        spelling_cache: Persistent cache of the spelling of each paragraph, or None to check the spelling of whole
+            pages
+        shard: The shard of the pages to check in remote or folder mode, or None to check every page
+        link_scheduler: Scheduler to check external links with after the page tests in remote or folder mode, in
+            order of priority until a deadline, or None to check them as each page is tested
+
     Returns
         True if all tests pass, else False
     """
-    reports_path = os.path.join(os.getcwd(), "test-reports")
+    reports_path = os.path.join(os.getcwd(), REPORTS_FOLDER)
     if not os.path.exists(reports_path):
         try:
             os.mkdir(reports_path)
@@ -52,89 +287,136 @@ def run_all_tests(single_file, remote, folder):
             return [False]
 
     return_values = []
+    # The key identifying each page on any build agent, for sharding and the page timings
+    page_keys = {}
 
-    #  initialise globals, currently just string of warnings
-    utils.global_vars.init()
+    #  initialise globals, the collected link failures and the caches shared by every page
+    if run_profile is None:
+        run_profile = RunProfile()
+    if link_engine is None:
+        link_engine = LinkCheckEngine(profile=run_profile)
+    link_failures = LinkFailures(os.path.join(reports_path, "link_failures.jsonl"))
+    if issue_index is None:
+        issue_index = IssueIndex(path=None)
+    # One pool for the whole run, so that checking several wikis at once doesn't start more processes than asked for
+    spelling_pool = SpellingPool(jobs, spelling_cache) if jobs > 1 else None
+    utils.global_vars.init(
+        link_cache,
+        link_engine,
+        incremental_state,
+        link_failures,
+        run_profile,
+        issue_index,
+        spelling_cache,
+        link_scheduler,
+    )
 
-    top_issue_num = int(json.loads(requests.get(GITHUB_API_ISSUE_CALL).content)[0]["number"])
     if remote:
-        for wiki in [IBEX_MANUAL, USER_MANUAL]:
-            try:
-                with wiki:
-                    pages = wiki.get_pages()
-                    wiki_dir = wiki.get_path()
-                    print("Running spelling tests on {}".format(wiki.name))
-                    return_values.append(
-                        run_tests_on_pages(
-                            os.path.join(reports_path, wiki.name),
-                            pages,
-                            wiki_dir,
-                            top_issue_num,
-                            test_class=PageTests,
-                        )
-                    )
-                    print()
-            except git.GitCommandError as ex:
+        if wiki_configs is None:
+            wiki_configs = load_wiki_config()
+        wikis = [config.wiki for config in wiki_configs]
+        for wiki in wikis:
+            wiki.keep_clone = incremental_state is not None
+        # Every wiki is cloned once, up front, and kept until all test classes that need it have run
+        with acquire_wikis(wikis, run_profile) as clone_failures:
+            for wiki, ex in clone_failures.items():
                 print("FAILED to clone {}: {}".format(wiki.name, str(ex)))
                 print("Skipping tests\n")
                 return_values.append(0)
-                continue
-        print(utils.global_vars.failed_url_string)
-        for wiki in [USER_MANUAL]:
-            try:
-                with wiki:
-                    pages = wiki.get_pages()
-                    wiki_dir = wiki.get_path()
-                    # Only do shadow replication tests in "remote" mode.
-                    print("Running shadow replication tests on {}".format(wiki.name))
-                    return_values.append(
-                        run_tests_on_pages(
-                            os.path.join(reports_path, wiki.name),
-                            pages,
-                            wiki_dir,
-                            top_issue_num,
-                            test_class=ShadowReplicationTests,
+            # Index every wiki before any page is checked, so links between the wikis can be followed
+            with run_profile.phase("indexing"):
+                for wiki in wikis:
+                    if wiki not in clone_failures:
+                        get_wiki_index(wiki.get_path(), wiki.get_pages(), walk_files=True)
+                        page_keys.update(
+                            (page, page_key(wiki.name, wiki.get_path(), page))
+                            for page in wiki.get_pages()
                         )
+            print_shard(shard, page_keys)
+            # The wikis are checked at the same time, sharing the link engine, caches and spelling dictionary, so
+            # the run takes about as long as the longest wiki rather than all of them added together
+            configs_to_check = [
+                config for config in wiki_configs if config.wiki not in clone_failures
+            ]
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(len(configs_to_check), 1)
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        check_wiki, config, reports_path, incremental_state, spelling_pool, shard
                     )
-                    print()
-            except git.GitCommandError as ex:
-                print("FAILED to clone {}: {}".format(wiki.name, str(ex)))
-                print("Skipping tests\n")
-                return_values.append(0)
-                continue
+                    for config in configs_to_check
+                ]
+                for future in futures:
+                    return_values.extend(future.result())
+            check_scheduled_links(link_scheduler, link_engine, reports_path)
+            print(link_failures.render())
+            # Only a full run of every wiki sees every link, pages reused from the last run are not checked again
+            if incremental_state is None and shard is None and not clone_failures:
+                print_unused_ignored_urls(wiki_configs)
     elif single_file:
-        return_values.append(
-            run_tests_on_pages(
-                os.path.join(reports_path, os.path.basename(single_file)),
-                [single_file],
-                os.path.dirname(single_file),
-                top_issue_num,
-                test_class=PageTests,
+        with run_profile.phase("page tests"):
+            return_values.append(
+                run_tests_on_pages(
+                    os.path.join(reports_path, os.path.basename(single_file)),
+                    [Page(single_file)],
+                    os.path.dirname(single_file),
+                    test_class=PageTests,
+                )
             )
-        )
     elif folder:
         print("Running spelling tests on folder {}".format(folder))
         files = os.listdir(folder)
         files_to_test = []
         for f in files:
             if f.endswith(".md"):
-                files_to_test.append(os.path.join(folder, f))
+                files_to_test.append(Page(os.path.join(folder, f)))
+        page_keys.update((page, page_key(None, "", page)) for page in files_to_test)
+        print_shard(shard, page_keys)
+        tested_pages = (
+            files_to_test
+            if shard is None
+            else [page for page in files_to_test if shard.includes(page_keys[page])]
+        )
+        check_spelling_ahead(tested_pages, spelling_pool, incremental_state)
         # The path is listed as an empty string as this hybrid set up ignores it
-        return_values.append(
-            run_tests_on_pages(
-                os.path.join(reports_path, os.path.basename(folder)),
-                files_to_test,
-                "",
-                top_issue_num,
-                test_class=PageTests,
+        with run_profile.phase("page tests"):
+            return_values.append(
+                run_tests_on_pages(
+                    os.path.join(reports_path, os.path.basename(folder)),
+                    files_to_test,
+                    "",
+                    test_class=PageTests,
+                    tested_pages=tested_pages,
+                )
             )
-        )
-        print(utils.global_vars.failed_url_string)
+        check_scheduled_links(link_scheduler, link_engine, reports_path)
+        print(link_failures.render())
+
+    if spelling_pool is not None:
+        spelling_pool.close()
+    link_engine.close()
+    link_failures.close()
+    if link_cache is not None:
+        link_cache.save()
+    if incremental_state is not None:
+        incremental_state.save()
+    issue_index.save()
+    if spelling_cache is not None:
+        spelling_cache.save()
+    run_profile.save(os.path.join(reports_path, "run_profile.json"))
+    save_page_timings(
+        os.path.join(reports_path, PAGE_TIMINGS_FILE), run_profile.page_seconds(), page_keys
+    )
+    print(run_profile.summary())
 
     return all(value for value in return_values)
 
 
 def main():
+    # Created first so that the time to the first result includes everything done to start up
+    run_profile = RunProfile()
+    started = time.monotonic()
     locale.setlocale(locale.LC_ALL, "en_GB.UTF-8")
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -151,6 +433,184 @@ def main():
     parser.add_argument(
         "--folder", required=False, type=str, default=None, help="Scan just a local folder"
     )
+    parser.add_argument(
+        "--config",
+        required=False,
+        type=str,
+        default=DEFAULT_WIKI_CONFIG_PATH,
+        help="With --remote, file listing the wikis to check and how to check them",
+    )
+    parser.add_argument(
+        "--link-cache",
+        required=False,
+        type=str,
+        default=DEFAULT_LINK_CACHE_PATH,
+        help="File to keep link check results in between runs",
+    )
+    parser.add_argument(
+        "--no-link-cache",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Check every link over the network, ignoring and not updating the link cache",
+    )
+    parser.add_argument(
+        "--spelling-cache",
+        required=False,
+        type=str,
+        default=DEFAULT_SPELLING_CACHE_PATH,
+        help="File to keep the words the dictionary doesn't know in each paragraph in between runs",
+    )
+    parser.add_argument(
+        "--no-spelling-cache",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Check the spelling of every paragraph, ignoring and not updating the spelling cache",
+    )
+    parser.add_argument(
+        "--link-cache-ttl",
+        required=False,
+        type=float,
+        default=DEFAULT_SUCCESS_TTL_HOURS,
+        help="Hours before a working link is checked again",
+    )
+    parser.add_argument(
+        "--link-cache-failure-ttl",
+        required=False,
+        type=float,
+        default=DEFAULT_FAILURE_TTL_HOURS,
+        help="Hours before a failing link is checked again",
+    )
+    parser.add_argument(
+        "--max-connections",
+        required=False,
+        type=int,
+        default=DEFAULT_MAX_CONNECTIONS,
+        help="Maximum number of link checks in flight at once",
+    )
+    parser.add_argument(
+        "--max-connections-per-host",
+        required=False,
+        type=int,
+        default=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+        help="Maximum number of link checks in flight at once to any one host",
+    )
+    parser.add_argument(
+        "--retries",
+        required=False,
+        type=int,
+        default=DEFAULT_RETRIES,
+        help="Number of times to retry a link check which timed out, could not connect or was rate limited",
+    )
+    parser.add_argument(
+        "--host-failure-threshold",
+        required=False,
+        type=int,
+        default=DEFAULT_FAILURE_THRESHOLD,
+        help="Number of failed requests in a row to a host after which its remaining links fail without being tried",
+    )
+    parser.add_argument(
+        "--incremental",
+        required=False,
+        action="store_true",
+        default=False,
+        help="With --remote, keep the wiki clones and only check pages affected by changes since the last run",
+    )
+    parser.add_argument(
+        "--incremental-state",
+        required=False,
+        type=str,
+        default=DEFAULT_INCREMENTAL_STATE_PATH,
+        help="File to keep the last checked commits and page results in for --incremental",
+    )
+    parser.add_argument(
+        "--jobs",
+        required=False,
+        type=int,
+        default=1,
+        help="Number of processes to check spelling with",
+    )
+    parser.add_argument(
+        "--deadline",
+        required=False,
+        type=float,
+        default=None,
+        help="Minutes after starting by which external links must have been checked, the most valuable checks are "
+        "made first and the rest are left for the next run",
+    )
+    parser.add_argument(
+        "--shard",
+        required=False,
+        type=str,
+        default=None,
+        help="Only check the I'th of N shares of the pages, given as I/N, for splitting a run across build agents",
+    )
+    parser.add_argument(
+        "--shard-timings",
+        required=False,
+        type=str,
+        default=os.path.join(os.getcwd(), REPORTS_FOLDER, PAGE_TIMINGS_FILE),
+        help="Page timings from an earlier run to balance the shards with, the same file must be given to every shard, "
+        "by default the ones merged into the reports folder",
+    )
+    parser.add_argument(
+        "--issue-index",
+        required=False,
+        type=str,
+        default=DEFAULT_ISSUE_INDEX_PATH,
+        help="File to keep the issue numbers of each GitHub repository in between runs",
+    )
+    parser.add_argument(
+        "--issue-index-ttl",
+        required=False,
+        type=float,
+        default=DEFAULT_REFRESH_HOURS,
+        help="Hours before GitHub is asked for new issues in a repository again",
+    )
+    parser.add_argument(
+        "--offline-issues",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Check links to GitHub issues against the issue index only, without asking GitHub",
+    )
+    parser.add_argument(
+        "--offline",
+        required=False,
+        action="store_true",
+        default=False,
+        help="With --file or --folder, don't use the network: links are only checked against the link cache and "
+        "issue index",
+    )
+    parser.add_argument(
+        "--watch",
+        required=False,
+        action="store_true",
+        default=False,
+        help="With --file or --folder, keep running and check pages again whenever they change",
+    )
+    parser.add_argument(
+        "--watch-json",
+        required=False,
+        type=str,
+        default=None,
+        help="With --watch, file to write the latest results of every page to",
+    )
+    parser.add_argument(
+        "--watch-port",
+        required=False,
+        type=int,
+        default=None,
+        help="With --watch, local port to send results to editors on as JSON lines",
+    )
+    parser.add_argument(
+        "--cprofile",
+        required=False,
+        type=str,
+        default=None,
+        help="Run under cProfile and write the statistics to this file",
+    )
     args = parser.parse_args()
     if not args.file and not args.remote and not args.folder:
         raise (RuntimeError("No arguments specified"))
@@ -158,8 +618,89 @@ def main():
         (args.file and args.remote) or (args.file and args.folder) or (args.remote and args.folder)
     ):
         raise (RuntimeError("Cannot specify more than one target for the tests"))
+    elif args.incremental and not args.remote:
+        raise (RuntimeError("--incremental can only be used with --remote"))
+    elif args.watch and args.remote:
+        raise (RuntimeError("--watch can only be used with --file or --folder"))
+    elif args.shard and not (args.remote or args.folder):
+        raise (RuntimeError("--shard can only be used with --remote or --folder"))
+    elif args.shard and (args.incremental or args.watch):
+        raise (RuntimeError("--shard can't be used with --incremental or --watch"))
+    elif args.deadline is not None and (args.watch or not (args.remote or args.folder)):
+        raise (RuntimeError("--deadline can only be used with --remote or --folder"))
+    elif args.offline and args.remote:
+        # --remote clones the wikis and checks them against their shadow, which both need the network
+        raise (RuntimeError("--offline can only be used with --file or --folder"))
+
+    link_scheduler = None
+    if args.deadline is not None:
+        link_scheduler = LinkScheduler(started + args.deadline * 60)
+
+    shard = None
+    if args.shard:
+        index, count = parse_shard(args.shard)
+        shard = Shard(index, count, load_page_timings(args.shard_timings))
+
+    link_cache = None
+    if not args.no_link_cache:
+        link_cache = LinkCache(args.link_cache, args.link_cache_ttl, args.link_cache_failure_ttl)
+    spelling_cache = None if args.no_spelling_cache else SpellingCache(args.spelling_cache)
+
+    link_engine = LinkCheckEngine(
+        args.max_connections,
+        args.max_connections_per_host,
+        profile=run_profile,
+        retries=args.retries,
+        host_health=HostHealth(args.host_failure_threshold),
+        offline=args.offline,
+    )
+    incremental_state = IncrementalState(args.incremental_state) if args.incremental else None
+    wiki_configs = load_wiki_config(args.config) if args.remote else None
+    issue_index = IssueIndex(
+        args.issue_index, args.issue_index_ttl, offline=args.offline_issues or args.offline
+    )
+
+    if args.watch:
+        run_profile.record_details = False
+        utils.global_vars.init(
+            link_cache, link_engine, None, None, run_profile, issue_index, spelling_cache
+        )
+        try:
+            watch(WatchSession(args.folder, args.file), args.watch_json, args.watch_port)
+        finally:
+            link_engine.close()
+            if link_cache is not None:
+                link_cache.save()
+            issue_index.save()
+            if spelling_cache is not None:
+                spelling_cache.save()
+        sys.exit(0)
+
+    def run():
+        return run_all_tests(
+            args.file,
+            args.remote,
+            args.folder,
+            link_cache,
+            link_engine,
+            incremental_state,
+            args.jobs,
+            run_profile,
+            issue_index,
+            wiki_configs,
+            spelling_cache,
+            shard,
+            link_scheduler,
+        )
+
+    if args.cprofile:
+        profiler = cProfile.Profile()
+        success = profiler.runcall(run)
+        profiler.dump_stats(args.cprofile)
+    else:
+        success = run()
 
-    sys.exit(0 if run_all_tests(args.file, args.remote, args.folder) else 1)
+    sys.exit(0 if success else 1)
 
 
 if __name__ == "__main__":
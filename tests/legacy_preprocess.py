@@ -0,0 +1,44 @@
+"""
+Reference copy of the original multi-pass spelling preprocessor.
+
+The single pass preprocessor in utils.spelling_preprocessor must give exactly the same output as this for any input,
+which the self tests and the preprocessor benchmark check.
+"""
+
+import re
+
+
+def legacy_strip_between_tags(expression, text, current_page):
+    if text is None:
+        return text
+    matches = list(re.finditer(expression, text))
+    if len(matches) == 0:
+        new_text = text
+    elif len(matches) % 2 != 0:
+        raise ValueError(
+            "Uneven number of {} detected in file {}.".format(expression, current_page)
+        )
+    else:
+        new_text = text[0 : matches[0].start()]
+        for i in range(1, len(matches) - 1, 2):
+            new_text += text[matches[i].end() : matches[i + 1].start()]
+        new_text += text[matches[-1].end() : len(text)]
+    return new_text
+
+
+def legacy_strip_inline_code_blocks(text):
+    expression = r"(?:(?<!\\)((?:\\{2})+)(?=`+)|(?<!\\)(`+)(.+?)(?<!`)\2(?!`))"
+    return re.sub(expression, "", text)
+
+
+def legacy_preprocess_for_spelling(text, page):
+    text = legacy_strip_between_tags(r"<code>|</code>", text, page)
+    text = legacy_strip_between_tags(r"<pre>|</pre>", text, page)
+    text = legacy_strip_between_tags(r"```", text, page)
+    text = re.sub(r"\[(.+?)\]\([\S]+\)", r"\1", text)
+    text = legacy_strip_inline_code_blocks(text)
+    for character in ["[", "]", "(", ")"]:
+        text = text.replace(character, " ")
+    text = text.replace("*", "")
+    text = re.sub(r"(<img )([a-zA-Z=\"0-9\/\-\s\.:]+)(>)", "", text)
+    return text
@@ -1,45 +1,36 @@
-import codecs
 import concurrent.futures
 import os
-import re
 import time
 import unittest
-
-import requests
-from enchant.checker import SpellChecker
-from enchant.tokenize import EmailFilter, MentionFilter, URLFilter, WikiWordFilter
+from urllib.parse import unquote
 
 import utils.global_vars
+from utils.host_health import HostUnavailableError
+from utils.incremental import reuse_previous_internal_result, reuse_previous_result
+from utils.issue_index import find_issue_link
+from utils.link_cache import LinkCache
+from utils.page import as_page
+from utils.parallel_spelling import check_page_spelling
+from utils.url_matcher import get_url_matcher
+from utils.wiki_index import find_wiki_index, get_wiki_index, indexed_wiki_names
 from wiki import Wiki
 
-IBEX_ISSUES = "IBEX/issues/"
-
 IBEX_MANUAL = Wiki("IBEX")
 USER_MANUAL = Wiki("ibex_user_manual")
 TEST_WIKI = Wiki("ibex_wiki_checker")
 WIKI_INCLUDELIST = [USER_MANUAL, IBEX_MANUAL, TEST_WIKI]
 
 
-def strip_between_tags(expression, text, current_page):
-    if text is None:
-        return text
-    matches = list(re.finditer(expression, text))
-    if len(matches) == 0:
-        new_text = text
-    elif len(matches) % 2 != 0:
-        raise ValueError(
-            "Uneven number of {} detected in file {}.".format(expression, current_page)
-        )
-    else:
-        new_text = text[0 : matches[0].start()]
-        for i in range(1, len(matches) - 1, 2):
-            new_text += text[matches[i].end() : matches[i + 1].start()]
-        new_text += text[matches[-1].end() : len(text)]
-    return new_text
+def wiki_names():
+    """
+    Returns:
+        The names of the wikis which links are followed into, both the known ones and any others checked this run
+    """
+    return {wiki.name for wiki in WIKI_INCLUDELIST} | indexed_wiki_names()
 
 
 class PageTests(unittest.TestCase):
-    def __init__(self, methodName, ignored_items, wiki_info: tuple[str, list[str], str, int]):  # noqa: N803
+    def __init__(self, methodName, ignored_items, wiki_info: tuple[str, list[str], str]):  # noqa: N803
         """
 
         :param methodName: Name of the test you want to run
@@ -49,147 +40,139 @@ class PageTests(unittest.TestCase):
         """
         # Boilerplate so that unittest knows how to run these tests.
         super(PageTests, self).__init__(methodName)
-        self.page, self.all_pages, self.wiki_dir, self.top_issue_num = wiki_info
+        page, self.all_pages, self.wiki_dir = wiki_info
+        self.page = as_page(page) if page is not None else None
         self.ignored_words = ignored_items["WORDS"]
-        self.ignored_urls = ignored_items["URLS"]
+        self.ignored_urls = get_url_matcher(ignored_items["URLS"])
         self.isSinglePageTest = [os.path.join(self.wiki_dir, self.page)] == self.all_pages
+        # Set while only the external links of a page are checked, the rest of its result being reused
+        self.reusing_previous_result = False
 
     def setUp(self):
         # Class has to have an __init__ that accepts one argument for unittest's test loader to work properly.
         # However it should never be the default (None) when actually running the tests.
         self.assertIsNotNone(self.page, "Cannot test if no page provided")
-        self.assertTrue(os.path.exists(self.page))
+        self.assertTrue(self.page.exists)
+        self.started = time.perf_counter()
+
+    def tearDown(self):
+        utils.global_vars.run_profile.record_page(
+            self.page, self._testMethodName, time.perf_counter() - self.started
+        )
 
+    @reuse_previous_result
     def test_GIVEN_a_page_THEN_its_spelling_conforms_to_UK_English(self):
         def filter_upper_case(words):
             return set(w for w in words if w.upper() != w)
 
-        def replace_selected_specials_with_whitespace(text):
-            # This gets around certain issues recognising Github links as URLs
-            altered_text = text
-            for character in ["[", "]", "(", ")"]:
-                altered_text = altered_text.replace(character, " ")
-            return altered_text
-
-        def strip_pre_tag_blocks(text):
-            return strip_between_tags(r"<pre>|</pre>", text, self.page)
-
-        def strip_code_tag_blocks(text):
-            return strip_between_tags(r"<code>|</code>", text, self.page)
-
-        def strip_triple_dash_code_blocks(text):
-            return strip_between_tags(r"```", text, self.page)
-
-        def strip_urls_from_links(text):
-            # replace "[text](link)" with "text"
-            expression = r"\[(.+?)\]\([\S]+\)"
-            return re.sub(expression, r"\1", text)
-
-        def strip_inline_code_blocks(text):
-            expression = r"(?:(?<!\\)((?:\\{2})+)(?=`+)|(?<!\\)(`+)(.+?)(?<!`)\2(?!`))"
-            return re.sub(expression, "", text)
-
-        def strip_img_html_tags(text):
-            expression = r"(<img )([a-zA-Z=\"0-9\/\-\s\.:]+)(>)"
-            return re.sub(expression, "", text)
-
-        def remove_bold_and_italics(text):
-            return text.replace("*", "")
+        # The spelling may already have been checked by a pool of processes
+        misspelled_words = utils.global_vars.spelling_results.pop(self.page, None)
+        if misspelled_words is None:
+            misspelled_words = check_page_spelling(
+                self.page, self.ignored_words, utils.global_vars.spelling_cache
+            )
+        elif isinstance(misspelled_words, Exception):
+            raise misspelled_words
 
-        with open(self.page, "r", encoding="utf-8") as wiki_file:
-            text = strip_code_tag_blocks(wiki_file.read())
-            text = strip_pre_tag_blocks(text)
-            text = strip_triple_dash_code_blocks(text)
-            text = strip_urls_from_links(text)
-            text = strip_inline_code_blocks(text)
-            text = replace_selected_specials_with_whitespace(text)
-            text = remove_bold_and_italics(text)
-            text = strip_img_html_tags(text)
+        failed_words = filter_upper_case(misspelled_words)
 
-        filters = [URLFilter, EmailFilter, MentionFilter, WikiWordFilter]
-        checker = SpellChecker("en_GB", filters=filters, text=text)
-
-        failed_words = filter_upper_case(
-            {err.word for err in checker if err.word.lower() not in self.ignored_words}
-        )
+        def with_line(word):
+            line = self.page.line_of(word)
+            return word if line is None else "{} (line {})".format(word, line)
 
         if len(failed_words) > 0:
             self.fail(
                 "The following words were spelled incorrectly in file {}: \n    {}".format(
-                    self.page, "\n    ".join(failed_words)
+                    self.page, "\n    ".join(with_line(word) for word in failed_words)
                 )
             )
 
+    @reuse_previous_internal_result
     def test_GIVEN_a_page_IF_it_contains_urls_WHEN_url_loaded_THEN_response_is_http_ok(self):
-        def get_urls_from_text(text):
-            if os.path.splitext(self.page)[1] == ".md":
-                # Find markdown URLS of the form [Link text](link location) with no whitespace in the curved brackets.
-                # Return all characters within brackets.
-                urls = re.findall(r"\[.+?\]\(([\S^#]+)\)", text)
-                # As above, except this time check whether the whole block is within brackets or not. The text must
-                # start with "(", not have a ")" before the link, then end with a ")" immediately after the trailing
-                # ")" of the link. This stops text like "(for more detail, see [link](url))" from returning "url)"
-                # while allowing "look at this link [wikipedia is full of](urls_(like_these))" to return "urls_(
-                # like_these)"
-                bracketed_urls = re.findall(r"\([^)]*?\[.+?\]\(([\S^#]+)\)\)", text)
-                # The second set of urls takes precedence over the first, if the url appears WITHOUT a trailing ")" in
-                # the bracket url list, use the entry from the bracketed list instead
-                urls = [url for url in urls if url[:-1] not in bracketed_urls] + bracketed_urls
-                return urls
-            elif os.path.splitext(self.page)[1] == ".rest":
-                # Links to pages are of the form "[[page name]]", but pages are stored as "page-name"
-                # Some links are "[[text|link]]", so need to omit everything before a "|"
-                page_links = re.findall(r"\[\[.*?([^]|]+)\]\]", text)
-                urls = [link.strip().replace(" ", "-") for link in page_links]
-                # Image links point to the file given by ":target: filename.png"
-                image_links = re.findall(r":target: (\S+)", text)
-                urls.extend(image_links)
-                # website urls are of the form "`text text text <url>`_" with a required space before the "<"
-                web_links = re.findall(r"`[^`<]+ <(\S+)>`_", text)
-                urls.extend(web_links)
-                return urls
+        def is_ignored(url):
+            return self.ignored_urls.matches(url)
 
-        def short_check_skip_conditions(url, filenames):
+        def short_check_skip_conditions(url, index):
             skip_conditions = [
                 # Don't try to check empty strings
                 lambda url: url == "",
                 # Don't try to open ftp links
                 lambda url: url.startswith("ftp"),
                 # Some urls just won't work with this link checker, ignore them
-                lambda url: any(allowed_url in url for allowed_url in self.ignored_urls),
+                lambda url: is_ignored(url),
                 # Links to another page on the wiki
-                lambda url: url.lower() in filenames,
+                lambda url: index.has_page(url),
             ]
             return any(condition(url) for condition in skip_conditions)
 
-        def check_skip_conditions(url, filenames, folders):
+        def check_skip_conditions(url, index):
             # Extra condition checks if it links to a file location on the wiki
-            return short_check_skip_conditions(url, filenames) or url.split("/")[0] in folders
+            return short_check_skip_conditions(url, index) or index.has_entry(url.split("/")[0])
 
-        def try_to_connect(url, session):
-            nonlocal wiki_name, page_name
+        def request_url(url, engine, headers):
+            # requests is only imported once a link has to be requested, as it is slow to import
+            import requests
+
+            response = None
             try:
-                response = session.head(url, timeout=5)
+                response = engine.probe(url, headers=headers)
                 if not response:
                     return "Could not open URL, got response code {} for {}\n".format(
                         response.status_code, get_url_basename(url)
-                    ), url
+                    ), response
             except (requests.exceptions.MissingSchema, requests.exceptions.InvalidURL):
-                return "Invalid link: {}\n".format(get_url_basename(url)), url
+                return "Invalid link: {}\n".format(get_url_basename(url)), response
             except requests.exceptions.SSLError:
-                return "Invalid SSL certificate for: {}\n".format(get_url_basename(url)), url
+                return "Invalid SSL certificate for: {}\n".format(get_url_basename(url)), response
             except requests.exceptions.ConnectionError:
-                return "Disconnected without response by {}\n".format(get_url_basename(url)), url
+                return "Disconnected without response by {}\n".format(
+                    get_url_basename(url)
+                ), response
             except requests.exceptions.Timeout:
-                return "Connection Timeout by {}\n".format(get_url_basename(url)), url
-
-        def check_if_link_to_wiki_page(url, filenames, folders):
+                return "Connection Timeout by {}\n".format(get_url_basename(url)), response
+            except requests.exceptions.RequestException as e:
+                # e.g. a link to a scheme that can't be requested, or a server that redirects in a loop
+                return "Invalid link: {} ({})\n".format(
+                    get_url_basename(url), e.__class__.__name__
+                ), response
+            return None, response
+
+        def try_to_connect(url, engine):
+            link_cache = utils.global_vars.link_cache
+            cached = link_cache.get(url) if link_cache is not None else None
+            if cached is not None and (link_cache.is_fresh(cached) or engine.offline):
+                error = cached.failure
+            elif engine.offline:
+                # The link can't be checked without the network, so nothing is reported for it
+                return
+            else:
+                # Ask the server to only send a full response if the link has changed since it was cached
+                try:
+                    error, response = request_url(
+                        url, engine, LinkCache.conditional_headers(cached)
+                    )
+                except HostUnavailableError as e:
+                    # The link itself was never checked, so nothing is cached for it
+                    return "{}\n".format(e), url
+                if link_cache is not None:
+                    link_cache.store(url, error, response)
+            if error:
+                return error, url
+
+        def check_if_link_to_wiki_page(url, index):
             # If link is to a file in the wiki and shouldn't be otherwise skipped, check that the file actually exists
-            if url.split("/")[0] in folders and not short_check_skip_conditions(url, filenames):
-                if not os.path.isfile(os.path.join(self.wiki_dir, url)):
+            if index.has_entry(url.split("/")[0]) and not short_check_skip_conditions(url, index):
+                if not index.has_file(url):
                     return True
             return False
 
+        def check_anchor(link, fragment, linked_page, index):
+            # Links to a section of a page have to match one of its headings
+            if fragment and not index.has_anchor(linked_page, fragment):
+                return "Could not find section #{} in page link {}#{}".format(
+                    fragment, link, fragment
+                )
+
         def create_failure_message(failed_urls):
             nonlocal wiki_name, page_name
             if failed_urls and not self.isSinglePageTest:
@@ -212,38 +195,8 @@ class PageTests(unittest.TestCase):
                 url = "http://{}".format(url)
             return url
 
-        def write_to_file(fail_text):
-            """
-
-            :param fail_text: error message received when trying to connect
-            :return:
-            """
-            nonlocal message_lock
-            error, url = fail_text
-            while message_lock:
-                time.sleep(1)
-            message_lock = True
-            message_contents = utils.global_vars.failed_url_string.splitlines(True)
-
-            msg_index = [
-                i for i in range(len(message_contents)) if message_contents[i] == error
-            ]  # index of error
-
-            if msg_index:
-                # Write page location at the top of the list if error is already present in the file
-                message_contents.insert(
-                    msg_index[0] + 2, "  {}/{}: {}\n".format(wiki_name, page_name, url)
-                )
-            else:
-                # Make a new entry at the end of the file if error has not been seen before
-                message_contents.append(
-                    "{}On the following pages:\n  {}/{}: {}\n".format(
-                        error, wiki_name, page_name, url
-                    )
-                )
-
-            utils.global_vars.failed_url_string = "".join(message_contents)
-            message_lock = False
+        def get_fragment(url):
+            return url.partition("#")[2].strip()
 
         def get_url_basename(url):
             """
@@ -256,56 +209,76 @@ class PageTests(unittest.TestCase):
             else:
                 return url
 
-        def check_link(link, session, filenames, folders):
-            if not check_skip_conditions(link, filenames, folders):
+        def check_link(link, engine, index):
+            fragment = get_fragment(link)
+            link = fix_formatting(link)
+            if not check_skip_conditions(link, index):
                 if get_url_basename(link) == "github.com":
-                    if IBEX_ISSUES in link:
-                        # The link is to an IBEX issue, so check if its number is less than the total number of issues
-                        issue_num = int(
-                            re.search(r"\d+", link)[0]
-                        )  # Get the issue number in the URL
-                        if not issue_num <= self.top_issue_num:
-                            return "Invalid IBEX issue number: {}".format(issue_num)
+                    issue = find_issue_link(link)
+                    if issue is not None:
+                        # The link is to an issue, so check it is one of the known issues of its repository
+                        issue_index = utils.global_vars.issue_index
+                        if issue_index is not None:
+                            return issue_index.check(*issue)
                         return
-                    if any([f"{wiki.name}/wiki" in link for wiki in WIKI_INCLUDELIST]):
-                        # Get the wiki page name and append .md to it to check if the file exists in the local wiki repo
-                        _page_file_name = f"{link.split('/')[-1]}.md"
-                        return check_if_link_to_wiki_page(_page_file_name, filenames, folders)
-                failure = try_to_connect(link, session)
+                    for linked_wiki_name in wiki_names():
+                        if f"{linked_wiki_name}/wiki" not in link:
+                            continue
+                        # Only links to wikis that have been indexed this run can be checked
+                        linked_index = find_wiki_index(linked_wiki_name)
+                        if linked_index is None:
+                            return
+                        linked_page = unquote(link.rstrip("/").split("/")[-1])
+                        if linked_page == "wiki":
+                            # The home page of the wiki
+                            return
+                        if not linked_index.has_page(linked_page):
+                            return "Could not follow page link {}".format(link)
+                        return check_anchor(link, fragment, linked_page, linked_index)
+                scheduler = utils.global_vars.link_scheduler
+                if scheduler is not None:
+                    # Only checked once every page has been tested, so the most valuable checks fit in the time
+                    # budget. Failures are reported in the summary rather than by this test in either case.
+                    scheduler.add(
+                        link, lambda url: try_to_connect(url, engine), wiki_name, page_name
+                    )
+                    return
+                # Every distinct URL is only requested once per run, other pages linking to it share the outcome
+                failure = utils.global_vars.link_registry.check(
+                    link, lambda url: try_to_connect(url, engine)
+                )
                 if failure:
-                    write_to_file(failure)
-            elif check_if_link_to_wiki_page(link, filenames, folders):
+                    error, url = failure
+                    utils.global_vars.link_failures.add(error, url, wiki_name, page_name)
+            elif check_if_link_to_wiki_page(link, index):
                 return "Could not follow page link {}".format(link)
+            elif not is_ignored(link):
+                if link == "":
+                    # A link to a section of this page
+                    return check_anchor(
+                        "", fragment, os.path.splitext(os.path.basename(self.page))[0], index
+                    )
+                if index.has_page(link):
+                    return check_anchor(link, fragment, link, index)
 
-        # Have to open as UTF-8. Opening as ascii causes some encoding errors.
+        # The page is read and its links found once, shared with the other tests of the page
         try:
-            with codecs.open(self.page, encoding="utf-8") as wiki_file:
-                text = wiki_file.read()
+            links = self.page.links
         except Exception as e:
             self.fail(
                 "FAILED TO OPEN {} because {} : {}".format(self.page, e.__class__.__name__, e)
             )
 
-        message_lock = False
         wiki_name = self.wiki_dir.split("\\")[-1]
         page_name = self.page.split("\\")[-1]
-        links = get_urls_from_text(text)
-        folders = os.listdir(self.wiki_dir) if self.wiki_dir else []
-        filenames = [os.path.splitext(os.path.basename(f))[0].lower() for f in self.all_pages]
-        with requests.Session() as sess:
-            # Some websites don't respond correctly with the default requests user agent, so the firefox user agent
-            # is being used instead
-            sess.headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:97.0) Gecko/20100101 Firefox/97.0"
-            }
-            failed_urls = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=None) as con_fut:
-                futures = [
-                    con_fut.submit(check_link, fix_formatting(link), sess, filenames, folders)
-                    for link in links
-                ]
-                for future in concurrent.futures.as_completed(futures):
-                    fail = future.result()
-                    if fail:
-                        failed_urls.append(fail)
+        index = get_wiki_index(self.wiki_dir, self.all_pages)
+        # The thread pool and keep-alive session are shared by every page in the run
+        engine = utils.global_vars.link_engine
+        failed_urls = []
+        futures = {engine.submit(check_link, link.target, engine, index): link for link in links}
+        for future in concurrent.futures.as_completed(futures):
+            fail = future.result()
+            if fail:
+                failed_urls.append("{} (line {})".format(fail, futures[future].line))
+        if not self.reusing_previous_result:
             create_failure_message(failed_urls)
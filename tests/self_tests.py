@@ -1,9 +1,53 @@
+import concurrent.futures
+import contextlib
 import functools
+import json
+import os
+import pickle
+import random
+import re
+import socket
+import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+from xml.etree import ElementTree
 
-from tests import shadow_mirroring_tests
-from tests.page_tests import strip_between_tags
+import git
+import requests
+
+import merge_shards
+import run_tests
+import utils.global_vars
+from tests import page_tests, shadow_mirroring_tests
+from tests.legacy_preprocess import legacy_preprocess_for_spelling
+from utils.check_runner import run_checks
+from utils.host_health import HostHealth, HostUnavailableError
+from utils.ignored_words import IGNORED_ITEMS
+from utils.incremental import IncrementalState
+from utils.issue_index import IssueIndex, find_issue_link
+from utils.link_cache import CachedLink, LinkCache
+from utils.link_engine import LinkCheckEngine
+from utils.link_failures import LinkFailures
+from utils.link_registry import LinkRegistry
+from utils.link_scheduler import SKIPPED_LINKS_FILE, LinkScheduler
+from utils.page import Link, Page, find_anchors
+from utils.run_profile import RunProfile
+from utils.sharding import Shard, merge_junit_reports, merge_skipped_links
+from utils.spelling import MemoisedDict, SpellingEngine, dictionary_fingerprint
+from utils.spelling_cache import SpellingCache
+from utils.spelling_preprocessor import preprocess_for_spelling, strip_between_tags
+from utils.url_matcher import UrlMatcher, unused_entries
+from utils.wiki_config import CHECKS, load_wiki_config
+from utils.wiki_index import WikiIndex
+from watch import WatchSession
+from wiki import acquire_wikis
+
+
+def cached_link(url, failure, checked_at):
+    return CachedLink(url, None, None, None, None, failure, checked_at)
 
 
 class FakeResponse(object):
@@ -11,9 +55,21 @@ class FakeResponse(object):
     A fake response object with some of the same properties as the one from requests.
     """
 
-    def __init__(self, status, content=""):
+    def __init__(self, status, content="", headers=None):
         self.status_code = status
         self.content = content
+        self.headers = headers if headers is not None else {}
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def close(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        content = self.content.encode("utf-8") if isinstance(self.content, str) else self.content
+        for start in range(0, len(content), chunk_size):
+            yield content[start : start + chunk_size]
 
 
 def fake_get_response_from_shadow(page, **kwargs):
@@ -23,6 +79,61 @@ def fake_get_response_from_shadow(page, **kwargs):
     return FakeResponse(**kwargs)
 
 
+class FakeGithubApi(object):
+    """
+    A local stand-in for the GitHub issues API, which pages through the issues of the IBEX repository, newest first.
+    """
+
+    def __init__(self, issue_numbers, per_page=2, rate_limit=None):
+        api = self
+        self.requests = []
+        # The requests left before the rate limit is reached, or None for no rate limit
+        self.rate_limit_remaining = rate_limit
+        newest_first = sorted(issue_numbers, reverse=True)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802
+                api.requests.append(self.path)
+                if api.rate_limit_remaining is not None:
+                    if api.rate_limit_remaining == 0:
+                        self.send_response(403)
+                        self.send_header("X-RateLimit-Remaining", "0")
+                        self.end_headers()
+                        return
+                    api.rate_limit_remaining -= 1
+                path, _, query = self.path.partition("?")
+                if path != "/repos/ISISComputingGroup/IBEX/issues":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                page = int(dict(p.split("=") for p in query.split("&")).get("page", 1))
+                numbers = newest_first[(page - 1) * per_page : page * per_page]
+                self.send_response(200)
+                if page * per_page < len(newest_first):
+                    self.send_header(
+                        "Link", '<{}{}?page={}>; rel="next"'.format(api.url, path, page + 1)
+                    )
+                if api.rate_limit_remaining is not None:
+                    self.send_header("X-RateLimit-Remaining", str(api.rate_limit_remaining))
+                    self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+                self.end_headers()
+                self.wfile.write(json.dumps([{"number": n} for n in numbers]).encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+
 class SelfTests(unittest.TestCase):
     """
     Tests that test the wiki checker tests themselves.
@@ -71,3 +182,1002 @@ class SelfTests(unittest.TestCase):
         new_string = strip_between_tags("<code>|</code>", test_string, "test")
 
         self.assertEqual(new_string, "NOT_STRIPPED")
+
+    def test_GIVEN_url_requested_by_many_pages_at_once_THEN_it_is_only_checked_once(self):
+        registry = LinkRegistry()
+        calls = []
+        release = threading.Event()
+
+        def slow_check(url):
+            calls.append(url)
+            release.wait(5)
+            return "failure for {}".format(url)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [
+                executor.submit(registry.check, "http://example.com", slow_check) for _ in range(8)
+            ]
+            release.set()
+            outcomes = [future.result() for future in futures]
+
+        self.assertEqual(calls, ["http://example.com"])
+        self.assertEqual(set(outcomes), {"failure for http://example.com"})
+
+    def test_GIVEN_link_cache_saved_WHEN_reopened_THEN_outcomes_and_validators_are_kept(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            cache = LinkCache(path)
+            cache.store("http://example.com", None, FakeResponse(200, headers={"ETag": '"abc"'}))
+            cache.store("http://broken.com", "Connection Timeout by broken.com\n")
+            cache.save()
+
+            reopened = LinkCache(path, success_ttl_hours=1, failure_ttl_hours=0)
+
+            working = reopened.get("http://example.com")
+            broken = reopened.get("http://broken.com")
+            self.assertTrue(reopened.is_fresh(working))
+            self.assertEqual(LinkCache.conditional_headers(working), {"If-None-Match": '"abc"'})
+            self.assertEqual(broken.failure, "Connection Timeout by broken.com\n")
+            self.assertFalse(reopened.is_fresh(broken))
+
+    def test_GIVEN_per_host_limit_WHEN_many_links_to_one_host_THEN_limit_is_not_exceeded(self):
+        engine = LinkCheckEngine(max_connections=8, max_connections_per_host=2)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_head(url, **kwargs):
+            with lock:
+                in_flight.append(url)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(url)
+            return FakeResponse(200)
+
+        try:
+            with patch.object(engine.session, "head", side_effect=fake_head):
+                futures = [
+                    engine.submit(engine.head, "http://example.com/{}".format(i)) for i in range(10)
+                ]
+                concurrent.futures.wait(futures)
+        finally:
+            engine.close()
+
+        self.assertLessEqual(max(peak), 2)
+
+    def test_GIVEN_host_keeps_failing_THEN_its_remaining_links_fail_without_being_requested(self):
+        engine = LinkCheckEngine(retries=1, host_health=HostHealth(failure_threshold=3, backoff=0))
+        requested = []
+
+        def fake_head(url, **kwargs):
+            requested.append(url)
+            raise requests.exceptions.ConnectTimeout("timed out")
+
+        try:
+            with patch.object(engine.session, "head", side_effect=fake_head):
+                for i in range(2):
+                    with self.assertRaises(requests.exceptions.Timeout):
+                        engine.head("http://dead.example.com/{}".format(i))
+                with self.assertRaises(HostUnavailableError):
+                    engine.head("http://dead.example.com/2")
+        finally:
+            engine.close()
+
+        # Each of the first two links was tried again once, until the third failure opened the circuit
+        self.assertEqual(len(requested), 3)
+
+    def test_GIVEN_rate_limited_THEN_request_is_retried_after_the_time_asked_for(self):
+        engine = LinkCheckEngine(host_health=HostHealth(backoff=0))
+        responses = [FakeResponse(429, headers={"Retry-After": "0"}), FakeResponse(200)]
+
+        try:
+            with patch.object(engine.session, "head", side_effect=responses):
+                response = engine.head("http://busy.example.com")
+        finally:
+            engine.close()
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_GIVEN_request_waiting_to_be_retried_THEN_its_worker_checks_other_links_meanwhile(self):
+        engine = LinkCheckEngine(max_connections=1, host_health=HostHealth(backoff=0.2))
+        responses = {"http://flaky.example.com": [FakeResponse(503), FakeResponse(200)]}
+        requested = []
+
+        def fake_head(url, **kwargs):
+            requested.append(url)
+            return responses.get(url, [FakeResponse(200)]).pop(0)
+
+        try:
+            with patch.object(engine.session, "head", side_effect=fake_head):
+                flaky = engine.submit(engine.head, "http://flaky.example.com")
+                other = engine.submit(engine.head, "http://other.example.com")
+                self.assertEqual(other.result().status_code, 200)
+                self.assertFalse(flaky.done())
+                self.assertEqual(flaky.result().status_code, 200)
+        finally:
+            engine.close()
+
+        # The only worker checked the other link while the flaky one waited to be tried again
+        self.assertEqual(
+            requested,
+            ["http://flaky.example.com", "http://other.example.com", "http://flaky.example.com"],
+        )
+
+    def test_GIVEN_wiki_edited_since_last_run_THEN_only_changed_and_linking_pages_are_rechecked(
+        self,
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            wiki_dir = os.path.join(directory, "wiki")
+            repo = git.Repo.init(wiki_dir)
+            pages = []
+            for name, text in [
+                ("Home", "See [edited](Edited)"),
+                ("Edited", "Old"),
+                ("Other", "Text"),
+            ]:
+                pages.append(os.path.join(wiki_dir, "{}.md".format(name)))
+                with open(pages[-1], "w", encoding="utf-8") as f:
+                    f.write(text)
+            repo.index.add(pages)
+            repo.index.commit("first")
+
+            state = IncrementalState(os.path.join(directory, "state.json"))
+            state.plan("wiki", wiki_dir, pages)
+            for page in pages:
+                state.record(page, "test", None)
+            state.finish("wiki")
+            state.save()
+
+            with open(pages[1], "w", encoding="utf-8") as f:
+                f.write("New")
+            repo.index.add([pages[1]])
+            repo.index.commit("second")
+
+            state = IncrementalState(os.path.join(directory, "state.json"))
+            to_check = state.plan("wiki", wiki_dir, pages)
+
+            self.assertEqual(to_check, 2)
+            self.assertEqual(state.previous_result(pages[2], "test"), (True, None))
+            self.assertEqual(state.previous_result(pages[1], "test"), (False, None))
+            for page in pages:
+                state.record(page, "test", None)
+            state.finish("wiki")
+            state.save()
+
+            # Adding a word to the wiki's own ignore list in its config makes every page be checked again
+            ignored_items = dict(IGNORED_ITEMS, WORDS=IGNORED_ITEMS["WORDS"] | {"zzword"})
+            state = IncrementalState(os.path.join(directory, "state.json"))
+            self.assertEqual(state.plan("wiki", wiki_dir, pages, ignored_items), 3)
+            self.assertEqual(state.previous_result(pages[2], "test"), (False, None))
+
+    def test_GIVEN_same_error_on_several_pages_THEN_summary_groups_pages_under_one_error(self):
+        with tempfile.TemporaryDirectory() as directory:
+            json_lines_path = os.path.join(directory, "failures.jsonl")
+            failures = LinkFailures(json_lines_path)
+            failures.add("Connection Timeout by a.com\n", "http://a.com/x", "wiki", "Page1.md")
+            failures.add("Connection Timeout by a.com\n", "http://a.com/y", "wiki", "Page2.md")
+            failures.add("Invalid link: b\n", "b", "wiki", "Page1.md")
+            failures.close()
+
+            with open(json_lines_path, "r", encoding="utf-8") as f:
+                streamed = [json.loads(line) for line in f]
+
+        self.assertEqual(
+            failures.render(),
+            "Connection Timeout by a.com\nOn the following pages:\n  wiki/Page1.md: http://a.com/x\n"
+            "  wiki/Page2.md: http://a.com/y\nInvalid link: b\nOn the following pages:\n  wiki/Page1.md: b",
+        )
+        self.assertEqual(len(streamed), 3)
+        self.assertEqual(streamed[0]["host"], "a.com")
+
+    def test_GIVEN_word_checked_many_times_THEN_dictionary_is_only_asked_once(self):
+        dictionary = MagicMock(tag="en_GB")
+        dictionary.check.return_value = True
+        memoised = MemoisedDict(dictionary)
+
+        verdicts = [memoised.check("colour") for _ in range(5)]
+
+        self.assertEqual(verdicts, [True] * 5)
+        dictionary.check.assert_called_once_with("colour")
+
+    def test_GIVEN_fuzzed_markdown_THEN_preprocessor_matches_original_multi_pass_version(self):
+        rng = random.Random(0)
+        fragments = ["`", "``", "```", "\\", "\\\\", "word ", "\n", "[", "]", "(", ")", "*", "<code>", "</code>",
+                     "<pre>", "</pre>", '<img src="x.png">', "[text](http://link)", "](", " "]  # fmt: skip
+
+        for _ in range(5000):
+            text = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 20)))
+            try:
+                expected = legacy_preprocess_for_spelling(text, "test")
+            except ValueError as e:
+                with self.assertRaisesRegex(ValueError, re.escape(str(e))):
+                    preprocess_for_spelling(text, "test")
+                continue
+            self.assertEqual(preprocess_for_spelling(text, "test"), expected, repr(text))
+
+    def test_GIVEN_markdown_headings_THEN_anchors_match_the_ones_github_generates(self):
+        text = (
+            "# Using `caput` with [EPICS](http://x)\n"
+            "```\n# not a heading\n```\n"
+            "Setext heading\n---\n"
+            "## Usage\n## Usage\n"
+            '<a name="Explicit"></a>\n'
+        )
+
+        anchors = find_anchors(text)
+
+        self.assertEqual(
+            anchors,
+            {"using-caput-with-epics", "setext-heading", "usage", "usage-1", "explicit"},
+        )
+
+    def test_GIVEN_requests_to_a_host_THEN_profile_counts_latency_buckets_and_timeouts(self):
+        profile = RunProfile()
+
+        profile.record_url("http://slow.com/a", 0.05)
+        profile.record_url("http://slow.com/b", 3)
+        profile.record_url("http://slow.com/c", 5, timed_out=True)
+
+        host = profile.to_dict()["hosts"]["slow.com"]
+        self.assertEqual(host["requests"], 3)
+        self.assertEqual(host["timeouts"], 1)
+        self.assertEqual(host["histogram"], {"<=0.1s": 1, "<=5s": 2})
+
+    def test_GIVEN_render_error_split_across_chunks_THEN_shadow_replication_test_fails(self):
+        tests = shadow_mirroring_tests.ShadowReplicationTests(
+            methodName="test_GIVEN_page_then_its_content_is_accessible_on_shadow", page="abc.md"
+        )
+        response = FakeResponse(
+            200, content="<html>" + shadow_mirroring_tests.ERROR_TEXT + "</html>"
+        )
+        response.iter_content = functools.partial(
+            FakeResponse.iter_content, response, chunk_size=10
+        )
+
+        with patch("tests.shadow_mirroring_tests.get_response_from_shadow", return_value=response):
+            with self.assertRaises(AssertionError):
+                tests.test_GIVEN_page_then_its_content_is_accessible_on_shadow()
+
+    def test_GIVEN_checks_streamed_THEN_report_is_complete_after_every_check_and_keeps_names_and_messages(
+        self,
+    ):
+        reports = []
+
+        class Checks(unittest.TestCase):
+            def test_passing(self):
+                # The report for the checks that have already run can be read while the run is in progress
+                reports.append(ElementTree.parse(glob_report()))
+
+            def test_failing(self):
+                self.fail("The following words were spelled incorrectly in file abc.md: <zzz>")
+
+        def glob_report():
+            (name,) = os.listdir(reports_path)
+            return os.path.join(reports_path, name)
+
+        with tempfile.TemporaryDirectory() as reports_path:
+            checks = (Checks(name) for name in ["test_failing", "test_passing"])
+            with open(os.devnull, "w") as stream:
+                success = run_checks(checks, reports_path, "tests.Checks", stream)
+            report = ElementTree.parse(glob_report()).getroot()
+
+        self.assertFalse(success)
+        self.assertEqual(len(reports[0].getroot()), 1)
+        self.assertEqual([case.get("name") for case in report], ["test_failing", "test_passing"])
+        failure = report[0].find("failure")
+        self.assertEqual(failure.get("type"), "AssertionError")
+        self.assertEqual(
+            failure.get("message"),
+            "The following words were spelled incorrectly in file abc.md: <zzz>",
+        )
+
+    def test_GIVEN_issue_links_THEN_they_are_checked_against_cached_issues_of_their_repository(
+        self,
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "issue-index.json")
+            with FakeGithubApi([1, 2, 5, 7, 8]) as api:
+                index = IssueIndex(path, api_url=api.url)
+                self.assertIsNone(
+                    index.check(
+                        *find_issue_link("https://github.com/ISISComputingGroup/IBEX/issues/7")
+                    )
+                )
+                self.assertEqual(index.check("IBEX", 3), "Invalid IBEX issue number: 3")
+                self.assertEqual(
+                    index.check("missing", 1), "Could not find missing repository for issue 1"
+                )
+                index.save()
+            # The highest issue number and all of the pages of issues are fetched once for the first link to the
+            # repository
+            self.assertEqual(len([r for r in api.requests if "/IBEX/" in r]), 4)
+
+            # Once GitHub can't be reached the saved issues are still used
+            offline_index = IssueIndex(path, api_url=api.url, offline=True)
+            self.assertIsNone(offline_index.check("ibex", 8))
+            self.assertEqual(offline_index.check("IBEX", 9), "Invalid IBEX issue number: 9")
+
+    def test_GIVEN_watched_folder_WHEN_page_edited_THEN_only_that_page_is_checked_again(self):
+        utils.global_vars.init()
+        with tempfile.TemporaryDirectory() as folder:
+            pages = [os.path.join(folder, name) for name in ["Home.md", "Other.md"]]
+            for page in pages:
+                with open(page, "w", encoding="utf-8") as f:
+                    f.write("Hello there\n")
+            session = WatchSession(folder=folder)
+
+            self.assertEqual(len(session.poll()), 4)
+            self.assertEqual(session.poll(), [])
+
+            with open(pages[0], "w", encoding="utf-8") as f:
+                f.write("Hello zzthere\n")
+            records = session.poll()
+
+        self.assertEqual({record["page"] for record in records}, {pages[0]})
+        self.assertEqual(sorted(record["passed"] for record in records), [False, True])
+        self.assertEqual(len(session.results), 2)
+
+    def test_GIVEN_wiki_config_THEN_defaults_are_filled_in_and_ignore_lists_are_added_to(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "wikis.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "wikis": [
+                            {"name": "IBEX"},
+                            {
+                                "name": "other",
+                                "url": "file:///wikis/other",
+                                "checks": ["spelling"],
+                                "ignored_words": ["Zzword"],
+                                "ignored_urls": ["http://ignored.example.com"],
+                            },
+                        ]
+                    },
+                    f,
+                )
+            ibex, other = load_wiki_config(path)
+
+        self.assertEqual(ibex.wiki.url, "https://github.com/ISISComputingGroup/IBEX.wiki.git")
+        self.assertEqual(ibex.checks, CHECKS)
+        self.assertEqual(other.wiki.url, "file:///wikis/other")
+        self.assertEqual(other.checks, ["spelling"])
+        self.assertIn("zzword", other.ignored_items["WORDS"])
+        self.assertNotIn("zzword", ibex.ignored_items["WORDS"])
+        self.assertIn("http://ignored.example.com", other.ignored_items["URLS"])
+
+    def test_GIVEN_ignored_url_entries_of_each_kind_THEN_matching_links_are_ignored_and_unused_entries_reported(
+        self,
+    ):
+        matcher = UrlMatcher(
+            [
+                "http://localhost:",
+                "host:Example.com",
+                "prefix:https://github.com/ISISComputingGroup/EPICS/",
+                "glob:https://*.example.org/*.pdf",
+                r"re:^https://trac\.isis\.rl\.ac\.uk/ICP/ticket/\d+$",
+                "never.example.net",
+            ]
+        )
+
+        ignored = [
+            "http://localhost:8080/status",
+            "https://example.com/anything",
+            "https://github.com/ISISComputingGroup/EPICS/pull/1",
+            "https://docs.example.org/manuals/motor.pdf",
+            "https://trac.isis.rl.ac.uk/ICP/ticket/12",
+        ]
+        checked = [
+            "https://sub.example.com/anything",
+            "https://github.com/ISISComputingGroup/EPICS-galil",
+            "https://docs.example.org/manuals/motor.pdf#page=2",
+            "https://example.org/motor.pdf",
+            "https://trac.isis.rl.ac.uk/ICP/ticket/12/edit",
+        ]
+        for url in ignored:
+            self.assertTrue(matcher.matches(url), url)
+        for url in checked:
+            self.assertFalse(matcher.matches(url), url)
+        self.assertEqual(unused_entries([matcher]), ["never.example.net"])
+        with self.assertRaises(ValueError):
+            UrlMatcher(["re:("])
+
+    def test_GIVEN_spelling_cache_WHEN_one_paragraph_edited_THEN_only_that_paragraph_is_checked_again(
+        self,
+    ):
+        engine = SpellingEngine(frozenset(["zzknown"]))
+        dictionary = dictionary_fingerprint(engine.language)
+        checked = []
+
+        def check(block):
+            checked.append(block)
+            return engine.unknown_words(block)
+
+        first = (
+            "A zzfirst paragraph.\n\nA second paragraph with zzknown in it.\n\nA third paragraph."
+        )
+        edited = first.replace("third", "zzthird")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spelling-cache.json")
+            cache = SpellingCache(path)
+            self.assertEqual(cache.unknown_words(first, dictionary, check), {"zzfirst", "zzknown"})
+            self.assertEqual(len(checked), 3)
+            cache.save()
+
+            checked.clear()
+            reopened = SpellingCache(path)
+            words = reopened.unknown_words(edited, dictionary, check)
+            self.assertEqual(checked, ["A zzthird paragraph."])
+            self.assertEqual(words, {"zzfirst", "zzknown", "zzthird"})
+
+            # Ignored words are taken out after the cache, so a different word list reuses the same paragraphs
+            with patch.object(SpellingEngine, "unknown_words", side_effect=AssertionError):
+                self.assertEqual(
+                    SpellingEngine(frozenset()).misspelled_words(edited, reopened),
+                    {"zzfirst", "zzknown", "zzthird"},
+                )
+                self.assertEqual(engine.misspelled_words(edited, reopened), {"zzfirst", "zzthird"})
+
+            checked.clear()
+            SpellingCache(path).unknown_words(first, "another dictionary", check)
+            self.assertEqual(len(checked), 3)
+
+    def test_GIVEN_page_timings_THEN_shards_split_pages_by_cost_and_reports_merge_into_one(self):
+        timings = {
+            "IBEX/a.md": 10.0,
+            "IBEX/b.md": 6.0,
+            "IBEX/c.md": 5.0,
+            "IBEX/d.md": 4.0,
+            "IBEX/e.md": 1.0,
+        }
+        keys = list(timings) + ["IBEX/new.md"]
+        shards = [Shard(index, 2, timings) for index in range(2)]
+
+        # Every page is checked by exactly one shard, whichever shard works it out
+        for key in keys:
+            self.assertEqual(sum(shard.includes(key) for shard in shards), 1, key)
+        self.assertEqual(sorted(shard.expected_seconds(timings) for shard in shards), [12.0, 14.0])
+
+        class Checks(unittest.TestCase):
+            def test_passing(self):
+                pass
+
+            def test_failing(self):
+                self.fail("Failed on a shard")
+
+        with tempfile.TemporaryDirectory() as directory:
+            shard_reports = []
+            for name in ["test_passing", "test_failing"]:
+                reports_path = os.path.join(directory, name)
+                with open(os.devnull, "w") as stream:
+                    run_checks(
+                        [Checks(name)], os.path.join(reports_path, "IBEX"), "tests.Checks", stream
+                    )
+                shard_reports.append(reports_path)
+                with open(os.path.join(reports_path, SKIPPED_LINKS_FILE), "w") as f:
+                    f.write(json.dumps({"url": "http://slow.com", "pages": [name]}) + "\n")
+            output = os.path.join(directory, "merged")
+            problems = merge_junit_reports(shard_reports, output)
+            report = ElementTree.parse(
+                os.path.join(output, "IBEX", "TEST-tests.Checks.xml")
+            ).getroot()
+            skipped = merge_skipped_links(shard_reports, output)
+            with open(os.path.join(output, SKIPPED_LINKS_FILE)) as f:
+                skipped_lines = [json.loads(line) for line in f]
+
+        self.assertEqual(problems, 1)
+        self.assertEqual([case.get("name") for case in report], ["test_passing", "test_failing"])
+        self.assertEqual(skipped, {"http://slow.com": ["test_passing", "test_failing"]})
+        self.assertEqual(
+            skipped_lines, [{"url": "http://slow.com", "pages": ["test_passing", "test_failing"]}]
+        )
+
+    def test_GIVEN_deadline_WHEN_a_link_check_raises_THEN_it_fails_that_link_and_the_rest_are_checked(
+        self,
+    ):
+        engine = LinkCheckEngine(max_connections=1)
+        link_failures = LinkFailures()
+        utils.global_vars.init(engine=engine, failures=link_failures)
+        checked = []
+
+        def check(url):
+            checked.append(url)
+            if url.startswith("mailto:"):
+                raise requests.exceptions.InvalidSchema("No connection adapters were found")
+
+        try:
+            scheduler = LinkScheduler(time.monotonic() + 1000)
+            scheduler.add("mailto:someone@example.com", check, "IBEX", "Page.md")
+            scheduler.add("http://working.com", check, "IBEX", "Page.md")
+            scheduler.run(engine)
+        finally:
+            engine.close()
+
+        self.assertEqual(sorted(checked), ["http://working.com", "mailto:someone@example.com"])
+        self.assertEqual(scheduler.skipped, [])
+        self.assertIn("Invalid link: InvalidSchema", link_failures.render())
+        self.assertIn("mailto:someone@example.com", link_failures.render())
+
+    def test_GIVEN_deadline_WHEN_retry_would_run_past_it_THEN_link_is_skipped_without_waiting(self):
+        engine = LinkCheckEngine(timeout=1, host_health=HostHealth(backoff=30))
+        utils.global_vars.init(engine=engine)
+        requested = []
+
+        def fake_head(url, **kwargs):
+            requested.append(url)
+            return FakeResponse(503)
+
+        def check(url):
+            return None if engine.head(url) else ("Could not open URL\n", url)
+
+        started = time.monotonic()
+        try:
+            with patch.object(engine.session, "head", side_effect=fake_head):
+                scheduler = LinkScheduler(started + 5)
+                scheduler.add("http://flaky.com", check, "IBEX", "Page.md")
+                scheduler.run(engine)
+        finally:
+            engine.close()
+
+        # The first request fitted in the time left, but waiting to retry it wouldn't have
+        self.assertEqual(requested, ["http://flaky.com"])
+        self.assertEqual(scheduler.skipped, ["http://flaky.com"])
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_GIVEN_server_refuses_head_and_redirects_get_in_a_loop_THEN_get_is_judged_like_head(
+        self,
+    ):
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):  # noqa: N802
+                self.send_response(405)
+                self.end_headers()
+
+            def do_GET(self):  # noqa: N802
+                self.send_response(302)
+                self.send_header("Location", self.path)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        engine = LinkCheckEngine()
+        try:
+            response = engine.probe("http://127.0.0.1:{}/loop".format(server.server_address[1]))
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+        # HEAD doesn't follow redirects, so neither does the GET which stands in for it
+        self.assertEqual(response.status_code, 302)
+
+    def test_GIVEN_link_that_cannot_be_requested_THEN_it_is_a_link_failure_not_a_test_error(self):
+        with tempfile.TemporaryDirectory() as folder:
+            page = os.path.join(folder, "Home.md")
+            with open(page, "w", encoding="utf-8") as f:
+                f.write("Write to [mail](mailto:someone@example.com)\n")
+            engine = LinkCheckEngine(max_connections=1)
+            link_failures = LinkFailures()
+            utils.global_vars.init(engine=engine, failures=link_failures)
+            result = unittest.TestResult()
+            try:
+                page_tests.PageTests(
+                    "test_GIVEN_a_page_IF_it_contains_urls_WHEN_url_loaded_THEN_response_is_http_ok",
+                    IGNORED_ITEMS,
+                    (Page(page), [Page(page)], ""),
+                )(result)
+            finally:
+                engine.close()
+
+        self.assertEqual(result.errors, [])
+        self.assertIn(
+            "Invalid link: mailto:someone@example.com (InvalidSchema)", link_failures.render()
+        )
+
+    def test_GIVEN_server_refuses_head_THEN_first_byte_is_got_instead_and_remembered_for_the_host(
+        self,
+    ):
+        engine = LinkCheckEngine(host_health=HostHealth(backoff=0))
+        heads = []
+        gets = []
+
+        def fake_head(url, **kwargs):
+            heads.append(url)
+            if "no-head.example.com" in url:
+                return FakeResponse(405)
+            return FakeResponse(404 if "missing" in url else 200)
+
+        def fake_get(url, headers=None, **kwargs):
+            gets.append((url, headers["Range"], kwargs["stream"]))
+            return FakeResponse(404 if "missing" in url else 206)
+
+        try:
+            with (
+                patch.object(engine.session, "head", side_effect=fake_head),
+                patch.object(engine.session, "get", side_effect=fake_get),
+            ):
+                first = engine.probe("http://no-head.example.com/book.xlsx")
+                second = engine.probe("http://no-head.example.com/other.xlsx")
+                working = engine.probe("http://example.com/page")
+                missing = engine.probe("http://example.com/missing")
+                also_missing = engine.probe("http://example.com/missing-too")
+        finally:
+            engine.close()
+
+        self.assertEqual([first.status_code, second.status_code], [206, 206])
+        self.assertEqual(working.status_code, 200)
+        self.assertEqual([missing.status_code, also_missing.status_code], [404, 404])
+        self.assertEqual(
+            heads,
+            [
+                "http://no-head.example.com/book.xlsx",
+                "http://example.com/page",
+                "http://example.com/missing",
+                "http://example.com/missing-too",
+            ],
+        )
+        # HEAD works for example.com and a GET confirmed its first 404, so the next 404 is taken as a broken link
+        self.assertEqual(
+            gets,
+            [
+                ("http://no-head.example.com/book.xlsx", "bytes=0-0", True),
+                ("http://no-head.example.com/other.xlsx", "bytes=0-0", True),
+                ("http://example.com/missing", "bytes=0-0", True),
+            ],
+        )
+
+    def test_GIVEN_deadline_THEN_links_are_checked_most_valuable_first_and_the_rest_skipped(self):
+        now = time.time()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LinkCache(os.path.join(directory, "links.sqlite"), success_ttl_hours=1)
+            cache._put(cached_link("http://fresh.com", None, now))
+            cache._put(cached_link("http://failing.com", "Could not open URL", now - 7200))
+            cache._put(cached_link("http://newer.com", None, now - 7200))
+            cache._put(cached_link("http://oldest.com", None, now - 9000))
+            engine = LinkCheckEngine(max_connections=1)
+            utils.global_vars.init(cache=cache, engine=engine)
+            checked = []
+
+            def check(url):
+                checked.append(url)
+                return ("Could not open URL\n", url) if url == "http://failing.com" else None
+
+            urls = [
+                "http://oldest.com",
+                "http://newer.com",
+                "http://failing.com",
+                "http://fresh.com",
+            ]
+            try:
+                scheduler = LinkScheduler(time.monotonic() + 1000)
+                for url in urls + ["http://new.com"]:
+                    scheduler.add(url, check, "IBEX", "Page.md")
+                scheduler.run(engine)
+
+                # With no time left, only the links whose outcome is already known are checked
+                utils.global_vars.init(cache=cache, engine=engine)
+                late = LinkScheduler(time.monotonic())
+                for url in urls:
+                    late.add(url, check, "IBEX", "Page.md")
+                late.run(engine)
+            finally:
+                engine.close()
+
+        self.assertEqual(
+            checked,
+            [
+                "http://fresh.com",
+                "http://new.com",
+                "http://failing.com",
+                "http://oldest.com",
+                "http://newer.com",
+                "http://fresh.com",
+            ],
+        )
+        self.assertEqual(scheduler.skipped, [])
+        self.assertEqual(
+            sorted(late.skipped), ["http://failing.com", "http://newer.com", "http://oldest.com"]
+        )
+
+    def test_GIVEN_page_THEN_it_is_read_once_for_all_its_checks_and_failures_give_line_numbers(
+        self,
+    ):
+        with tempfile.TemporaryDirectory() as folder:
+            home, other = os.path.join(folder, "Home.md"), os.path.join(folder, "Other.md")
+            with open(home, "w", encoding="utf-8") as f:
+                f.write(
+                    "# Home\n\nSee [setup](Other#setup).\n\nThen zzmisspelt (see [it](Other#nowhere))\n"
+                )
+            with open(other, "w", encoding="utf-8") as f:
+                f.write("Setup\n=====\n")
+            pages = [Page(home), Page(other)]
+            engine = LinkCheckEngine(max_connections=1)
+            utils.global_vars.init(engine=engine)
+            result = unittest.TestResult()
+            read = Page._read
+            try:
+                with patch.object(Page, "_read", autospec=True, side_effect=read) as reads:
+                    for test in unittest.TestLoader().getTestCaseNames(page_tests.PageTests):
+                        page_tests.PageTests(test, IGNORED_ITEMS, (pages[0], pages, ""))(result)
+                    links = pages[0].links
+                    pages[0].release()
+                    anchors = pages[1].anchors
+            finally:
+                engine.close()
+
+        self.assertEqual(links, [Link("Other#setup", 3), Link("Other#nowhere", 5)])
+        self.assertEqual(anchors, {"setup"})
+        # Home is read once by both of its tests, Other once for its anchors
+        self.assertEqual(reads.call_count, 2)
+        messages = "".join(message for _, message in result.failures)
+        self.assertIn("zzmisspelt (line 5)", messages)
+        self.assertIn(
+            "Could not find section #nowhere in page link Other#nowhere (line 5)", messages
+        )
+        self.assertEqual(pickle.loads(pickle.dumps(pages[0])), home)
+
+    def test_GIVEN_engine_THEN_only_its_own_connections_cache_dns_lookups(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):  # noqa: N802
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        getaddrinfo = socket.getaddrinfo
+        engine = LinkCheckEngine()
+        try:
+            self.assertIs(socket.getaddrinfo, getaddrinfo)
+            with patch("socket.getaddrinfo", side_effect=getaddrinfo) as lookups:
+                # The server closes each connection, so every request makes a new one
+                for i in range(3):
+                    url = "http://localhost:{}/{}".format(server.server_address[1], i)
+                    self.assertEqual(engine.head(url).status_code, 200)
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual([call.args[0] for call in lookups.call_args_list].count("localhost"), 1)
+        self.assertIs(socket.getaddrinfo, getaddrinfo)
+
+    def test_GIVEN_unchanged_page_in_incremental_run_THEN_its_external_links_are_still_checked(
+        self,
+    ):
+        now = time.time()
+        with tempfile.TemporaryDirectory() as directory:
+            page = os.path.join(directory, "Page.md")
+            with open(page, "w", encoding="utf-8") as f:
+                f.write("See [broken](http://broken.example.com) and [missing](Missing)\n")
+            test_name = (
+                "test_GIVEN_a_page_IF_it_contains_urls_WHEN_url_loaded_THEN_response_is_http_ok"
+            )
+            state = IncrementalState(os.path.join(directory, "state.json"))
+            state._reusable_pages.add(state._key(page))
+            state.record(page, test_name, "Could not follow page link Missing")
+            cache = LinkCache(os.path.join(directory, "links.sqlite"))
+            cache._put(cached_link("http://broken.example.com", "Could not open URL\n", now))
+            engine = LinkCheckEngine(offline=True)
+            utils.global_vars.init(cache=cache, engine=engine, incremental=state)
+            result = unittest.TestResult()
+            try:
+                page_tests.PageTests(test_name, IGNORED_ITEMS, (page, [page, "Other.md"], ""))(
+                    result
+                )
+            finally:
+                engine.close()
+
+        # The previous result of the links within the wiki is replayed, the external link is checked again
+        self.assertEqual(len(result.failures), 1)
+        self.assertIn("Could not follow page link Missing", result.failures[0][1])
+        self.assertEqual(len(utils.global_vars.link_failures), 1)
+
+    def test_GIVEN_pages_prefetched_from_shadow_THEN_each_prefetch_only_gives_its_own_pages(self):
+        with patch(
+            "tests.shadow_mirroring_tests.get_response_from_shadow",
+            side_effect=functools.partial(fake_get_response_from_shadow, status=404),
+        ):
+            first = shadow_mirroring_tests.prefetch_shadow_pages(["first.md"])
+        with patch(
+            "tests.shadow_mirroring_tests.get_response_from_shadow",
+            side_effect=functools.partial(fake_get_response_from_shadow, status=200),
+        ):
+            second = shadow_mirroring_tests.prefetch_shadow_pages(["second.md"])
+            tests = shadow_mirroring_tests.ShadowReplicationTests(
+                methodName="test_GIVEN_page_then_its_content_is_accessible_on_shadow",
+                page="first.md",
+                prefetched_results=first,
+            )
+            # The prefetched result is used rather than asking shadow again
+            with self.assertRaises(AssertionError):
+                tests.test_GIVEN_page_then_its_content_is_accessible_on_shadow()
+
+        self.assertEqual(first, {})
+        self.assertEqual(list(second), [shadow_mirroring_tests.url_from_file_location("second.md")])
+
+    def test_GIVEN_rate_limit_reached_while_fetching_issues_THEN_next_run_carries_on_from_there(
+        self,
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "issue-index.json")
+            with FakeGithubApi([1, 2, 3, 5, 6, 7, 8, 9, 10, 11], rate_limit=13) as api:
+                first_run = IssueIndex(path, api_url=api.url)
+                # Until every issue has been fetched, only the highest issue number is checked against
+                self.assertIsNone(first_run.check("IBEX", 4))
+                self.assertEqual(first_run.check("IBEX", 12), "Invalid IBEX issue number: 12")
+                first_run.save()
+                # The highest issue number and two pages were fetched, leaving the reserve of the rate limit
+                self.assertEqual(len(api.requests), 3)
+
+                api.rate_limit_remaining = 60
+                second_run = IssueIndex(path, api_url=api.url)
+                self.assertEqual(second_run.check("IBEX", 4), "Invalid IBEX issue number: 4")
+                self.assertIsNone(second_run.check("IBEX", 1))
+
+        # The second run only fetched the highest issue number and the pages the first run didn't get to
+        self.assertEqual(len(api.requests), 7)
+
+    def test_GIVEN_dictionary_files_edited_THEN_dictionary_fingerprint_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, "hunspell"))
+            dic_path = os.path.join(directory, "hunspell", "en_GB.dic")
+            with open(dic_path, "w") as f:
+                f.write("1\ncolour\n")
+            with patch.dict(os.environ, {"ENCHANT_CONFIG_DIR": directory}):
+                dictionary_fingerprint.cache_clear()
+                try:
+                    before = dictionary_fingerprint("en_GB")
+                    with open(dic_path, "w") as f:
+                        f.write("2\ncolour\ncolor\n")
+                    dictionary_fingerprint.cache_clear()
+                    self.assertNotEqual(dictionary_fingerprint("en_GB"), before)
+                finally:
+                    dictionary_fingerprint.cache_clear()
+
+    def test_GIVEN_word_in_code_and_link_target_before_prose_THEN_its_line_is_the_prose_one(self):
+        text = (
+            "```\nrun zzword\n```\n"
+            "See <code>zzword\nhere</code> and `zzword` and [the docs](http://host/zzword).\n"
+            "Then zzword in prose.\n"
+        )
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "Home.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            page = Page(path)
+            self.assertEqual(page.line_of("zzword"), 6)
+            self.assertEqual(page.line_of("docs"), 5)
+            # A word only found outside the prose is still given a line
+            self.assertEqual(page.line_of("run"), 2)
+            self.assertIsNone(page.line_of("nowhere"))
+
+    def test_GIVEN_watched_page_WHEN_edited_THEN_its_links_are_checked_afresh_without_growing_the_profile(
+        self,
+    ):
+        requested = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):  # noqa: N802
+                requested.append(self.path)
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        profile = RunProfile()
+        profile.record_details = False
+        engine = LinkCheckEngine(profile=profile)
+        utils.global_vars.init(engine=engine, profile=profile)
+        try:
+            with tempfile.TemporaryDirectory() as folder:
+                page = os.path.join(folder, "Home.md")
+                text = "See [it](http://127.0.0.1:{}/it)\n".format(server.server_address[1])
+                with open(page, "w", encoding="utf-8") as f:
+                    f.write(text)
+                session = WatchSession(single_file=page)
+                session.poll()
+                # Even a host given up on during one check of the page is tried again in the next
+                for _ in range(engine.host_health.failure_threshold):
+                    engine.host_health.record_failure("127.0.0.1")
+
+                with open(page, "w", encoding="utf-8") as f:
+                    f.write(text + "\nEdited\n")
+                # Make sure the edit is noticed even if the file system's timestamps are coarse
+                session._signatures.clear()
+                session.poll()
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+        # Without a link cache, nothing remembers the link from one check of the page to the next
+        self.assertEqual(requested, ["/it", "/it"])
+        recorded = profile.to_dict()
+        self.assertEqual((recorded["pages"], recorded["urls"]), ([], {}))
+        self.assertEqual(recorded["hosts"]["127.0.0.1"]["requests"], 2)
+
+    def test_GIVEN_page_checked_on_its_own_THEN_its_folder_is_not_walked_to_find_linked_files(self):
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(os.path.join(folder, "images"))
+            with open(os.path.join(folder, "images", "logo.png"), "w") as f:
+                f.write("")
+            single_page_index = WikiIndex(folder, [])
+            wiki_index = WikiIndex(folder, [], walk_files=True)
+
+            with patch("os.walk", wraps=os.walk) as walk:
+                self.assertTrue(single_page_index.has_file("images/logo.png"))
+                self.assertFalse(single_page_index.has_file("images/missing.png"))
+                self.assertEqual(walk.call_count, 0)
+
+                # A whole wiki is only walked once, and only when a link to a file needs it
+                self.assertTrue(wiki_index.has_file("images/logo.png"))
+                self.assertFalse(wiki_index.has_file("images/missing.png"))
+                self.assertEqual(walk.call_count, 1)
+
+    def test_GIVEN_default_run_and_merge_THEN_next_sharded_run_reads_their_page_timings(self):
+        started_in = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            wiki = os.path.join(directory, "wiki")
+            os.makedirs(wiki)
+            for name in ["Home.md", "Other.md"]:
+                with open(os.path.join(wiki, name), "w", encoding="utf-8") as f:
+                    f.write("Hello there\n")
+            options = ["--folder", wiki, "--offline", "--no-link-cache", "--no-spelling-cache"]
+            options += ["--issue-index", os.path.join(directory, "issue-index.json")]
+            os.chdir(directory)
+            try:
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    with patch("locale.setlocale"), patch("sys.argv", ["run_tests.py"] + options):
+                        with self.assertRaises(SystemExit):
+                            run_tests.main()
+                    # The build collects the reports of the shard, then merges them for the next run
+                    os.rename(
+                        os.path.join(directory, "test-reports"), os.path.join(directory, "shard")
+                    )
+                    with patch("sys.argv", ["merge_shards.py", os.path.join(directory, "shard")]):
+                        with self.assertRaises(SystemExit):
+                            merge_shards.main()
+
+                    options += ["--shard", "1/2"]
+                    with patch("locale.setlocale"), patch("sys.argv", ["run_tests.py"] + options):
+                        with patch("run_tests.run_all_tests", return_value=True) as run_all_tests:
+                            with self.assertRaises(SystemExit):
+                                run_tests.main()
+            finally:
+                os.chdir(started_in)
+
+        shard = run_all_tests.call_args.args[11]
+        self.assertEqual(sorted(shard.timings), ["Home.md", "Other.md"])
+
+    def test_GIVEN_wiki_clone_raises_unexpected_error_THEN_every_wiki_is_cleaned_up_and_error_raised(
+        self,
+    ):
+        cleaned_up = []
+
+        class FakeWiki(object):
+            def __init__(self, name, error=None):
+                self.name = name
+                self.error = error
+
+            def __enter__(self):
+                if self.error is not None:
+                    raise self.error
+
+            def __exit__(self, *args):
+                cleaned_up.append(self.name)
+
+        wikis = [FakeWiki("ibex"), FakeWiki("broken", OSError("Disk full")), FakeWiki("other")]
+        with self.assertRaises(OSError):
+            with acquire_wikis(wikis):
+                self.fail("The wikis should not be used")
+
+        self.assertEqual(sorted(cleaned_up), ["broken", "ibex", "other"])
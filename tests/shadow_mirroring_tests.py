@@ -1,14 +1,20 @@
+import concurrent.futures
 import os
+import threading
 import unittest
 
-import requests
-
 HTTP_OK = 200
 
 SHADOW_URL = "http://shadow.nd.rl.ac.uk"
 
 ERROR_TEXT = "Failed to render page: Traceback"
 
+# Enough to hide shadow's slow responses without overloading it
+SHADOW_CONCURRENCY = 8
+
+_session = None
+_session_lock = threading.Lock()
+
 
 def url_from_file_location(file_location):
     relative_path = os.path.relpath(file_location, os.path.join(os.getcwd(), "source"))
@@ -16,12 +22,76 @@ def url_from_file_location(file_location):
     return "{}/{}".format(SHADOW_URL, relative_path_without_extension.replace("\\", "/"))
 
 
+def get_shadow_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            _session.mount("http://", HTTPAdapter(pool_maxsize=SHADOW_CONCURRENCY))
+        return _session
+
+
 def get_response_from_shadow(url):
-    return requests.get(
-        url, timeout=20
+    # The body is streamed so that it can be scanned as it arrives rather than held in memory
+    return get_shadow_session().get(
+        url, timeout=20, stream=True
     )  # 20s timeout as shadow can be quite slow to respond, 10s is not enough.
 
 
+def body_contains(response, text):
+    """
+    Scans a response body chunk by chunk, stopping as soon as the text is found.
+    """
+    marker = text.encode("utf-8")
+    tail = b""
+    for chunk in response.iter_content(chunk_size=16384):
+        window = tail + chunk
+        if marker in window:
+            return True
+        # Keep enough of the end of the chunk to find the marker if it is split across two chunks
+        tail = window[-(len(marker) - 1) :]
+    return False
+
+
+def check_shadow_page(url):
+    """
+    Returns:
+        A tuple of the status code shadow returned for the URL and whether the page failed to render
+    """
+    response = get_response_from_shadow(url)
+    try:
+        if response.status_code != HTTP_OK:
+            return response.status_code, False
+        return response.status_code, body_contains(response, ERROR_TEXT)
+    finally:
+        close = getattr(response, "close", None)
+        if close is not None:
+            close()
+
+
+def prefetch_shadow_pages(pages):
+    """
+    Checks all of the pages on shadow concurrently, ahead of their tests.
+
+    Returns:
+        The result of checking each page, or the error raised, by URL, for the tests of the pages to use
+    """
+    urls = [url_from_file_location(page) for page in pages]
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SHADOW_CONCURRENCY) as executor:
+        futures = {executor.submit(check_shadow_page, url): url for url in urls}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                # Raised again by the test for this page, so it is reported against the right page
+                results[futures[future]] = e
+    return results
+
+
 class ShadowReplicationTests(unittest.TestCase):
     """
 
@@ -29,12 +99,17 @@ class ShadowReplicationTests(unittest.TestCase):
     :param ignored_words: For spellchecker and link checker, not needed here
     :param wiki_info: A tuple containing the page to be tested, a list of all pages on the wiki and the wiki's
     directory. Only the first item is needed here.
+    :param page: The page to be tested, if wiki_info is not given
+    :param prefetched_results: The results of prefetch_shadow_pages for the pages being tested, if it was called
     """
 
-    def __init__(self, methodName, ignored_words=None, wiki_info=None):
+    def __init__(
+        self, methodName, ignored_words=None, wiki_info=None, page=None, prefetched_results=None
+    ):
         # Boilerplate so that unittest knows how to run these tests.
         super(ShadowReplicationTests, self).__init__(methodName)
-        self.page = wiki_info[0]
+        self.page = wiki_info[0] if wiki_info is not None else page
+        self.prefetched_results = prefetched_results if prefetched_results is not None else {}
 
     def setUp(self):
         # Class has to have an __init__ that accepts one argument for unittest's test loader to work properly.
@@ -43,15 +118,19 @@ class ShadowReplicationTests(unittest.TestCase):
 
     def test_GIVEN_page_then_its_content_is_accessible_on_shadow(self):
         url = url_from_file_location(self.page)
-        response = get_response_from_shadow(url)
+        result = self.prefetched_results.pop(url, None)
+        if result is None:
+            result = check_shadow_page(url)
+        elif isinstance(result, Exception):
+            raise result
+        status_code, failed_to_render = result
 
         self.assertEqual(
-            response.status_code,
+            status_code,
             HTTP_OK,
-            "Page {} returned status code {}".format(url, response.status_code),
+            "Page {} returned status code {}".format(url, status_code),
         )
-        self.assertNotIn(
-            ERROR_TEXT,
-            str(response.content),
+        self.assertFalse(
+            failed_to_render,
             "Page {} appears to be failing to render.".format(url),
         )
@@ -0,0 +1,213 @@
+import datetime
+import os
+import re
+import time
+import unittest
+
+SEPARATOR1 = "=" * 70
+SEPARATOR2 = "-" * 70
+
+# Characters which are not allowed anywhere in an XML 1.0 document
+INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+
+# Escapes for text in a double quoted attribute, including whitespace which would otherwise be normalised to spaces.
+# Done by hand rather than with xml.sax.saxutils, which imports urllib and ssl and so slows down starting up.
+ATTRIBUTE_ESCAPES = str.maketrans(
+    {
+        "&": "&amp;",
+        "<": "&lt;",
+        ">": "&gt;",
+        '"': "&quot;",
+        "\n": "&#10;",
+        "\r": "&#13;",
+        "\t": "&#9;",
+    }
+)
+
+
+def quoteattr(value):
+    return '"{}"'.format(str(value).translate(ATTRIBUTE_ESCAPES))
+
+
+def _xml_text(text):
+    return INVALID_XML_CHARS.sub("", str(text))
+
+
+def _cdata(text):
+    # "]]>" would end the section early, so it is split across two sections
+    return "<![CDATA[{}]]>".format(_xml_text(text).replace("]]>", "]]]]><![CDATA[>"))
+
+
+class JUnitReport(object):
+    """
+    A JUnit XML report which is written one test case at a time.
+
+    The closing tag is rewritten after every test case, so the file on disk is always a complete document and the
+    results so far survive the run being killed part way through.
+    """
+
+    def __init__(self, path, suite_name):
+        """
+        Args:
+            path: The file to write the report to
+            suite_name: The name of the test suite, e.g. the full name of the test class with a timestamp
+        """
+        self._file = open(path, "wb")
+        module_name = suite_name.rpartition(".")[0]
+        timestamp = datetime.datetime.now().replace(microsecond=0).isoformat()
+        self._file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n<testsuite name={} file={} timestamp={}>\n'.format(
+                quoteattr(suite_name),
+                quoteattr(module_name.replace(".", "/") + ".py"),
+                quoteattr(timestamp),
+            ).encode("utf-8")
+        )
+        self._end = self._file.tell()
+        self._write_trailer()
+
+    def _write_trailer(self):
+        self._file.write(b"</testsuite>\n")
+        self._file.flush()
+
+    def add(
+        self, test, elapsed_time, outcome=None, exception_name=None, message=None, details=None
+    ):
+        """
+        Args:
+            test: The test case the result is for
+            elapsed_time: How long the test took, in seconds
+            outcome: "failure", "error" or "skipped", or None if the test passed
+            exception_name: The name of the exception that failed the test
+            message: The message of the exception that failed the test, or the reason it was skipped
+            details: The formatted traceback of the exception that failed the test
+        """
+        class_name, _, method_name = test.id().rpartition(".")
+        case = "\t<testcase classname={} name={} time={}".format(
+            quoteattr(class_name), quoteattr(method_name), quoteattr("{:.3f}".format(elapsed_time))
+        )
+        if outcome is None:
+            case += "/>\n"
+        elif outcome == "skipped":
+            case += ">\n\t\t<skipped message={}/>\n\t</testcase>\n".format(
+                quoteattr(_xml_text(message))
+            )
+        else:
+            case += ">\n\t\t<{} type={} message={}>{}</{}>\n\t</testcase>\n".format(
+                outcome,
+                quoteattr(exception_name),
+                quoteattr(_xml_text(message)),
+                _cdata(details),
+                outcome,
+            )
+        self._file.seek(self._end)
+        self._file.write(case.encode("utf-8"))
+        self._end = self._file.tell()
+        self._write_trailer()
+
+    def close(self):
+        self._file.close()
+
+
+class StreamingResult(unittest.TestResult):
+    """
+    Test result which reports each test to the console and a JUnit report as soon as it finishes, rather than keeping
+    every result until the end of the run.
+    """
+
+    def __init__(self, stream, report):
+        super(StreamingResult, self).__init__(stream)
+        self.stream = stream
+        self.report = report
+        self.failure_count = 0
+        self.error_count = 0
+        self.skip_count = 0
+        self._started = None
+
+    def startTest(self, test):  # noqa: N802
+        super(StreamingResult, self).startTest(test)
+        self._started = time.perf_counter()
+
+    def _elapsed(self):
+        return time.perf_counter() - self._started
+
+    def _report_problem(self, flavour, outcome, test, err):
+        elapsed_time = self._elapsed()
+        details = self._exc_info_to_string(err, test)
+        self.report.add(test, elapsed_time, outcome, err[0].__name__, str(err[1]), details)
+        self.stream.write(
+            "\n{}\n{} [{:.3f}s]: {}\n{}\n{}\n".format(
+                SEPARATOR1, flavour, elapsed_time, str(test), SEPARATOR2, details
+            )
+        )
+        self.stream.flush()
+
+    def addSuccess(self, test):  # noqa: N802
+        self.report.add(test, self._elapsed())
+        self.stream.write(".")
+        self.stream.flush()
+
+    def addFailure(self, test, err):  # noqa: N802
+        self.failure_count += 1
+        self._report_problem("FAIL", "failure", test, err)
+
+    def addError(self, test, err):  # noqa: N802
+        self.error_count += 1
+        self._report_problem("ERROR", "error", test, err)
+
+    def addSkip(self, test, reason):  # noqa: N802
+        self.skip_count += 1
+        self.report.add(test, self._elapsed(), "skipped", message=reason)
+        self.stream.write("s")
+        self.stream.flush()
+
+    def wasSuccessful(self):  # noqa: N802
+        return self.failure_count == 0 and self.error_count == 0
+
+
+def run_checks(checks, reports_path, suite_name, stream):
+    """
+    Runs checks one at a time, streaming their results to the console and to a JUnit XML report.
+
+    Nothing is kept for a check once it has run, so the memory used does not grow with the number of checks.
+
+    Args:
+        checks: Iterable of test cases to run, ideally a generator which only creates each one when it is needed
+        reports_path: The folder to write the JUnit XML report to
+        suite_name: The name of the suite the checks belong to, normally the full name of the test class
+        stream: The console stream to report progress and failures to
+
+    Returns:
+        True if every check passed, else False
+    """
+    os.makedirs(reports_path, exist_ok=True)
+    suite_name = "{}-{}".format(suite_name, time.strftime("%Y%m%d%H%M%S"))
+    report = JUnitReport(os.path.join(reports_path, "TEST-{}.xml".format(suite_name)), suite_name)
+    result = StreamingResult(stream, report)
+
+    stream.write("\nRunning tests...\n{}\n".format(SEPARATOR2))
+    started = time.monotonic()
+    try:
+        for check in checks:
+            check(result)
+    finally:
+        report.close()
+    time_taken = time.monotonic() - started
+
+    # The summary is in the same form as unittest's, which the log parsing rules rely on
+    stream.write(
+        "\n{}\nRan {} test{} in {:.3f}s\n\n".format(
+            SEPARATOR2, result.testsRun, "s" if result.testsRun != 1 else "", time_taken
+        )
+    )
+    infos = []
+    if result.failure_count:
+        infos.append("failures={}".format(result.failure_count))
+    if result.error_count:
+        infos.append("errors={}".format(result.error_count))
+    if result.skip_count:
+        infos.append("skipped={}".format(result.skip_count))
+    stream.write("FAILED" if not result.wasSuccessful() else "OK")
+    stream.write(" ({})\n".format(", ".join(infos)) if infos else "\n")
+    stream.flush()
+    return result.wasSuccessful()
@@ -0,0 +1,107 @@
+import socket
+import threading
+import time
+
+# Seconds an answer is kept for, short enough that a long watch session notices hosts moving
+DEFAULT_DNS_TTL = 300.0
+
+
+class DnsCache(object):
+    """
+    Thread-safe cache of the addresses of each host, kept for a limited time.
+
+    Only the connections of the link check engine use it. Nothing else in the process, such as git or the GitHub API,
+    has its lookups cached.
+    """
+
+    def __init__(self, ttl=DEFAULT_DNS_TTL):
+        """
+        Args:
+            ttl: Seconds to keep the addresses of a host for
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._addresses = {}
+
+    def addresses(self, host, port, family=socket.AF_UNSPEC):
+        """
+        Returns:
+            The addresses to connect to the host on, in the order the resolver gave them
+
+        Raises:
+            OSError: if the host can't be resolved, which is never cached
+        """
+        key = (host, port, family)
+        with self._lock:
+            entry = self._addresses.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        infos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._addresses[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host):
+        """
+        Drops the addresses of a host, e.g. after none of them could be connected to.
+        """
+        with self._lock:
+            for key in [key for key in self._addresses if key[0] == host]:
+                del self._addresses[key]
+
+
+def cached_dns_adapter(dns_cache, **kwargs):
+    """
+    Args:
+        dns_cache: The cache to look up the address of each host in
+        kwargs: Passed on to requests' HTTPAdapter
+
+    Returns:
+        An adapter for a requests session whose new connections look up their host in the cache
+    """
+    # requests and urllib3 are only imported once a link has to be requested, as they are slow to import
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+    from urllib3.util.connection import allowed_gai_family
+
+    class CachedDnsConnection(object):
+        def _new_conn(self):
+            host = self._dns_host
+            try:
+                addresses = dns_cache.addresses(host, self.port, allowed_gai_family())
+            except OSError:
+                addresses = []
+            if not addresses:
+                # Looked up again by urllib3, which reports the failure in its usual way
+                return super(CachedDnsConnection, self)._new_conn()
+            error = None
+            for address in addresses:
+                # The host is still used for the Host header, SNI and checking the certificate
+                self._dns_host = address
+                try:
+                    return super(CachedDnsConnection, self)._new_conn()
+                except (ConnectTimeoutError, NewConnectionError) as e:
+                    error = e
+                finally:
+                    self._dns_host = host
+            dns_cache.forget(host)
+            raise error
+
+    class CachedDnsHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = type("CachedDnsHTTPConnection", (CachedDnsConnection, HTTPConnection), {})
+
+    class CachedDnsHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = type("CachedDnsHTTPSConnection", (CachedDnsConnection, HTTPSConnection), {})
+
+    class CachedDnsAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **pool_kwargs):
+            super(CachedDnsAdapter, self).init_poolmanager(*args, **pool_kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": CachedDnsHTTPConnectionPool,
+                "https": CachedDnsHTTPSConnectionPool,
+            }
+
+    return CachedDnsAdapter(**kwargs)
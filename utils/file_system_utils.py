@@ -2,6 +2,8 @@ import os
 import shutil
 import stat
 
+from utils.page import Page
+
 
 def rmtree_error(func, path, exc_info):
     try:
@@ -21,9 +23,11 @@ def delete_dir(directory):
 
 
 def find_files_with_extension(directory, extension):
-    matched_files = []
+    """
+    Yields:
+        The page for each file with the extension in the directory or below it, as it is found
+    """
     for root, dirs, files in os.walk(directory):
         for f in files:
             if f.endswith(".{}".format(extension)):
-                matched_files.append(os.path.join(root, f))
-    return matched_files
+                yield Page(os.path.join(root, f))
@@ -1,6 +1,63 @@
-global failed_url_string
+from utils.link_failures import LinkFailures
+from utils.link_registry import LinkRegistry
+from utils.run_profile import RunProfile
 
+global link_failures
+global link_registry
+global link_cache
+global link_engine
+global incremental_state
+global spelling_results
+global wiki_indexes
+global run_profile
+global issue_index
+global spelling_cache
+global link_scheduler
 
-def init():
-    global failed_url_string
-    failed_url_string = ""
+
+def init(
+    cache=None,
+    engine=None,
+    incremental=None,
+    failures=None,
+    profile=None,
+    issues=None,
+    spelling=None,
+    scheduler=None,
+):
+    """
+    Args:
+        cache: Persistent link cache shared by all pages in the run, or None to always check links over the network
+        engine: HTTP engine shared by all pages in the run
+        incremental: State of the previous run to reuse results of unchanged pages from, or None to check all pages
+        failures: Collection of link failures for the run, an in memory one is created if None
+        profile: Profile recording where the time in the run goes, a new one is created if None
+        issues: Index of the issues in the organisation's repositories, or None to not check links to issues
+        spelling: Persistent cache of the spelling of each paragraph, or None to check the spelling of whole pages
+        scheduler: Scheduler to queue external links with, to be checked after the page tests in order of priority,
+            or None to check them as each page is tested
+    """
+    global link_failures
+    global link_registry
+    global link_cache
+    global link_engine
+    global incremental_state
+    global spelling_results
+    global wiki_indexes
+    global run_profile
+    global issue_index
+    global spelling_cache
+    global link_scheduler
+    link_failures = failures if failures is not None else LinkFailures()
+    link_registry = LinkRegistry()
+    link_cache = cache
+    link_engine = engine
+    incremental_state = incremental
+    # Misspelled words (or the error raised) for each page whose spelling was checked ahead of its test
+    spelling_results = {}
+    # Index of the pages, files and anchors of each wiki, by wiki directory
+    wiki_indexes = {}
+    run_profile = profile if profile is not None else RunProfile()
+    issue_index = issues
+    spelling_cache = spelling
+    link_scheduler = scheduler
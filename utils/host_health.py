@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+
+# After this many failed requests in a row to a host, the rest of its links fail straight away
+DEFAULT_FAILURE_THRESHOLD = 5
+# How long a host is left alone before one request is let through to see if it has come back
+DEFAULT_COOLDOWN = 300.0
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+# Rate limited requests are only retried if the server asks us to wait less than this, in seconds
+MAX_RETRY_AFTER = 30.0
+
+HTTP_TOO_MANY_REQUESTS = 429
+# Responses which mean the server is briefly unable to answer, rather than that the link is broken
+TRANSIENT_STATUSES = {HTTP_TOO_MANY_REQUESTS, 502, 503, 504}
+
+
+class HostUnavailableError(Exception):
+    """
+    Raised instead of making a request to a host which has failed too many times in a row.
+    """
+
+
+def is_transient_error(error):
+    """
+    Returns:
+        True if the exception from a request may not happen if the request is tried again
+    """
+    import requests
+
+    if isinstance(error, requests.exceptions.SSLError):
+        return False
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def retry_after(response):
+    """
+    Returns:
+        The number of seconds the response asks the client to wait before trying again, or None if it doesn't say
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils
+
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Host(object):
+    def __init__(self):
+        self.consecutive_failures = 0
+        self.open_until = None
+        self.trial_in_progress = False
+        self.not_before = 0.0
+
+
+class HostHealth(object):
+    """
+    Thread-safe record of how each host has been responding, acting as a circuit breaker.
+
+    Once a host has failed too many requests in a row its circuit opens, and requests to it fail straight away with
+    one clear error. After a cooldown a single request is let through, which closes the circuit again if it works.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        cooldown=DEFAULT_COOLDOWN,
+        backoff=DEFAULT_BACKOFF,
+    ):
+        """
+        Args:
+            failure_threshold: Number of failed requests in a row which opens the circuit for a host
+            cooldown: Seconds before a request is let through to a host whose circuit is open
+            backoff: Seconds to wait before the first retry of a failed request, doubling for each retry after that
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = _Host()
+        return self._hosts[host]
+
+    def before_request(self, host):
+        """
+        Finds out whether the host can be sent a request yet. The request may only be sent once this returns 0.
+
+        Returns:
+            The number of seconds to wait before asking again, e.g. while the host is rate limiting us
+
+        Raises:
+            HostUnavailableError: if the circuit for the host is open
+        """
+        with self._lock:
+            state = self._host(host)
+            now = time.monotonic()
+            if state.open_until is not None and (now < state.open_until or state.trial_in_progress):
+                raise HostUnavailableError(
+                    "Skipped links to {} after {} failed requests in a row".format(
+                        host, self.failure_threshold
+                    )
+                )
+            wait = state.not_before - now
+            if wait > 0:
+                return wait
+            if state.open_until is not None:
+                # The cooldown is over, so this request is the one let through to see if the host has come back
+                state.trial_in_progress = True
+            return 0
+
+    def reset(self):
+        """
+        Forgets how every host has been responding, e.g. before checking the pages of a watch session again.
+        """
+        with self._lock:
+            self._hosts = {}
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._host(host)
+            state.consecutive_failures = 0
+            state.open_until = None
+            state.trial_in_progress = False
+
+    def record_failure(self, host):
+        """
+        Returns:
+            True if the host has now failed too many times in a row to be tried again
+        """
+        with self._lock:
+            state = self._host(host)
+            state.consecutive_failures += 1
+            state.trial_in_progress = False
+            if state.consecutive_failures >= self.failure_threshold:
+                state.open_until = time.monotonic() + self.cooldown
+                return True
+            return False
+
+    def delay(self, host, seconds):
+        """
+        Holds back every request to the host for the given number of seconds, e.g. when it is rate limiting us.
+        """
+        with self._lock:
+            state = self._host(host)
+            state.not_before = max(state.not_before, time.monotonic() + seconds)
+
+    def backoff_delay(self, attempt):
+        """
+        Returns:
+            The number of seconds to wait before retrying a request for the given time, with random jitter so that
+            requests which failed together are not all retried at the same moment
+        """
+        return self.backoff * (2**attempt) * random.uniform(0.5, 1.5)
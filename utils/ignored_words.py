@@ -2,7 +2,8 @@ def get_ignored_words():
     # We're finding it easier to work with ignored words ourselves rather than using Enchant's in-built
     with open("words.txt", "r", encoding="utf-8") as f:
         words = f.read().split()
-    return sorted(set([x.lower() for x in words]))
+    # A set so that checking whether each word is ignored doesn't scan the whole list
+    return frozenset(x.lower() for x in words)
 
 
 def get_ignored_urls():
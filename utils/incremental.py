@@ -0,0 +1,247 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import utils.global_vars
+
+DEFAULT_INCREMENTAL_STATE_PATH = os.path.join(os.getcwd(), "incremental-state.json")
+# If any of these change, every previous result may be out of date
+CHECK_INPUT_FILES = ["words.txt", "ignored_urls.txt"]
+
+
+def fingerprint_check_inputs():
+    digest = hashlib.sha1()
+    for file_name in CHECK_INPUT_FILES:
+        try:
+            with open(file_name, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def fingerprint_ignored_items(ignored_items):
+    """
+    Returns:
+        A hash of the words and URLs ignored on a wiki, once its own lists have been added to the shared ones, or None
+        if it has none
+    """
+    if ignored_items is None:
+        return None
+    digest = hashlib.sha1()
+    digest.update(json.dumps(sorted(ignored_items["WORDS"])).encode("utf-8"))
+    digest.update(json.dumps(list(ignored_items["URLS"])).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IncrementalState(object):
+    """
+    Remembers the last checked commit of each wiki and the result of every test on every page, so that pages that
+    have not changed since the last run can reuse their previous results.
+    """
+
+    def __init__(self, path=DEFAULT_INCREMENTAL_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._commits = {}
+        self._results = {}
+        self._reusable_pages = set()
+        self._pending_commits = {}
+        # The ignore lists of each wiki when it was last checked, as they can be changed in the wiki config
+        self._wiki_inputs = {}
+        self._pending_wiki_inputs = {}
+        self._inputs = fingerprint_check_inputs()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(
+                "Unable to read incremental state {}, checking all pages: {}".format(self.path, e)
+            )
+            return
+        # Results from a run with a different word list or URL ignore list can't be trusted
+        if state.get("inputs") == self._inputs:
+            self._commits = state.get("commits", {})
+            self._results = state.get("results", {})
+            self._wiki_inputs = state.get("wiki_inputs", {})
+
+    def save(self):
+        with self._lock:
+            state = {
+                "inputs": self._inputs,
+                "wiki_inputs": self._wiki_inputs,
+                "commits": self._commits,
+                "results": self._results,
+            }
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=1, sort_keys=True)
+        except OSError as e:
+            print("Unable to write incremental state {}: {}".format(self.path, e))
+
+    @staticmethod
+    def _key(page):
+        return os.path.relpath(page, os.getcwd()).replace("\\", "/")
+
+    def plan(self, wiki_name, wiki_dir, pages, ignored_items=None):
+        """
+        Works out which pages of a freshly updated wiki can reuse their previous results. A page is checked again if
+        it changed since the last checked commit, or if it mentions a page or file that changed. Every page is checked
+        again if the wiki's ignored words or URLs changed.
+
+        Args:
+            wiki_name: The name of the wiki
+            wiki_dir: The folder the wiki is cloned in
+            pages: The pages of the wiki
+            ignored_items: The words and URLs ignored on the wiki, as given in its config
+
+        Returns:
+            The number of pages that will be checked again
+        """
+        # GitPython is slow to import, so it is only imported by the runs which need it
+        import git
+
+        repo = git.Repo(wiki_dir)
+        head = repo.head.commit.hexsha
+        last = self._commits.get(wiki_name)
+        self._pending_commits[wiki_name] = head
+        inputs = fingerprint_ignored_items(ignored_items)
+        self._pending_wiki_inputs[wiki_name] = inputs
+
+        wiki_prefix = self._key(wiki_dir) + "/"
+        page_keys = {self._key(page): page for page in pages}
+        with self._lock:
+            for key in [key for key in self._results if key.startswith(wiki_prefix)]:
+                if key not in page_keys:
+                    del self._results[key]
+
+        try:
+            changed_files = (
+                repo.git.diff("--name-only", "--no-renames", last, head).splitlines()
+                if last is not None
+                else None
+            )
+        except git.GitCommandError:
+            changed_files = None
+        if changed_files is None:
+            print("No previous results for {}, checking all pages".format(wiki_name))
+            return len(pages)
+        if self._wiki_inputs.get(wiki_name) != inputs:
+            print("The ignored words or URLs of {} changed, checking all pages".format(wiki_name))
+            return len(pages)
+
+        changed_names = set()
+        for changed_file in changed_files:
+            changed_names.add(changed_file.lower())
+            changed_names.add(os.path.splitext(os.path.basename(changed_file))[0].lower())
+        changed_names.discard("")
+
+        to_check = 0
+        for key, page in page_keys.items():
+            relative_path = key[len(wiki_prefix) :]
+            if relative_path in changed_files or key not in self._results:
+                to_check += 1
+                continue
+            with open(page, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read().lower()
+            if any(name in text for name in changed_names):
+                to_check += 1
+            else:
+                self._reusable_pages.add(key)
+        print(
+            "{} of {} pages in {} changed or link to changed files since {}".format(
+                to_check, len(pages), wiki_name, last[:7]
+            )
+        )
+        return to_check
+
+    def finish(self, wiki_name):
+        """
+        Marks the commit planned for the wiki as checked.
+        """
+        if wiki_name in self._pending_commits:
+            self._commits[wiki_name] = self._pending_commits.pop(wiki_name)
+            self._wiki_inputs[wiki_name] = self._pending_wiki_inputs.pop(wiki_name)
+
+    def previous_result(self, page, test_name):
+        """
+        Returns:
+            A tuple of whether a reusable result exists and, if it does, its failure message (None if it passed)
+        """
+        key = self._key(page)
+        with self._lock:
+            if key not in self._reusable_pages or test_name not in self._results.get(key, {}):
+                return False, None
+            return True, self._results[key][test_name]
+
+    def record(self, page, test_name, failure):
+        with self._lock:
+            self._results.setdefault(self._key(page), {})[test_name] = failure
+
+
+def reuse_previous_result(test_method):
+    """
+    Decorator for page tests which, in incremental mode, replays the previous result of the test for pages that have
+    not changed, and records the result of the test otherwise.
+    """
+
+    @functools.wraps(test_method)
+    def wrapper(self):
+        state = utils.global_vars.incremental_state
+        if state is None:
+            return test_method(self)
+        found, failure = state.previous_result(self.page, test_method.__name__)
+        if found:
+            if failure:
+                self.fail(failure)
+            return
+        try:
+            test_method(self)
+        except AssertionError as e:
+            state.record(self.page, test_method.__name__, str(e))
+            raise
+        state.record(self.page, test_method.__name__, None)
+
+    return wrapper
+
+
+def reuse_previous_internal_result(test_method):
+    """
+    Decorator for the link test which, in incremental mode, replays the previous result of the links within the
+    wikis for pages that have not changed, and records the result of the test otherwise.
+
+    The test still runs on unchanged pages, with reusing_previous_result set, so that their external links are
+    checked again: those can break without the page changing. Their failures go to the link failure summary rather
+    than the result of the test.
+    """
+
+    @functools.wraps(test_method)
+    def wrapper(self):
+        state = utils.global_vars.incremental_state
+        if state is None:
+            return test_method(self)
+        found, failure = state.previous_result(self.page, test_method.__name__)
+        if found:
+            self.reusing_previous_result = True
+            try:
+                test_method(self)
+            finally:
+                self.reusing_previous_result = False
+            if failure:
+                self.fail(failure)
+            return
+        try:
+            test_method(self)
+        except AssertionError as e:
+            state.record(self.page, test_method.__name__, str(e))
+            raise
+        state.record(self.page, test_method.__name__, None)
+
+    return wrapper
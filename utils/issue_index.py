@@ -0,0 +1,330 @@
+import datetime
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_ISSUE_INDEX_PATH = os.path.join(os.getcwd(), "issue-index.json")
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_ORGANISATION = "ISISComputingGroup"
+# New issues are picked up by a cheap refresh of the ones updated since the last one, but issues that were deleted or
+# transferred to another repository only disappear when the whole list is fetched again
+DEFAULT_REFRESH_HOURS = 1.0
+DEFAULT_FULL_REFRESH_HOURS = 24.0 * 7
+
+ISSUE_LINK = re.compile(r"github\.com/{}/([^/]+)/issues/(\d+)".format(GITHUB_ORGANISATION), re.I)
+
+HTTP_NOT_FOUND = 404
+HTTP_FORBIDDEN = 403
+HTTP_TOO_MANY_REQUESTS = 429
+ISSUES_PER_PAGE = 100
+# Requests left unused when GitHub's rate limit is nearly reached, for the quick refreshes of other repositories
+RATE_LIMIT_RESERVE = 10
+
+
+def find_issue_link(url):
+    """
+    Returns:
+        The repository and issue number a URL links to, or None if it is not a link to an issue in the organisation
+    """
+    match = ISSUE_LINK.search(url)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+class RateLimitedError(Exception):
+    """
+    Raised instead of asking GitHub for more than its rate limit leaves for this run.
+    """
+
+
+class IssueIndex(object):
+    """
+    The numbers of the issues in each of the organisation's repositories, kept between runs in a JSON file.
+
+    Each repository is refreshed at most once a run, the first time a link to one of its issues is checked, by paging
+    through the issues that changed since the last refresh. If GitHub can't be reached the cached numbers are used.
+
+    Fetching every issue of a large repository can take more requests than GitHub's rate limit allows in a run
+    without a token. The fetch then stops short of the limit and carries on from where it got to in the next run.
+    Until a repository's issues have all been fetched, links to its issues are only checked against its highest
+    issue number.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_ISSUE_INDEX_PATH,
+        refresh_hours=DEFAULT_REFRESH_HOURS,
+        full_refresh_hours=DEFAULT_FULL_REFRESH_HOURS,
+        api_url=GITHUB_API_URL,
+        offline=False,
+    ):
+        """
+        Args:
+            path: Location of the JSON file to keep the issue numbers in, or None to only keep them in memory
+            refresh_hours: How long the issue numbers of a repository are trusted without asking GitHub for new ones
+            full_refresh_hours: How long before all the issues of a repository are fetched again, to find ones that
+                have been deleted or transferred
+            api_url: The GitHub API to ask
+            offline: If True, never ask GitHub and only use the cached issue numbers
+        """
+        self.path = path
+        self.refresh_ttl = refresh_hours * 3600
+        self.full_refresh_ttl = full_refresh_hours * 3600
+        self.api_url = api_url.rstrip("/")
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._repo_locks = {}
+        self._refreshed = set()
+        self._repos = {}
+        self._rate_limit_remaining = None
+        self._rate_limit_reset = 0.0
+        self._load()
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                repos = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Unable to read issue index {}: {}".format(self.path, e))
+            return
+        for repo, entry in repos.items():
+            entry["numbers"] = set(entry["numbers"])
+            # Indexes saved before fetches could be resumed were only ever saved once complete
+            entry.setdefault("complete", True)
+            entry.setdefault("top", None)
+            entry.setdefault("full_fetch", None)
+            if entry["full_fetch"] is not None:
+                entry["full_fetch"]["numbers"] = set(entry["full_fetch"]["numbers"])
+            self._repos[repo] = entry
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            repos = {}
+            for repo, entry in self._repos.items():
+                full_fetch = entry["full_fetch"]
+                if full_fetch is not None:
+                    full_fetch = dict(full_fetch, numbers=sorted(full_fetch["numbers"]))
+                repos[repo] = dict(entry, numbers=sorted(entry["numbers"]), full_fetch=full_fetch)
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(repos, f, sort_keys=True)
+        except OSError as e:
+            print("Unable to write issue index {}: {}".format(self.path, e))
+
+    def _get(self, url, params=None, reserve=0):
+        """
+        Makes one request to the GitHub API, keeping track of how much of the rate limit is left.
+
+        Args:
+            reserve: The number of requests the rate limit has to have left over after this one
+
+        Raises:
+            RateLimitedError: if the rate limit has been reached, or would leave less than the reserve
+        """
+        import requests
+
+        with self._lock:
+            if self._rate_limit_remaining is not None and (
+                self._rate_limit_remaining <= reserve and time.time() < self._rate_limit_reset
+            ):
+                raise RateLimitedError()
+        headers = {"Accept": "application/vnd.github+json"}
+        token = os.environ.get("GITHUB_TOKEN")
+        if token:
+            headers["Authorization"] = "Bearer {}".format(token)
+        response = requests.get(url, params=params, headers=headers, timeout=10)
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is not None:
+            with self._lock:
+                self._rate_limit_remaining = int(remaining)
+                self._rate_limit_reset = float(response.headers.get("X-RateLimit-Reset", 0))
+        if response.status_code in (HTTP_FORBIDDEN, HTTP_TOO_MANY_REQUESTS) and remaining == "0":
+            raise RateLimitedError()
+        return response
+
+    def _issues_url(self, repo):
+        return "{}/repos/{}/{}/issues".format(self.api_url, GITHUB_ORGANISATION, repo)
+
+    def _get_pages(self, url, params, reserve=0):
+        """
+        Yields each page of issues, following GitHub's pagination, with the URL of the page after it (None for the
+        last page).
+        """
+        while url is not None:
+            response = self._get(url, params, reserve)
+            if response.status_code == HTTP_NOT_FOUND:
+                yield response, None
+                return
+            response.raise_for_status()
+            # The link to the next page already has the query parameters in it
+            next_url = response.links.get("next", {}).get("url")
+            yield response, next_url
+            url, params = next_url, None
+
+    def _fetch_updated(self, entry, repo):
+        """
+        Adds the issues updated since the last refresh of a complete index to it.
+        """
+        started = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        numbers = set()
+        params = {"state": "all", "per_page": ISSUES_PER_PAGE, "since": entry["since"]}
+        for response, _ in self._get_pages(self._issues_url(repo), params):
+            if response.status_code == HTTP_NOT_FOUND:
+                entry.update(exists=False, numbers=set(), full_fetch=None)
+                return
+            numbers.update(issue["number"] for issue in response.json())
+        with self._lock:
+            entry["numbers"] |= numbers
+            if entry["full_fetch"] is not None:
+                # Issues created after a fetch of every issue started are missed by it
+                entry["full_fetch"]["numbers"] |= numbers
+            entry["since"] = started
+
+    def _fetch_top(self, entry, repo):
+        """
+        Finds the highest issue number, the newest issue being listed first.
+        """
+        response = self._get(self._issues_url(repo), {"state": "all", "per_page": 1})
+        if response.status_code == HTTP_NOT_FOUND:
+            entry.update(exists=False, complete=True, numbers=set(), full_fetch=None)
+            return
+        response.raise_for_status()
+        issues = response.json()
+        if not entry["exists"]:
+            # The repository has been created since it was last looked for
+            entry.update(exists=True, complete=False, numbers=set())
+        entry["top"] = issues[0]["number"] if issues else 0
+
+    def _fetch_all(self, entry, repo):
+        """
+        Fetches every issue of the repository, carrying on from where an earlier run got to. Progress is kept in the
+        entry after every page, so nothing fetched is lost if the rate limit is reached.
+        """
+        full_fetch = entry["full_fetch"]
+        if full_fetch is None:
+            full_fetch = entry["full_fetch"] = {
+                "numbers": set(),
+                "next_url": None,
+                "started": datetime.datetime.now(datetime.timezone.utc).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                ),
+                "started_at": time.time(),
+            }
+            url, params = self._issues_url(repo), {"state": "all", "per_page": ISSUES_PER_PAGE}
+        else:
+            url, params = full_fetch["next_url"], None
+        for response, next_url in self._get_pages(url, params, RATE_LIMIT_RESERVE):
+            if response.status_code == HTTP_NOT_FOUND:
+                entry.update(exists=False, complete=True, numbers=set(), full_fetch=None)
+                return
+            with self._lock:
+                full_fetch["numbers"].update(issue["number"] for issue in response.json())
+                full_fetch["next_url"] = next_url
+        with self._lock:
+            entry.update(
+                exists=True,
+                complete=True,
+                numbers=full_fetch["numbers"],
+                # Issues updated while the fetch was spread over several runs are found by the next refresh
+                since=full_fetch["started"],
+                full_refreshed_at=full_fetch["started_at"],
+                full_fetch=None,
+            )
+
+    def _refresh(self, key, repo):
+        import requests
+
+        now = time.time()
+        with self._lock:
+            entry = self._repos.get(key)
+            if entry is None:
+                entry = self._repos[key] = {
+                    "exists": True,
+                    "numbers": set(),
+                    "complete": False,
+                    "top": None,
+                    "since": None,
+                    "refreshed_at": 0.0,
+                    "full_refreshed_at": 0.0,
+                    "full_fetch": None,
+                }
+        if (
+            entry["complete"]
+            and entry["full_fetch"] is None
+            and now - entry["refreshed_at"] < self.refresh_ttl
+        ):
+            return
+        try:
+            if entry["complete"] and entry["exists"]:
+                self._fetch_updated(entry, repo)
+            else:
+                self._fetch_top(entry, repo)
+            if entry["exists"] and (
+                not entry["complete"]
+                or entry["full_fetch"] is not None
+                or now - entry["full_refreshed_at"] >= self.full_refresh_ttl
+            ):
+                self._fetch_all(entry, repo)
+        except RateLimitedError:
+            full_fetch = entry["full_fetch"]
+            print(
+                "GitHub's rate limit was reached while fetching the issues of {}, {} issues were fetched and the rest "
+                "will be fetched next run.{}".format(
+                    repo,
+                    len(full_fetch["numbers"]) if full_fetch is not None else 0,
+                    ""
+                    if os.environ.get("GITHUB_TOKEN")
+                    else " Set GITHUB_TOKEN for a higher limit.",
+                )
+            )
+            return
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print("Unable to refresh the issues of {}, using the cached ones: {}".format(repo, e))
+            return
+        entry["refreshed_at"] = now
+
+    def _ensure_refreshed(self, key, repo):
+        with self._lock:
+            repo_lock = self._repo_locks.setdefault(key, threading.Lock())
+        # Links to the same repository checked at the same time wait for one refresh rather than starting their own
+        with repo_lock:
+            if key in self._refreshed or self.offline:
+                return
+            self._refresh(key, repo)
+            self._refreshed.add(key)
+
+    def check(self, repo, number):
+        """
+        Args:
+            repo: The name of a repository in the organisation
+            number: The number of an issue in the repository
+
+        Returns:
+            A description of the problem if the issue does not exist, else None. Issues in repositories that have
+            never been fetched can't be checked, so they are assumed to exist, and until every issue of a repository
+            has been fetched only issues above its highest issue number are known not to exist.
+        """
+        # GitHub repository names are not case sensitive
+        key = repo.lower()
+        self._ensure_refreshed(key, repo)
+        with self._lock:
+            entry = self._repos.get(key)
+        if entry is None:
+            return None
+        if not entry["exists"]:
+            return "Could not find {} repository for issue {}".format(repo, number)
+        if entry["complete"]:
+            known = number in entry["numbers"]
+        else:
+            top = entry["top"]
+            known = top is None or number <= top
+        if not known:
+            return "Invalid {} issue number: {}".format(repo, number)
+        return None
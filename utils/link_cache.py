@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_LINK_CACHE_PATH = os.path.join(os.getcwd(), "link-cache.sqlite")
+# Successful links rarely break, so they can be trusted for longer than failures which may be transient
+DEFAULT_SUCCESS_TTL_HOURS = 24.0
+DEFAULT_FAILURE_TTL_HOURS = 1.0
+
+HTTP_NOT_MODIFIED = 304
+
+CachedLink = namedtuple(
+    "CachedLink", ["url", "status", "redirect", "etag", "last_modified", "failure", "checked_at"]
+)
+
+
+class LinkCache(object):
+    """
+    Persistent store of link check outcomes, kept between runs in a SQLite database.
+
+    Entries are loaded into memory when the cache is opened and written back when it is saved, so lookups during
+    a run never touch the disk.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_LINK_CACHE_PATH,
+        success_ttl_hours=DEFAULT_SUCCESS_TTL_HOURS,
+        failure_ttl_hours=DEFAULT_FAILURE_TTL_HOURS,
+    ):
+        """
+        Args:
+            path: Location of the SQLite database, created if it does not exist
+            success_ttl_hours: How long a link that worked is trusted without checking it again
+            failure_ttl_hours: How long a link that failed is trusted without checking it again
+        """
+        self.path = path
+        self.success_ttl = success_ttl_hours * 3600
+        self.failure_ttl = failure_ttl_hours * 3600
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = set()
+        self._load()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS links (url TEXT PRIMARY KEY, status INTEGER, redirect TEXT, etag TEXT, "
+            "last_modified TEXT, failure TEXT, checked_at REAL)"
+        )
+        return connection
+
+    def _load(self):
+        try:
+            with self._connect() as connection:
+                for row in connection.execute("SELECT * FROM links"):
+                    entry = CachedLink(*row)
+                    self._entries[entry.url] = entry
+        except sqlite3.Error as e:
+            print(
+                "Unable to read link cache {}, starting with an empty cache: {}".format(
+                    self.path, e
+                )
+            )
+
+    def save(self):
+        with self._lock:
+            entries = [self._entries[url] for url in self._dirty]
+            self._dirty.clear()
+        if not entries:
+            return
+        try:
+            with self._connect() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?, ?, ?)", entries
+                )
+        except sqlite3.Error as e:
+            print("Unable to write link cache {}: {}".format(self.path, e))
+
+    def get(self, url):
+        """
+        Returns:
+            The cached entry for the URL, or None if it has never been checked
+        """
+        with self._lock:
+            return self._entries.get(url)
+
+    def is_fresh(self, entry):
+        ttl = self.failure_ttl if entry.failure else self.success_ttl
+        return time.time() - entry.checked_at < ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Returns:
+            Headers asking the server to reply "304 Not Modified" if the link is unchanged since it was cached
+        """
+        headers = {}
+        if entry is not None and not entry.failure:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url, failure, response=None):
+        """
+        Args:
+            url: The URL that was checked
+            failure: The failure message for the URL, or None if it worked
+            response: The response received for the URL, if there was one
+        """
+        if response is not None and response.status_code == HTTP_NOT_MODIFIED:
+            cached = self.get(url)
+            if cached is not None:
+                self._put(cached._replace(checked_at=time.time()))
+                return
+        headers = response.headers if response is not None else {}
+        self._put(
+            CachedLink(
+                url=url,
+                status=response.status_code if response is not None else None,
+                redirect=headers.get("Location"),
+                etag=headers.get("ETag"),
+                last_modified=headers.get("Last-Modified"),
+                failure=failure,
+                checked_at=time.time(),
+            )
+        )
+
+    def _put(self, entry):
+        with self._lock:
+            self._entries[entry.url] = entry
+            self._dirty.add(entry.url)
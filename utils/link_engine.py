@@ -0,0 +1,383 @@
+import concurrent.futures
+import threading
+import time
+from urllib.parse import urlsplit
+
+from utils.dns_cache import DnsCache, cached_dns_adapter
+from utils.host_health import (
+    DEFAULT_RETRIES,
+    HTTP_TOO_MANY_REQUESTS,
+    MAX_RETRY_AFTER,
+    TRANSIENT_STATUSES,
+    HostHealth,
+    is_transient_error,
+    retry_after,
+)
+
+DEFAULT_MAX_CONNECTIONS = 32
+# Keep well below the point where hosts like github.com start refusing or rate limiting us
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 4
+DEFAULT_TIMEOUT = 5
+
+# Some websites don't respond correctly with the default requests user agent, so the firefox user agent
+# is being used instead
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:97.0) Gecko/20100101 Firefox/97.0"
+
+# Responses to a HEAD request from servers which may only refuse HEAD, rather than the link being broken
+HEAD_REJECTED_STATUSES = {400, 403, 404, 405, 501}
+HTTP_RANGE_NOT_SATISFIABLE = 416
+# Asks for only the first byte of the body, which is never read anyway
+FIRST_BYTE_RANGE = "bytes=0-0"
+HEAD_PROBE = "HEAD"
+GET_PROBE = "GET"
+
+
+class RetryLaterError(Exception):
+    """
+    Raised by a request made in one of the engine's tasks which has to wait before it is tried again. The task gives
+    up its worker and is run again after the delay, rather than the worker sleeping.
+    """
+
+    def __init__(self, delay):
+        super(RetryLaterError, self).__init__(delay)
+        self.delay = delay
+
+
+class DeadlineExceededError(Exception):
+    """
+    Raised instead of sending a request, or waiting to send one, which might not finish before its task's deadline.
+    """
+
+
+class _TaskState(object):
+    """
+    What the requests of one task have done so far, kept while the task waits to be run again.
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        # The number of attempts made at each request, and the final response of each request that got one
+        self.attempts = {}
+        self.responses = {}
+
+
+class _HostProbes(object):
+    """
+    What has been seen of how a host answers HEAD requests. Each flag only ever goes from False to True, so the
+    outcome doesn't depend on the order in which links to the host happen to be checked.
+    """
+
+    def __init__(self):
+        # HEAD got an answer which wasn't a refusal
+        self.head_works = False
+        # HEAD was refused for a link which the GET then found to work
+        self.head_refused_wrongly = False
+        # HEAD was refused for a link which the GET then found to be broken too
+        self.refusal_confirmed = False
+
+    def head_refusal_is_final(self):
+        """
+        Returns:
+            True if a refused HEAD can be taken as a broken link without asking again with a GET
+        """
+        return self.head_works and self.refusal_confirmed and not self.head_refused_wrongly
+
+
+def get_host(url):
+    """
+    Returns:
+        The lower case host name of the URL, or the URL itself if it does not have one
+    """
+    try:
+        return urlsplit(url).hostname or url
+    except ValueError:
+        return url
+
+
+class LinkCheckEngine(object):
+    """
+    Run-wide HTTP engine for link checking.
+
+    One bounded thread pool and one keep-alive session are shared by every page. The number of requests in flight
+    is capped both globally and for each host, and the engine's own connections cache DNS lookups for a few
+    minutes. Requests which fail in a way that may be transient are retried, and hosts which keep failing are given
+    up on. A task which has to wait before retrying gives its worker back and is run again after the wait, with the
+    requests it already finished remembered, so waiting never holds up other links. A task can be given a deadline,
+    which none of its requests, retries or waits are allowed to run past.
+
+    Links are checked with a HEAD request, falling back to a GET of only the first byte for servers which refuse
+    HEAD. Which of the two works is remembered for each host, so each link is normally only requested once.
+    """
+
+    def __init__(
+        self,
+        max_connections=DEFAULT_MAX_CONNECTIONS,
+        max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+        timeout=DEFAULT_TIMEOUT,
+        profile=None,
+        retries=DEFAULT_RETRIES,
+        host_health=None,
+        offline=False,
+    ):
+        """
+        Args:
+            max_connections: Maximum number of requests in flight at once
+            max_connections_per_host: Maximum number of requests in flight at once to any one host
+            timeout: Seconds to wait for a response
+            profile: Run profile to record the latency of every request in, if any
+            retries: Number of times to retry a request which timed out, could not connect or was rate limited
+            host_health: Circuit breaker tracking how each host is responding, a default one is created if None
+            offline: If True, links are never requested and can only be checked against the link cache
+        """
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.profile = profile
+        self.retries = retries
+        self.host_health = host_health if host_health is not None else HostHealth()
+        self.offline = offline
+        self.max_connections = max_connections
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_connections)
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+        # What has been seen of how each host answers HEAD
+        self._host_probes = {}
+        self.dns_cache = DnsCache()
+        # The state of the task each worker thread is running
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """
+        The keep-alive session, created on first use so that requests is only imported by runs which make requests.
+        """
+        with self._session_lock:
+            if self._session is None:
+                import requests
+
+                self._session = requests.Session()
+                self._session.headers = {"User-Agent": USER_AGENT}
+                adapter = cached_dns_adapter(
+                    self.dns_cache,
+                    pool_connections=self.max_connections,
+                    pool_maxsize=self.max_connections_per_host,
+                )
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    def _host_limit(self, url):
+        host = get_host(url)
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            return self._host_limits[host]
+
+    def submit(self, function, *args, deadline=None):
+        """
+        Runs a function on the engine's workers. If a request it makes has to wait before being retried, the function
+        is run again from the start once the wait is over, skipping the requests that already finished.
+
+        Args:
+            function: The function to run
+            args: The arguments to call it with
+            deadline: time.monotonic() by which every request the function makes has to have finished, even if it
+                times out. Requests, retries and waits that could run past it raise DeadlineExceededError instead.
+
+        Returns:
+            A future for the function's result
+        """
+        result = concurrent.futures.Future()
+        state = _TaskState(deadline)
+
+        def run():
+            self._local.task = state
+            try:
+                value = function(*args)
+            except RetryLaterError as e:
+                timer = threading.Timer(e.delay, resubmit)
+                timer.daemon = True
+                timer.start()
+            except BaseException as e:
+                result.set_exception(e)
+            else:
+                result.set_result(value)
+            finally:
+                self._local.task = None
+
+        def resubmit():
+            try:
+                self.executor.submit(run)
+            except RuntimeError as e:
+                # The engine was closed while the task was waiting
+                result.set_exception(e)
+
+        self.executor.submit(run)
+        return result
+
+    def _wait(self, key, attempt, seconds):
+        """
+        Waits before a request is tried again: by rescheduling the task making it, or by sleeping outside of tasks.
+
+        Args:
+            key: The request
+            attempt: The attempt the request is on after the wait
+            seconds: How long to wait
+        """
+        task = getattr(self._local, "task", None)
+        if task is None:
+            time.sleep(seconds)
+            return
+        if task.deadline is not None and time.monotonic() + seconds + self.timeout > task.deadline:
+            raise DeadlineExceededError(
+                "Waiting to retry {} would run past the deadline".format(key[1])
+            )
+        task.attempts[key] = attempt
+        raise RetryLaterError(seconds)
+
+    def _acquire_host(self, url):
+        """
+        Waits for a free connection to the host of the URL, giving up if the request could then run past the deadline
+        of the task making it.
+
+        Returns:
+            The host's semaphore, to be released once the request has finished
+        """
+        limit = self._host_limit(url)
+        task = getattr(self._local, "task", None)
+        if task is None or task.deadline is None:
+            limit.acquire()
+            return limit
+        # The request has to be able to time out before the deadline once it is sent
+        latest_start = task.deadline - self.timeout - time.monotonic()
+        if latest_start < 0 or not limit.acquire(timeout=latest_start):
+            raise DeadlineExceededError("Requesting {} could run past the deadline".format(url))
+        return limit
+
+    def _request_once(self, method, url, headers):
+        import requests
+
+        limit = self._acquire_host(url)
+        try:
+            start = time.perf_counter()
+            timed_out = False
+            try:
+                if method == HEAD_PROBE:
+                    return self.session.head(url, timeout=self.timeout, headers=headers)
+                # The body is never read, the connection is closed as soon as the status and headers have arrived.
+                # Redirects aren't followed, the same as for HEAD, so both probes judge a link in the same way.
+                response = self.session.get(
+                    url, timeout=self.timeout, headers=headers, stream=True, allow_redirects=False
+                )
+                response.close()
+                return response
+            except requests.exceptions.Timeout:
+                timed_out = True
+                raise
+            finally:
+                if self.profile is not None:
+                    self.profile.record_url(url, time.perf_counter() - start, timed_out)
+        finally:
+            limit.release()
+
+    def probe(self, url, headers=None):
+        """
+        Finds out whether a link works without downloading it.
+
+        A HEAD request is sent first. If the server refuses it, a GET of only the first byte is sent instead, unless
+        HEAD has worked for the host and a GET has already confirmed that its refusals there are real. Hosts which
+        have only been seen to wrongly refuse HEAD are sent the GET straight away.
+
+        Raises:
+            HostUnavailableError: if the host has failed too many requests in a row to be tried
+        """
+        probes = self._host_probes.setdefault(get_host(url), _HostProbes())
+        head_refused = False
+        if probes.head_works or not probes.head_refused_wrongly:
+            response = self.head(url, headers)
+            if response.status_code not in HEAD_REJECTED_STATUSES:
+                probes.head_works = True
+                return response
+            if probes.head_refusal_is_final():
+                return response
+            head_refused = True
+        response = self.get_first_byte(url, headers)
+        if response.status_code == HTTP_RANGE_NOT_SATISFIABLE:
+            # An empty file has no first byte, so ask again without a range, still without reading the body
+            response = self._request(GET_PROBE, url, headers)
+        if head_refused:
+            if response:
+                probes.head_refused_wrongly = True
+            else:
+                probes.refusal_confirmed = True
+        return response
+
+    def get_first_byte(self, url, headers=None):
+        """
+        Raises:
+            HostUnavailableError: if the host has failed too many requests in a row to be tried
+        """
+        return self._request(GET_PROBE, url, dict(headers or {}, Range=FIRST_BYTE_RANGE))
+
+    def head(self, url, headers=None):
+        """
+        Raises:
+            HostUnavailableError: if the host has failed too many requests in a row to be tried
+        """
+        return self._request(HEAD_PROBE, url, headers)
+
+    def _request(self, method, url, headers):
+        import requests
+
+        host = get_host(url)
+        key = (method, url, tuple(sorted((headers or {}).items())))
+        task = getattr(self._local, "task", None)
+        if task is not None and key in task.responses:
+            # Finished before the task had to wait for one of its other requests
+            return task.responses[key]
+        attempt = task.attempts.get(key, 0) if task is not None else 0
+        while True:
+            wait = self.host_health.before_request(host)
+            if wait > 0:
+                self._wait(key, attempt, wait)
+                continue
+            try:
+                response = self._request_once(method, url, headers)
+            except requests.exceptions.RequestException as e:
+                if not is_transient_error(e):
+                    # The host answered, or the request never got as far as the host
+                    self.host_health.record_success(host)
+                    raise
+                if self.host_health.record_failure(host) or attempt >= self.retries:
+                    raise
+                self._wait(key, attempt + 1, self.host_health.backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code not in TRANSIENT_STATUSES:
+                self.host_health.record_success(host)
+                break
+            if response.status_code == HTTP_TOO_MANY_REQUESTS:
+                # Being rate limited says nothing about whether the host is up, so it doesn't count as a failure
+                wait = retry_after(response)
+                if wait is None:
+                    wait = self.host_health.backoff_delay(attempt)
+                if attempt >= self.retries or wait > MAX_RETRY_AFTER:
+                    break
+                # Every request to the host waits, not just this one
+                self.host_health.delay(host, wait)
+                attempt += 1
+            else:
+                if self.host_health.record_failure(host) or attempt >= self.retries:
+                    break
+                self._wait(key, attempt + 1, self.host_health.backoff_delay(attempt))
+                attempt += 1
+        if task is not None:
+            task.responses[key] = response
+        return response
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self._session is not None:
+            self._session.close()
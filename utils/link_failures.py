@@ -0,0 +1,84 @@
+import json
+import threading
+
+from utils.link_engine import get_host
+
+
+class LinkFailures(object):
+    """
+    Thread-safe collection of link failures for the whole run, indexed by error, then host, then page.
+
+    Each failure is optionally written straight away as a JSON line so that other tools can consume failures without
+    parsing the log, while the human readable summary is only rendered once at the end.
+    """
+
+    def __init__(self, json_lines_path=None):
+        """
+        Args:
+            json_lines_path: File to stream failures to as JSON lines, or None to only keep them in memory
+        """
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._json_lines = (
+            open(json_lines_path, "w", encoding="utf-8") if json_lines_path is not None else None
+        )
+
+    def add(self, error, url, wiki_name, page_name):
+        """
+        Args:
+            error: error message received when trying to connect
+            url: the URL that could not be opened
+            wiki_name: the wiki the link is on
+            page_name: the page the link is on
+        """
+        error = error.strip()
+        host = get_host(url)
+        page = "{}/{}".format(wiki_name, page_name)
+        with self._lock:
+            self._failures.setdefault(error, {}).setdefault(host, {}).setdefault(page, []).append(
+                url
+            )
+            if self._json_lines is not None:
+                self._json_lines.write(
+                    json.dumps(
+                        {
+                            "error": error,
+                            "host": host,
+                            "wiki": wiki_name,
+                            "page": page_name,
+                            "url": url,
+                        }
+                    )
+                    + "\n"
+                )
+                self._json_lines.flush()
+
+    def __len__(self):
+        with self._lock:
+            return sum(
+                len(urls)
+                for hosts in self._failures.values()
+                for pages in hosts.values()
+                for urls in pages.values()
+            )
+
+    def render(self):
+        """
+        Returns:
+            A summary of every failure, grouped by error, listing the pages each failure was seen on
+        """
+        lines = []
+        with self._lock:
+            for error, hosts in self._failures.items():
+                lines.append(error)
+                lines.append("On the following pages:")
+                for pages in hosts.values():
+                    for page, urls in pages.items():
+                        lines.extend("  {}: {}".format(page, url) for url in urls)
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._json_lines is not None:
+                self._json_lines.close()
+                self._json_lines = None
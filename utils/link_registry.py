@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import Future
+
+from utils.link_engine import RetryLaterError
+
+
+class LinkRegistry(object):
+    """
+    Run-wide registry of link check outcomes.
+
+    Each distinct URL is checked exactly once per run, even if several pages ask for it at the same time. Callers
+    that arrive while a check is in progress wait for it to finish and then share its outcome.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outcomes = {}
+
+    def check(self, url, check_function):
+        """
+        Args:
+            url: The (already normalised) URL to check
+            check_function: Called with the URL if it has not been checked yet this run
+
+        Returns:
+            The outcome returned by check_function for this URL
+        """
+        with self._lock:
+            outcome = self._outcomes.get(url)
+            is_owner = outcome is None
+            if is_owner:
+                outcome = Future()
+                self._outcomes[url] = outcome
+
+        if is_owner:
+            try:
+                outcome.set_result(check_function(url))
+            except RetryLaterError as e:
+                # The check isn't finished, so whichever task runs it again next takes it over. Tasks waiting for
+                # it are run again too.
+                with self._lock:
+                    del self._outcomes[url]
+                outcome.set_exception(e)
+            except Exception as e:
+                outcome.set_exception(e)
+        return outcome.result()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._outcomes)
@@ -0,0 +1,133 @@
+import concurrent.futures
+import json
+import threading
+import time
+
+import utils.global_vars
+from utils.link_engine import DeadlineExceededError, RetryLaterError
+
+SKIPPED_LINKS_FILE = "skipped_links.jsonl"
+
+# The order links are checked in, the links whose check is worth the most first
+FRESH = 0
+NEVER_CHECKED = 1
+FAILING = 2
+WORKING = 3
+
+
+class LinkScheduler(object):
+    """
+    Checks the external links of every page after the page tests, most valuable first, stopping once a time budget
+    is about to run out.
+
+    Links whose outcome is still in the link cache cost nothing, so are always checked. After those come links never
+    checked before, then links which failed last time, then working links starting with the one checked longest ago.
+    Links which aren't checked in time keep their place at the front of the queue for the next run, so successive
+    runs with the same budget between them check every link.
+    """
+
+    def __init__(self, deadline):
+        """
+        Args:
+            deadline: time.monotonic() by which the link checks have to have finished
+        """
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._checks = {}
+        self.skipped = []
+
+    def add(self, url, check_function, wiki_name, page_name):
+        """
+        Queues a link to be checked once every page has been tested.
+
+        Args:
+            url: The (already normalised) URL to check
+            check_function: Called with the URL to check it, returning the error and URL if it failed
+            wiki_name: The wiki the link is on
+            page_name: The page the link is on
+        """
+        with self._lock:
+            pages = self._pages.setdefault(url, [])
+            if (wiki_name, page_name) not in pages:
+                pages.append((wiki_name, page_name))
+            self._checks.setdefault(url, check_function)
+
+    def _priority(self, url):
+        link_cache = utils.global_vars.link_cache
+        cached = link_cache.get(url) if link_cache is not None else None
+        if cached is None:
+            return NEVER_CHECKED, 0.0, url
+        if link_cache.is_fresh(cached):
+            return FRESH, 0.0, url
+        return (FAILING if cached.failure else WORKING), cached.checked_at, url
+
+    def _skip(self, url):
+        with self._lock:
+            self.skipped.append(url)
+
+    def _check(self, url, priority, stop_at):
+        if priority != FRESH and time.monotonic() >= stop_at:
+            self._skip(url)
+            return
+        try:
+            failure = utils.global_vars.link_registry.check(url, self._checks[url])
+        except DeadlineExceededError:
+            # The engine gave up on a request, retry or wait which could have run past the deadline, so nothing is
+            # known about the link and nothing was cached for it
+            self._skip(url)
+            return
+        except RetryLaterError:
+            # Not a failure, the engine runs the check again once it has waited
+            raise
+        except Exception as e:
+            # A link which can't be checked at all is reported against its pages, rather than stopping every other
+            # link from being checked and the reports from being written
+            failure = "Invalid link: {}: {}\n".format(e.__class__.__name__, e), url
+        if failure:
+            error, failed_url = failure
+            for wiki_name, page_name in self._pages[url]:
+                utils.global_vars.link_failures.add(error, failed_url, wiki_name, page_name)
+
+    def run(self, engine):
+        """
+        Checks the queued links in order of priority until the deadline is close.
+
+        Args:
+            engine: The HTTP engine the links are checked with
+        """
+        with self._lock:
+            urls = list(self._pages)
+        # No check is started unless its first request would finish in time even if it timed out. The engine stops
+        # anything after that, such as retries and waiting for rate limited hosts, from running past the deadline.
+        stop_at = self.deadline - engine.timeout
+        futures = [
+            engine.submit(self._check, url, priority[0], stop_at, deadline=self.deadline)
+            for priority, url in sorted((self._priority(url), url) for url in urls)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(
+                    "Unable to check a link before the deadline: {}: {}".format(
+                        e.__class__.__name__, e
+                    )
+                )
+
+    def write_skipped(self, path):
+        """
+        Writes the links that weren't checked before the deadline as JSON lines, with the pages they are on.
+        """
+        with self._lock:
+            skipped = sorted(self.skipped)
+        with open(path, "w", encoding="utf-8") as f:
+            for url in skipped:
+                pages = ["{}/{}".format(wiki, page) for wiki, page in self._pages[url]]
+                f.write(json.dumps({"url": url, "pages": pages}) + "\n")
+
+    def summary(self):
+        with self._lock:
+            return "Checked {} of {} links before the deadline, the other {} are checked first next run".format(
+                len(self._pages) - len(self.skipped), len(self._pages), len(self.skipped)
+            )
@@ -0,0 +1,244 @@
+import bisect
+import collections
+import os
+import re
+
+from utils.spelling_preprocessor import blank_non_prose, preprocess_for_spelling
+
+# Markdown URLs of the form [Link text](link location) with no whitespace in the curved brackets
+MARKDOWN_URL = re.compile(r"\[.+?\]\(([\S^#]+)\)")
+# As above, except the whole block is within brackets. The text must start with "(", not have a ")" before the link,
+# then end with a ")" immediately after the trailing ")" of the link. This stops text like
+# "(for more detail, see [link](url))" from giving "url)" while allowing
+# "look at this link [wikipedia is full of](urls_(like_these))" to give "urls_(like_these)"
+BRACKETED_MARKDOWN_URL = re.compile(r"\([^)]*?\[.+?\]\(([\S^#]+)\)\)")
+# Links to pages are of the form "[[page name]]", and some are "[[text|link]]", so everything before a "|" is omitted
+REST_PAGE_LINK = re.compile(r"\[\[.*?([^]|]+)\]\]")
+# Image links point to the file given by ":target: filename.png"
+REST_IMAGE_LINK = re.compile(r":target: (\S+)")
+# Website urls are of the form "`text text text <url>`_" with a required space before the "<"
+REST_WEB_LINK = re.compile(r"`[^`<]+ <(\S+)>`_")
+
+ATX_HEADING = re.compile(r"^ {0,3}#{1,6}[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*$")
+SETEXT_UNDERLINE = re.compile(r"^ {0,3}(=+|-+)[ \t]*$")
+CODE_FENCE = re.compile(r"^ {0,3}(```|~~~)")
+HTML_ANCHOR = re.compile(r"<a\s[^>]*?(?:name|id)=[\"']([^\"']+)[\"']", re.IGNORECASE)
+MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+HTML_TAG = re.compile(r"<[^>]+>")
+# Github drops everything from a heading's anchor except letters, numbers, underscores, hyphens and spaces
+NOT_ANCHOR_CHARACTER = re.compile(r"[^\w\- ]")
+
+# A link on a page and the line it is on, counting from 1
+Link = collections.namedtuple("Link", ["target", "line"])
+# A heading of a page, the anchor Github gives it and the line it is on, counting from 1
+Heading = collections.namedtuple("Heading", ["text", "anchor", "line"])
+
+
+def heading_anchor(heading):
+    """
+    Returns:
+        The anchor Github generates for a heading with the given text
+    """
+    text = MARKDOWN_LINK.sub(r"\1", heading)
+    text = HTML_TAG.sub("", text).replace("`", "").replace("*", "")
+    return NOT_ANCHOR_CHARACTER.sub("", text.strip().lower()).replace(" ", "-")
+
+
+def find_headings(text):
+    """
+    Yields:
+        The headings of the markdown text, with the anchors Github numbers repeated headings with
+    """
+    counts = {}
+    in_code_block = False
+    previous_line = ""
+    for number, line in enumerate(text.splitlines(), 1):
+        if CODE_FENCE.match(line):
+            in_code_block = not in_code_block
+            previous_line = ""
+            continue
+        if in_code_block:
+            continue
+        heading = ATX_HEADING.match(line)
+        if heading:
+            heading_text, heading_line = heading.group(1), number
+        elif previous_line.strip() and SETEXT_UNDERLINE.match(line):
+            heading_text, heading_line = previous_line, number - 1
+        else:
+            heading_text = None
+        if heading_text is not None:
+            anchor = heading_anchor(heading_text)
+            # Github numbers repeated headings, e.g. "usage", "usage-1", "usage-2"
+            numbered = anchor if anchor not in counts else "{}-{}".format(anchor, counts[anchor])
+            counts[anchor] = counts.get(anchor, 0) + 1
+            yield Heading(heading_text, numbered, heading_line)
+        previous_line = line
+
+
+def find_anchors(text):
+    """
+    Returns:
+        The set of anchors that can be linked to in the markdown text, from its headings and any HTML anchors
+    """
+    anchors = set(anchor.lower() for anchor in HTML_ANCHOR.findall(text))
+    anchors.update(heading.anchor for heading in find_headings(text))
+    return anchors
+
+
+def _line_starts(text):
+    return [0] + [match.end() for match in re.finditer("\n", text)]
+
+
+def find_links(text, extension):
+    """
+    Args:
+        text: The text of a page
+        extension: The extension of the page, which decides how its links are written
+
+    Yields:
+        The links on the page, in the order the link test has always checked them in
+    """
+    line_starts = _line_starts(text)
+
+    def links(expression):
+        for match in expression.finditer(text):
+            yield Link(match.group(1), bisect.bisect_right(line_starts, match.start(1)))
+
+    if extension == ".md":
+        bracketed = list(links(BRACKETED_MARKDOWN_URL))
+        bracketed_urls = set(link.target for link in bracketed)
+        # The bracketed links take precedence, if a link appears WITHOUT a trailing ")" in the bracketed links, the
+        # bracketed one is used instead
+        for link in links(MARKDOWN_URL):
+            if link.target[:-1] not in bracketed_urls:
+                yield link
+        yield from bracketed
+    elif extension == ".rest":
+        # Pages are stored as "page-name"
+        for link in links(REST_PAGE_LINK):
+            yield link._replace(target=link.target.strip().replace(" ", "-"))
+        yield from links(REST_IMAGE_LINK)
+        yield from links(REST_WEB_LINK)
+
+
+class Page(str):
+    """
+    A page of a wiki, parsed at most once however many checks need it.
+
+    A page is its path, so it can be used anywhere the path is. Its text, prose and links are read and parsed on first
+    use and kept until they are released once every check of the page has run, so only the pages being checked are
+    held in memory. The anchors of its headings are small and kept for the whole run, as any page may link to them.
+    """
+
+    def __init__(self, path):
+        super(Page, self).__init__()
+        self._exists = None
+        self._text = None
+        self._line_starts = None
+        self._prose = None
+        # The text with everything but its prose blanked out, for finding the lines of words in the prose
+        self._prose_text = None
+        self._links = None
+        self._anchors = None
+
+    def __reduce__(self):
+        # Only the path is sent to other processes, which read the page themselves
+        return Page, (str(self),)
+
+    @property
+    def extension(self):
+        return os.path.splitext(self)[1]
+
+    @property
+    def exists(self):
+        exists = self._exists
+        if exists is None:
+            exists = self._exists = os.path.exists(self)
+        return exists
+
+    def _read(self):
+        with open(self, "r", encoding="utf-8") as f:
+            return f.read()
+
+    @property
+    def text(self):
+        """
+        The decoded text of the page. Raises OSError or UnicodeDecodeError if it can't be read.
+        """
+        text = self._text
+        if text is None:
+            text = self._text = self._read()
+        return text
+
+    @property
+    def prose(self):
+        """
+        The text of the page with code, links and markup taken out, as its spelling is checked.
+        """
+        prose = self._prose
+        if prose is None:
+            prose = self._prose = preprocess_for_spelling(self.text, self)
+        return prose
+
+    @property
+    def links(self):
+        """
+        The links on the page with the line each is on.
+        """
+        links = self._links
+        if links is None:
+            links = self._links = list(find_links(self.text, self.extension))
+        return links
+
+    @property
+    def headings(self):
+        return list(find_headings(self._text if self._text is not None else self._read()))
+
+    @property
+    def anchors(self):
+        """
+        The anchors that can be linked to on the page. Reading them doesn't keep the text of the page in memory.
+        """
+        anchors = self._anchors
+        if anchors is None:
+            anchors = self._anchors = find_anchors(
+                self._text if self._text is not None else self._read()
+            )
+        return anchors
+
+    def line_of(self, word):
+        """
+        Returns:
+            The line the first whole occurrence of the word in the prose of the page is on counting from 1, or None if
+            it isn't on the page. Code and link targets are skipped, unless the word is only found in them.
+        """
+        text = self.text
+        prose_text = self._prose_text
+        if prose_text is None:
+            prose_text = self._prose_text = blank_non_prose(text)
+        expression = re.compile(r"(?<!\w){}(?!\w)".format(re.escape(word)))
+        match = expression.search(prose_text) or expression.search(text)
+        if match is None:
+            return None
+        line_starts = self._line_starts
+        if line_starts is None:
+            line_starts = self._line_starts = _line_starts(text)
+        return bisect.bisect_right(line_starts, match.start())
+
+    def release(self):
+        """
+        Drops everything read from the page apart from its anchors, to be read again if it is needed.
+        """
+        self._text = None
+        self._line_starts = None
+        self._prose = None
+        self._prose_text = None
+        self._links = None
+
+
+def as_page(page):
+    """
+    Returns:
+        The page for the path, or the page itself if it is already one
+    """
+    return page if isinstance(page, Page) else Page(page)
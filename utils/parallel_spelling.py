@@ -0,0 +1,100 @@
+import concurrent.futures
+import threading
+
+import utils.global_vars
+from utils.page import as_page
+from utils.spelling import LANGUAGE, dictionary_fingerprint, get_spelling_engine
+from utils.spelling_cache import SpellingCache
+
+_worker_cache = None
+
+
+def check_page_spelling(page, ignored_words, cache=None):
+    """
+    Args:
+        page: The page to check
+        ignored_words: Lower case words which are always accepted
+        cache: Spelling cache to reuse the outcome of unchanged paragraphs from, or None to check the whole page
+
+    Returns:
+        The set of misspelled words on the page
+    """
+    return get_spelling_engine(ignored_words).misspelled_words(as_page(page).prose, cache)
+
+
+def _init_worker(cached_blocks):
+    global _worker_cache
+    # Load the dictionary up front so that every page the worker is given benefits from a warm checker
+    get_spelling_engine(frozenset())
+    if cached_blocks is not None:
+        # Kept in memory only, the paragraphs the worker uses are sent back to be saved by the main process
+        _worker_cache = SpellingCache(path=None)
+        _worker_cache.seed(dictionary_fingerprint(LANGUAGE), cached_blocks)
+
+
+def _check_page_spelling_in_worker(page):
+    try:
+        # The ignored words of the page's wiki are taken out by the main process, so one pool serves every wiki
+        result = check_page_spelling(page, frozenset(), _worker_cache)
+    except Exception as e:
+        # Raised again by the spelling test for this page, so it is reported against the right page
+        result = e
+    return result, _worker_cache.take_used() if _worker_cache is not None else {}
+
+
+class SpellingPool(object):
+    """
+    A pool of processes checking the spelling of pages ahead of their tests, shared by every wiki in the run so that
+    the number of processes never goes above the number of jobs asked for, however many wikis are checked at once.
+
+    The processes are started the first time pages are checked, and results are stored in
+    utils.global_vars.spelling_results for the spelling tests to pick up.
+    """
+
+    def __init__(self, jobs, cache=None):
+        """
+        Args:
+            jobs: The number of processes to use
+            cache: Spelling cache to reuse the outcome of unchanged paragraphs from and add new ones to, or None
+        """
+        self.jobs = jobs
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                cached_blocks = (
+                    self.cache.snapshot(dictionary_fingerprint(LANGUAGE))
+                    if self.cache is not None
+                    else None
+                )
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.jobs, initializer=_init_worker, initargs=(cached_blocks,)
+                )
+            return self._pool
+
+    def check(self, pages, ignored_words):
+        """
+        Checks the spelling of all the pages, waiting until every page has been checked.
+
+        Args:
+            pages: The pages to check
+            ignored_words: Lower case words which are always accepted on these pages
+        """
+        chunk_size = max(1, len(pages) // (self.jobs * 4))
+        results = self._get_pool().map(_check_page_spelling_in_worker, pages, chunksize=chunk_size)
+        # map returns results in the order of the pages, so the outcome doesn't depend on scheduling
+        for page, (result, used_blocks) in zip(pages, results):
+            if not isinstance(result, Exception):
+                result = {word for word in result if word.lower() not in ignored_words}
+            utils.global_vars.spelling_results[page] = result
+            if self.cache is not None:
+                self.cache.seed(dictionary_fingerprint(LANGUAGE), used_blocks)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -0,0 +1,146 @@
+import contextlib
+import json
+import threading
+import time
+
+from utils.link_engine import get_host
+
+# Upper bounds, in seconds, of the buckets of the per-host latency histograms
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5]
+
+
+def _bucket_label(seconds):
+    for bound in LATENCY_BUCKETS:
+        if seconds <= bound:
+            return "<={}s".format(bound)
+    return ">{}s".format(LATENCY_BUCKETS[-1])
+
+
+class RunProfile(object):
+    """
+    Records where the time in a run goes: wall time per wiki and phase, per page test and per URL, along with
+    latency histograms and timeout counts for each host.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Turned off for processes that never finish, such as --watch, where recording every page test and URL would
+        # grow without limit. The phases and the statistics of each host are always kept.
+        self.record_details = True
+        self._started = time.perf_counter()
+        self._first_result = None
+        self._phases = []
+        self._pages = []
+        self._urls = {}
+        self._hosts = {}
+
+    @contextlib.contextmanager
+    def phase(self, name, wiki=None):
+        """
+        Context manager timing a phase of the run, e.g. cloning or the page tests of a wiki.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._phases.append(
+                    {"phase": name, "wiki": wiki, "seconds": time.perf_counter() - start}
+                )
+
+    def record_page(self, page, test_name, seconds):
+        with self._lock:
+            if self._first_result is None:
+                # How long someone checking a single page waits before hearing anything back
+                self._first_result = time.perf_counter() - self._started
+            if self.record_details:
+                self._pages.append({"page": page, "test": test_name, "seconds": seconds})
+
+    def page_seconds(self):
+        """
+        Returns:
+            The seconds taken by all of the tests of each page
+        """
+        seconds = {}
+        with self._lock:
+            for page in self._pages:
+                seconds[page["page"]] = seconds.get(page["page"], 0.0) + page["seconds"]
+        return seconds
+
+    def record_url(self, url, seconds, timed_out=False):
+        """
+        Args:
+            url: The URL requested
+            seconds: How long the request took, excluding any time spent waiting to be allowed to send it
+            timed_out: Whether the request timed out
+        """
+        host = get_host(url)
+        with self._lock:
+            if self.record_details:
+                self._urls[url] = {"host": host, "seconds": seconds, "timed_out": timed_out}
+            stats = self._hosts.setdefault(
+                host, {"requests": 0, "timeouts": 0, "seconds": 0.0, "histogram": {}}
+            )
+            stats["requests"] += 1
+            stats["seconds"] += seconds
+            if timed_out:
+                stats["timeouts"] += 1
+            label = _bucket_label(seconds)
+            stats["histogram"][label] = stats["histogram"].get(label, 0) + 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "total_seconds": time.perf_counter() - self._started,
+                "first_result_seconds": self._first_result,
+                "phases": list(self._phases),
+                "pages": list(self._pages),
+                "urls": {url: dict(stats) for url, stats in self._urls.items()},
+                "hosts": {host: dict(stats) for host, stats in self._hosts.items()},
+            }
+
+    def save(self, path):
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, indent=1)
+        except OSError as e:
+            print("Unable to write run profile {}: {}".format(path, e))
+
+    def summary(self, top=10):
+        """
+        Returns:
+            A short human readable summary of the slowest phases, page tests, hosts and URLs
+        """
+        profile = self.to_dict()
+        lines = ["Run took {:.1f}s".format(profile["total_seconds"])]
+        if profile["first_result_seconds"] is not None:
+            lines.append("First result after {:.2f}s".format(profile["first_result_seconds"]))
+        lines.append("Phases:")
+        for phase in profile["phases"]:
+            lines.append(
+                "  {:>8.1f}s {}{}".format(
+                    phase["seconds"],
+                    phase["phase"],
+                    " ({})".format(phase["wiki"]) if phase["wiki"] else "",
+                )
+            )
+        lines.append("Slowest page tests:")
+        for page in sorted(profile["pages"], key=lambda p: p["seconds"], reverse=True)[:top]:
+            lines.append("  {:>8.2f}s {} {}".format(page["seconds"], page["page"], page["test"]))
+        lines.append("Slowest hosts (total request time, requests, timeouts):")
+        hosts = sorted(profile["hosts"].items(), key=lambda h: h[1]["seconds"], reverse=True)
+        for host, stats in hosts[:top]:
+            lines.append(
+                "  {:>8.2f}s {:>5} {:>5} {}".format(
+                    stats["seconds"], stats["requests"], stats["timeouts"], host
+                )
+            )
+        lines.append("Slowest URLs:")
+        urls = sorted(profile["urls"].items(), key=lambda u: u[1]["seconds"], reverse=True)
+        for url, stats in urls[:top]:
+            lines.append(
+                "  {:>8.2f}s {}{}".format(
+                    stats["seconds"], url, " (timed out)" if stats["timed_out"] else ""
+                )
+            )
+        return "\n".join(lines)
@@ -0,0 +1,236 @@
+import heapq
+import json
+import os
+import re
+import statistics
+import zlib
+from xml.etree import ElementTree
+
+from utils.link_failures import LinkFailures
+from utils.link_scheduler import SKIPPED_LINKS_FILE
+
+# The folder in the working directory that every run writes its reports to, and the merge step combines them into
+REPORTS_FOLDER = "test-reports"
+# Written to the reports folder of every run, and combined by the merge step into the timings for the next run
+PAGE_TIMINGS_FILE = "page-timings.json"
+LINK_FAILURES_FILE = "link_failures.jsonl"
+# Seconds a page is assumed to take when no page has any recorded timings
+DEFAULT_PAGE_SECONDS = 1.0
+
+# Reports are named after their suite and the time they were started
+REPORT_NAME = re.compile(r"^TEST-(?P<suite>.+)-\d{14}\.xml$")
+
+
+def parse_shard(text):
+    """
+    Args:
+        text: The shard to run as "I/N", for the I'th of N shards counting from 1
+
+    Returns:
+        The index of the shard counting from 0, and the number of shards
+
+    Raises:
+        ValueError: if the text is not a valid shard
+    """
+    index, _, count = text.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError("Shard must be given as I/N, e.g. 1/4, not {}".format(text))
+    if not 1 <= index <= count:
+        raise ValueError("Shard {} must be between 1 and {}".format(index, count))
+    return index - 1, count
+
+
+def page_key(wiki_name, wiki_dir, page):
+    """
+    Returns:
+        A name for the page which is the same on every build agent, whatever folder the wiki was cloned into
+    """
+    path = (
+        os.path.relpath(page, wiki_dir).replace("\\", "/") if wiki_dir else os.path.basename(page)
+    )
+    return "{}/{}".format(wiki_name, path) if wiki_name else path
+
+
+def load_page_timings(path):
+    """
+    Returns:
+        The seconds the tests of each page took in an earlier run, by page key, empty if there are none
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print("Unable to read page timings {}, splitting pages evenly: {}".format(path, e))
+        return {}
+
+
+def save_page_timings(path, page_seconds, page_keys):
+    """
+    Args:
+        path: File to write the timings to
+        page_seconds: The seconds the tests of each page took this run, by page path
+        page_keys: The key of each page, by page path
+    """
+    timings = {
+        page_keys[page]: seconds for page, seconds in page_seconds.items() if page in page_keys
+    }
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(timings, f, indent=1, sort_keys=True)
+    except OSError as e:
+        print("Unable to write page timings {}: {}".format(path, e))
+
+
+class Shard(object):
+    """
+    One of several runs that share out the pages of the wikis between them, each checking its pages and their links.
+
+    Pages with recorded timings are shared out so that every shard takes about as long, by giving the slowest page
+    left to the shard with the least work so far. Only the timings decide this, never which pages an agent's clone
+    happens to have, so every shard given the same timings makes the same split even if the wikis change between
+    their clones. Pages without timings, such as new pages, go to a shard chosen from a hash of their key.
+    """
+
+    def __init__(self, index, count, timings):
+        """
+        Args:
+            index: The index of this shard, counting from 0
+            count: The number of shards
+            timings: The seconds the tests of each page took in an earlier run, by page key
+        """
+        self.index = index
+        self.count = count
+        self.timings = timings
+        self._assignment = {}
+        loads = [(0.0, shard) for shard in range(count)]
+        for key in sorted(timings, key=lambda k: (-timings[k], k)):
+            load, shard = heapq.heappop(loads)
+            self._assignment[key] = shard
+            heapq.heappush(loads, (load + timings[key], shard))
+
+    def shard_of(self, key):
+        shard = self._assignment.get(key)
+        if shard is None:
+            # crc32 rather than hash(), which is different in every process
+            shard = zlib.crc32(key.encode("utf-8")) % self.count
+        return shard
+
+    def includes(self, key):
+        return self.shard_of(key) == self.index
+
+    def expected_seconds(self, keys):
+        """
+        Returns:
+            How long the tests of the pages of this shard are expected to take, from the timings
+        """
+        default = statistics.median(self.timings.values()) if self.timings else DEFAULT_PAGE_SECONDS
+        return sum(self.timings.get(key, default) for key in keys if self.includes(key))
+
+
+def _find_reports(reports_path):
+    for directory, _, files in os.walk(reports_path):
+        for file_name in files:
+            match = REPORT_NAME.match(file_name)
+            if match:
+                yield os.path.relpath(directory, reports_path), match.group("suite"), file_name
+
+
+def merge_junit_reports(shard_report_paths, output_path):
+    """
+    Combines the JUnit reports of every shard into one report for each suite in each folder.
+
+    Returns:
+        The number of test cases which failed or raised an error
+    """
+    suites = {}
+    for reports_path in shard_report_paths:
+        for directory, suite_name, file_name in _find_reports(reports_path):
+            tree = ElementTree.parse(os.path.join(reports_path, directory, file_name))
+            key = (directory, suite_name)
+            if key not in suites:
+                root = tree.getroot()
+                suites[key] = ElementTree.Element(
+                    "testsuite",
+                    {
+                        "name": suite_name,
+                        "file": root.get("file", ""),
+                        "timestamp": root.get("timestamp", ""),
+                    },
+                )
+            suites[key].extend(tree.getroot().iter("testcase"))
+
+    problems = 0
+    for (directory, suite_name), suite in sorted(suites.items()):
+        problems += sum(
+            1
+            for case in suite.iter("testcase")
+            if case.find("failure") is not None or case.find("error") is not None
+        )
+        ElementTree.indent(suite, space="\t")
+        os.makedirs(os.path.join(output_path, directory), exist_ok=True)
+        ElementTree.ElementTree(suite).write(
+            os.path.join(output_path, directory, "TEST-{}.xml".format(suite_name)),
+            encoding="UTF-8",
+            xml_declaration=True,
+        )
+    return problems
+
+
+def merge_link_failures(shard_report_paths, output_path):
+    """
+    Combines the link failures found by every shard.
+
+    Returns:
+        The combined link failures
+    """
+    link_failures = LinkFailures(os.path.join(output_path, LINK_FAILURES_FILE))
+    for reports_path in shard_report_paths:
+        path = os.path.join(reports_path, LINK_FAILURES_FILE)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    failure = json.loads(line)
+                    link_failures.add(
+                        failure["error"], failure["url"], failure["wiki"], failure["page"]
+                    )
+    link_failures.close()
+    return link_failures
+
+
+def merge_skipped_links(shard_report_paths, output_path):
+    """
+    Combines the links each shard didn't check before its deadline.
+
+    Returns:
+        The pages each skipped link is on, by link
+    """
+    skipped = {}
+    for reports_path in shard_report_paths:
+        path = os.path.join(reports_path, SKIPPED_LINKS_FILE)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    link = json.loads(line)
+                    pages = skipped.setdefault(link["url"], [])
+                    pages.extend(page for page in link["pages"] if page not in pages)
+    with open(os.path.join(output_path, SKIPPED_LINKS_FILE), "w", encoding="utf-8") as f:
+        for url in sorted(skipped):
+            f.write(json.dumps({"url": url, "pages": skipped[url]}) + "\n")
+    return skipped
+
+
+def merge_page_timings(shard_report_paths, output_path):
+    timings = {}
+    for reports_path in shard_report_paths:
+        timings.update(load_page_timings(os.path.join(reports_path, PAGE_TIMINGS_FILE)))
+    with open(os.path.join(output_path, PAGE_TIMINGS_FILE), "w", encoding="utf-8") as f:
+        json.dump(timings, f, indent=1, sort_keys=True)
+    return timings
@@ -0,0 +1,220 @@
+import functools
+import glob
+import hashlib
+import os
+import threading
+
+# enchant is only imported once a page's spelling is checked, so runs which never check spelling don't load it
+LANGUAGE = "en_GB"
+
+
+class MemoisedDict(object):
+    """
+    Wraps an enchant dictionary, remembering the verdict for every word it is asked to check.
+    """
+
+    def __init__(self, dictionary):
+        self._dictionary = dictionary
+        self._lock = threading.Lock()
+        self._verdicts = {}
+        self.tag = dictionary.tag
+
+    def check(self, word):
+        verdict = self._verdicts.get(word)
+        if verdict is None:
+            with self._lock:
+                verdict = self._dictionary.check(word)
+            self._verdicts[word] = verdict
+        return verdict
+
+    def __getattr__(self, name):
+        return getattr(self._dictionary, name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_dictionary(language):
+    """
+    Returns:
+        The dictionary for the language, shared by every spelling engine in the process whatever its ignored words
+    """
+    import enchant
+
+    return MemoisedDict(enchant.Dict(language))
+
+
+# Words spelt differently in different English dictionaries, or only added to them recently. Their verdicts are part
+# of the fingerprint, so a dictionary whose files can't be found is still noticed when it changes.
+PROBE_WORDS = (
+    "aluminium",
+    "analyse",
+    "blog",
+    "catalogue",
+    "colour",
+    "color",
+    "cryptocurrency",
+    "dataset",
+    "email",
+    "emoji",
+    "grey",
+    "hashtag",
+    "licence",
+    "localhost",
+    "metadata",
+    "online",
+    "organize",
+    "podcast",
+    "programme",
+    "screenshot",
+    "selfie",
+    "smartphone",
+    "timestamp",
+    "traveling",
+    "username",
+    "website",
+    "wifi",
+    "workflow",
+)
+
+
+def _dictionary_directories():
+    """
+    Yields:
+        The directories enchant's hunspell and myspell providers look for dictionaries in, most preferred first
+    """
+    import enchant
+
+    config_directories = [os.environ.get("ENCHANT_CONFIG_DIR")]
+    if os.environ.get("APPDATA"):
+        config_directories.append(os.path.join(os.environ["APPDATA"], "enchant"))
+    config_directories.append(
+        os.path.join(
+            os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "enchant"
+        )
+    )
+    for directory in config_directories:
+        if directory:
+            yield os.path.join(directory, "hunspell")
+            yield os.path.join(directory, "myspell")
+    # The dictionaries bundled with pyenchant's own copy of enchant on Windows
+    yield from sorted(
+        glob.glob(
+            os.path.join(
+                os.path.dirname(enchant.__file__), "data", "*", "share", "enchant*", "*spell"
+            )
+        )
+    )
+    for prefix in ("/usr/local/share", "/usr/share"):
+        for directory in (
+            "enchant-2/hunspell",
+            "enchant/hunspell",
+            "hunspell",
+            "myspell",
+            "myspell/dicts",
+        ):
+            yield os.path.join(prefix, directory)
+
+
+def _dictionary_files(language):
+    """
+    Returns:
+        The paths of the .dic and .aff files of the dictionary for the language in the first directory that has
+        them, or an empty list if none do
+    """
+    for directory in _dictionary_directories():
+        paths = [os.path.join(directory, language + extension) for extension in (".dic", ".aff")]
+        if os.path.exists(paths[0]):
+            return [path for path in paths if os.path.exists(path)]
+    return []
+
+
+@functools.lru_cache(maxsize=None)
+def dictionary_fingerprint(language):
+    """
+    Returns:
+        A description of the dictionary for the language which changes when enchant, the provider of the dictionary,
+        the files of the dictionary or the verdicts it gives for a sample of words do
+    """
+    import enchant
+
+    dictionary = get_dictionary(language)
+    provider = dictionary.provider
+    contents = hashlib.sha256()
+    contents.update(provider.file.encode("utf-8"))
+    for path in _dictionary_files(language):
+        stat = os.stat(path)
+        contents.update("{} {} {}".format(path, stat.st_size, stat.st_mtime_ns).encode("utf-8"))
+    contents.update(bytes(dictionary.check(word) for word in PROBE_WORDS))
+    return "{} enchant {} pyenchant {} {} {}".format(
+        language,
+        enchant.get_enchant_version(),
+        enchant.__version__,
+        provider.name,
+        contents.hexdigest()[:16],
+    )
+
+
+class SpellingEngine(object):
+    """
+    Checks the spelling of page text against a single dictionary, shared for the lifetime of the process.
+
+    The verdict for each distinct word is only looked up in enchant once, and each thread reuses its own checker
+    (and so its own tokenizer and filters) for every page.
+    """
+
+    def __init__(self, ignored_words, language=LANGUAGE):
+        """
+        Args:
+            ignored_words: Lower case words which are always accepted
+            language: Dictionary to check words against
+        """
+        self.ignored_words = ignored_words
+        self.language = language
+        self._dictionary = get_dictionary(language)
+        self._local = threading.local()
+
+    def _checker(self):
+        if not hasattr(self._local, "checker"):
+            from enchant.checker import SpellChecker
+            from enchant.tokenize import EmailFilter, MentionFilter, URLFilter, WikiWordFilter
+
+            filters = [URLFilter, EmailFilter, MentionFilter, WikiWordFilter]
+            self._local.checker = SpellChecker(self._dictionary, filters=filters)
+        return self._local.checker
+
+    def unknown_words(self, text):
+        """
+        Returns:
+            The set of words in the text which are not in the dictionary, including ignored ones
+        """
+        checker = self._checker()
+        checker.set_text(text)
+        return {err.word for err in checker}
+
+    def misspelled_words(self, text, cache=None):
+        """
+        Args:
+            text: The text to check
+            cache: Spelling cache to reuse the outcome of unchanged paragraphs from, or None to check all the text
+
+        Returns:
+            The set of words in the text which are neither in the dictionary nor ignored
+        """
+        if cache is None:
+            words = self.unknown_words(text)
+        else:
+            words = cache.unknown_words(
+                text, dictionary_fingerprint(self.language), self.unknown_words
+            )
+        return {word for word in words if word.lower() not in self.ignored_words}
+
+
+@functools.lru_cache(maxsize=None)
+def get_spelling_engine(ignored_words):
+    """
+    Args:
+        ignored_words: Frozen set of lower case words which are always accepted
+
+    Returns:
+        The spelling engine for the process with these ignored words, created on first use
+    """
+    return SpellingEngine(ignored_words)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_SPELLING_CACHE_PATH = os.path.join(os.getcwd(), "spelling-cache.json")
+# Blocks which no page has contained for this long are dropped when the cache is saved
+DEFAULT_MAX_AGE_DAYS = 30
+# Changed whenever the way a block is checked changes, so that blocks checked the old way are checked again
+CACHE_VERSION = 1
+
+# Words never run across a blank line, so each paragraph of a page can be checked on its own
+BLOCK_SEPARATOR = re.compile(r"\n[ \t]*\n")
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def split_into_blocks(text):
+    """
+    Returns:
+        The paragraphs of the preprocessed text of a page
+    """
+    return [block for block in BLOCK_SEPARATOR.split(text) if block.strip()]
+
+
+def block_key(block):
+    return hashlib.blake2b(block.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SpellingCache(object):
+    """
+    Persistent record of the words the dictionary doesn't know in each paragraph of preprocessed page text, keyed by
+    a hash of the paragraph, so only paragraphs which have changed since any earlier run are checked again.
+
+    The words are kept before the ignored words in words.txt are taken out, so editing words.txt doesn't invalidate
+    anything. The whole cache is dropped if the dictionary itself changes. Nothing depends on where the page came
+    from, so the cache is shared by --remote, --folder and --file runs.
+    """
+
+    def __init__(self, path=DEFAULT_SPELLING_CACHE_PATH, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        """
+        Args:
+            path: File to keep the cache in between runs, or None to only keep it in memory
+            max_age_days: Days after which a paragraph that hasn't been seen is dropped from the cache
+        """
+        self.path = path
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._today = int(time.time() // SECONDS_PER_DAY)
+        # Loaded on first use, as knowing whether the cache is still valid needs the dictionary to be loaded
+        self._dictionary = None
+        self._blocks = None
+        self._used = {}
+
+    def _load(self, dictionary):
+        self._dictionary = dictionary
+        self._blocks = {}
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Unable to read spelling cache {}, checking all pages: {}".format(self.path, e))
+            return
+        if cache.get("version") == CACHE_VERSION and cache.get("dictionary") == dictionary:
+            self._blocks = cache.get("blocks", {})
+
+    def _ensure_loaded(self, dictionary):
+        with self._lock:
+            if self._blocks is None:
+                self._load(dictionary)
+            elif self._dictionary != dictionary:
+                raise ValueError("Spelling cache used with two different dictionaries")
+
+    def unknown_words(self, text, dictionary, check):
+        """
+        Args:
+            text: The preprocessed text of a page
+            dictionary: Fingerprint of the dictionary the words are checked against
+            check: Function returning the set of unknown words in a paragraph, only called for paragraphs which
+                aren't cached
+
+        Returns:
+            The set of words in the text which the dictionary doesn't know
+        """
+        self._ensure_loaded(dictionary)
+        words = set()
+        for block in split_into_blocks(text):
+            key = block_key(block)
+            with self._lock:
+                entry = self._blocks.get(key)
+                if entry is not None:
+                    entry[0] = self._today
+                    self._used[key] = entry
+            if entry is None:
+                entry = [self._today, sorted(check(block))]
+                with self._lock:
+                    self._blocks[key] = entry
+                    self._used[key] = entry
+            words.update(entry[1])
+        return words
+
+    def snapshot(self, dictionary):
+        """
+        Returns:
+            The cached paragraphs, to seed the cache of another process with
+        """
+        self._ensure_loaded(dictionary)
+        with self._lock:
+            return dict(self._blocks)
+
+    def seed(self, dictionary, blocks):
+        """
+        Adds paragraphs checked or reused elsewhere, e.g. by another process, to the cache.
+        """
+        self._ensure_loaded(dictionary)
+        with self._lock:
+            self._blocks.update(blocks)
+
+    def take_used(self):
+        """
+        Returns:
+            The paragraphs checked or reused since the last time they were taken
+        """
+        with self._lock:
+            used, self._used = self._used, {}
+        return used
+
+    def save(self):
+        with self._lock:
+            if self._blocks is None or self.path is None:
+                return
+            oldest = self._today - self.max_age_days
+            cache = {
+                "version": CACHE_VERSION,
+                "dictionary": self._dictionary,
+                "blocks": {key: entry for key, entry in self._blocks.items() if entry[0] >= oldest},
+            }
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(cache, f, separators=(",", ":"))
+        except OSError as e:
+            print("Unable to write spelling cache {}: {}".format(self.path, e))
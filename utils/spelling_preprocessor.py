@@ -0,0 +1,256 @@
+import bisect
+import re
+
+CODE_TAGS = re.compile(r"<code>|</code>")
+PRE_TAGS = re.compile(r"<pre>|</pre>")
+CODE_FENCES = re.compile(r"```")
+# The "](" between the text and target of a markdown link "[text](link)", which is replaced by "text"
+LINK_TEXT_END = re.compile(r"\]\(")
+WHITESPACE = re.compile(r"\s")
+BACKSLASH_OR_BACKTICK_RUN = re.compile(r"\\+|`+")
+IMG_HTML_TAG = re.compile(r"(<img )([a-zA-Z=\"0-9\/\-\s\.:]+)(>)")
+NOT_NEWLINE = re.compile(r"[^\n]")
+# Brackets get around certain issues recognising Github links as URLs, asterisks are bold and italics
+SPECIALS = str.maketrans({"[": " ", "]": " ", "(": " ", ")": " ", "*": None})
+
+
+def strip_between_tags(expression, text, current_page):
+    """
+    Removes everything between each pair of matches of the expression, including the matches themselves.
+
+    Args:
+        expression: The expression (string or compiled) matching both the opening and closing tags
+        text: The text to strip
+        current_page: The page the text came from, for error messages
+
+    Returns:
+        The stripped text
+    """
+    if text is None:
+        return text
+    matches = list(re.finditer(expression, text))
+    if len(matches) == 0:
+        return text
+    if len(matches) % 2 != 0:
+        pattern = expression.pattern if isinstance(expression, re.Pattern) else expression
+        raise ValueError("Uneven number of {} detected in file {}.".format(pattern, current_page))
+    kept = [text[0 : matches[0].start()]]
+    for i in range(1, len(matches) - 1, 2):
+        kept.append(text[matches[i].end() : matches[i + 1].start()])
+    kept.append(text[matches[-1].end() : len(text)])
+    return "".join(kept)
+
+
+def _inline_code_spans(line):
+    """
+    Yields:
+        The start and end of each part of a single line that inline code stripping removes, in order
+    """
+    runs = [(m.start(), m.end()) for m in BACKSLASH_OR_BACKTICK_RUN.finditer(line)]
+    if not runs:
+        return
+
+    # For each length of backtick run on the line, the indices (into runs) of the runs with that length
+    backtick_runs_by_length = {}
+    for index, (start, end) in enumerate(runs):
+        if line[start] == "`":
+            backtick_runs_by_length.setdefault(end - start, []).append(index)
+    lengths = sorted(backtick_runs_by_length, reverse=True)
+
+    index = 0
+    while index < len(runs):
+        start, end = runs[index]
+        if line[start] == "\\":
+            if (end - start) % 2 == 0 and line[end : end + 1] == "`":
+                yield start, end
+            index += 1
+            continue
+
+        # A backtick straight after a backslash is escaped, but the rest of its run can still open a span
+        opening = start + 1 if start > 0 and line[start - 1] == "\\" else start
+        closing = None
+        for length in lengths:
+            if length > end - opening:
+                continue
+            candidates = backtick_runs_by_length[length]
+            later = bisect.bisect_right(candidates, index)
+            if later < len(candidates):
+                closing = candidates[later]
+                break
+        if closing is None:
+            index += 1
+            continue
+        yield opening, runs[closing][1]
+        index = closing + 1
+
+
+def _strip_inline_code_from_line(line):
+    """
+    Removes inline code spans from a single line, exactly as re.sub with the expression
+    (?:(?<!\\)((?:\\{2})+)(?=`+)|(?<!\\)(`+)(.+?)(?<!`)\2(?!`)) would, but without backtracking.
+
+    An inline code span opens with an unescaped run of backticks and closes at the first later run of exactly the same
+    length on the line. If there is no such run, the longest shorter opening that can be closed is used instead. An
+    even run of backslashes before a backtick is removed on its own.
+    """
+    kept = []
+    position = 0
+    for start, end in _inline_code_spans(line):
+        kept.append(line[position:start])
+        position = end
+    if not kept:
+        return line
+    kept.append(line[position:])
+    return "".join(kept)
+
+
+def _markdown_link_spans(text):
+    """
+    Finds markdown links exactly as re.finditer with the expression \\[(.+?)\\]\\([\\S]+\\) would, but in linear
+    time. The expression backtracks over every later "](" on the line for each "[", which is quadratic for lines with
+    many brackets.
+
+    A link's text runs from a "[" to the first "](" on the same line after it whose target can be closed. The target
+    is the run of non-whitespace after the "(", up to the last ")" in the run. Whether a "](" can close a link doesn't
+    depend on where the link starts, so it is only worked out once.
+
+    Yields:
+        The start of each link, the end of its text and the end of the link
+    """
+    # The end of each link which each "](" could close, in order of where the "](" is
+    closers = []
+    run_start = run_end = last_paren = -1
+    for match in LINK_TEXT_END.finditer(text):
+        target = match.end()
+        if target >= run_end:
+            whitespace = WHITESPACE.search(text, target)
+            run_start, run_end = target, whitespace.start() if whitespace else len(text)
+            last_paren = text.rfind(")", run_start, run_end)
+        # The target needs at least one character before its closing ")"
+        if last_paren > target:
+            closers.append((match.start(), last_paren + 1))
+    if not closers:
+        return
+
+    closer_starts = [start for start, _ in closers]
+    position = 0
+    line_end = -1
+    while True:
+        start = text.find("[", position)
+        if start < 0:
+            return
+        if start > line_end:
+            line_end = text.find("\n", start)
+            if line_end < 0:
+                line_end = len(text)
+        # The text of the link has at least one character
+        index = bisect.bisect_left(closer_starts, start + 2)
+        if index < len(closers) and closers[index][0] < line_end:
+            text_end, end = closers[index]
+            yield start, text_end, end
+            position = end
+        else:
+            position = start + 1
+
+
+def strip_markdown_links(text):
+    """
+    Replaces each markdown link "[text](link)" with its text.
+    """
+    kept = []
+    position = 0
+    for start, text_end, end in _markdown_link_spans(text):
+        kept.append(text[position:start])
+        kept.append(text[start + 1 : text_end])
+        position = end
+    if not kept:
+        return text
+    kept.append(text[position:])
+    return "".join(kept)
+
+
+def strip_inline_code_blocks(text):
+    if "`" not in text:
+        # Even runs of backslashes are only removed before a backtick, so there is nothing to strip
+        return text
+    # Inline code can't span lines, so each line is handled independently
+    return "\n".join(
+        _strip_inline_code_from_line(line) if "`" in line else line for line in text.split("\n")
+    )
+
+
+def preprocess_for_spelling(text, page):
+    """
+    Reduces the text of a page to the prose that should be spell checked, removing code blocks, inline code, link
+    targets, image tags and markdown formatting.
+
+    Args:
+        text: The raw text of the page
+        page: The page the text came from, for error messages
+
+    Returns:
+        The text to spell check
+    """
+    text = strip_between_tags(CODE_TAGS, text, page)
+    text = strip_between_tags(PRE_TAGS, text, page)
+    text = strip_between_tags(CODE_FENCES, text, page)
+    text = strip_markdown_links(text)
+    text = strip_inline_code_blocks(text)
+    text = text.translate(SPECIALS)
+    return IMG_HTML_TAG.sub("", text)
+
+
+def _blank(text):
+    return NOT_NEWLINE.sub(" ", text)
+
+
+def _blank_between_tags(expression, text):
+    matches = list(expression.finditer(text))
+    if len(matches) % 2 != 0:
+        # preprocess_for_spelling refuses the text, so there is no prose to find lines in
+        return text
+    kept = []
+    position = 0
+    for opening, closing in zip(matches[::2], matches[1::2]):
+        kept.append(text[position : opening.start()])
+        kept.append(_blank(text[opening.start() : closing.end()]))
+        position = closing.end()
+    kept.append(text[position:])
+    return "".join(kept)
+
+
+def _blank_inline_code(line):
+    kept = []
+    position = 0
+    for start, end in _inline_code_spans(line):
+        kept.append(line[position:start])
+        kept.append(" " * (end - start))
+        position = end
+    kept.append(line[position:])
+    return "".join(kept)
+
+
+def blank_non_prose(text):
+    """
+    Blanks out everything preprocess_for_spelling removes from the text of a page, keeping every other character where
+    it was, so that words in the prose can be found on the line they came from.
+
+    Returns:
+        The text with code blocks, inline code, link targets and image tags replaced by spaces, and line breaks kept
+    """
+    text = _blank_between_tags(CODE_TAGS, text)
+    text = _blank_between_tags(PRE_TAGS, text)
+    text = _blank_between_tags(CODE_FENCES, text)
+    kept = []
+    position = 0
+    for _, text_end, end in _markdown_link_spans(text):
+        kept.append(text[position:text_end])
+        kept.append(_blank(text[text_end:end]))
+        position = end
+    kept.append(text[position:])
+    text = "".join(kept)
+    if "`" in text:
+        text = "\n".join(
+            _blank_inline_code(line) if "`" in line else line for line in text.split("\n")
+        )
+    return IMG_HTML_TAG.sub(lambda m: _blank(m.group(0)), text)
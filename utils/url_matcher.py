@@ -0,0 +1,174 @@
+import fnmatch
+import functools
+import re
+import threading
+
+from utils.link_engine import get_host
+
+# Prefixes which give the kind of an entry in ignored_urls.txt, any other entry is ignored wherever it appears in a URL
+HOST_ENTRY = "host:"
+PREFIX_ENTRY = "prefix:"
+GLOB_ENTRY = "glob:"
+REGEX_ENTRY = "re:"
+# Text entries are found by looking up each run of this many characters of a URL
+KEY_LENGTH = 8
+
+
+class UrlMatcher(object):
+    """
+    Decides whether a link is ignored, compiled once from the entries of ignored_urls.txt.
+
+    Entries can be:
+        host:<host>       links to exactly that host
+        prefix:<url>      links starting with the URL
+        glob:<pattern>    links matching the whole shell style pattern, e.g. glob:https://*.example.com/*.pdf
+        re:<expression>   links the regular expression matches anywhere in
+        <text>            links containing the text anywhere, as every entry did before the kinds above existed
+
+    Hosts are looked up in a dictionary and prefixes by the few distinct prefix lengths. Each text entry is filed
+    under the run of characters in it that the fewest other entries share, so a URL only has to be compared with the
+    entries filed under the runs of characters it contains. Globs, regular expressions and text too short to file are
+    combined into a single regular expression. The cost of a check therefore barely grows with the number of entries,
+    and the outcome for each distinct URL is also remembered, as the same links appear on many pages.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries: The entries of the ignore list
+
+        Raises:
+            ValueError: if a regular expression entry is not valid
+        """
+        self.entries = list(dict.fromkeys(entries))
+        self._hosts = {}
+        self._prefixes = {}
+        patterns = []
+        for entry in self.entries:
+            if entry.startswith(HOST_ENTRY):
+                self._hosts[entry[len(HOST_ENTRY) :].lower()] = entry
+            elif entry.startswith(PREFIX_ENTRY):
+                prefix = entry[len(PREFIX_ENTRY) :]
+                self._prefixes.setdefault(len(prefix), {})[prefix] = entry
+            elif entry.startswith(GLOB_ENTRY):
+                # Globs match the whole URL, so they are anchored to its start as well as its end
+                patterns.append((entry, r"\A" + fnmatch.translate(entry[len(GLOB_ENTRY) :])))
+            elif entry.startswith(REGEX_ENTRY):
+                expression = entry[len(REGEX_ENTRY) :]
+                try:
+                    re.compile("(?:{})".format(expression))
+                except re.error as e:
+                    raise ValueError("Invalid ignored URL {}: {}".format(entry, e))
+                patterns.append((entry, expression))
+            elif len(entry) < KEY_LENGTH:
+                patterns.append((entry, re.escape(entry)))
+        self._texts = self._file_texts(
+            [
+                entry
+                for entry in self.entries
+                if len(entry) >= KEY_LENGTH
+                and not entry.startswith((HOST_ENTRY, PREFIX_ENTRY, GLOB_ENTRY, REGEX_ENTRY))
+            ]
+        )
+        # Each entry gets a named group so that the entry which matched can be found again
+        self._pattern_entries = {"e{}".format(i): entry for i, (entry, _) in enumerate(patterns)}
+        self._pattern = (
+            re.compile(
+                "|".join(
+                    "(?P<e{}>{})".format(i, expression)
+                    for i, (_, expression) in enumerate(patterns)
+                )
+            )
+            if patterns
+            else None
+        )
+        self._outcomes = {}
+        self._used = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_texts(texts):
+        """
+        Returns:
+            For each run of characters used as a key, the text entries filed under it with where the run starts in them
+        """
+        keys = [
+            {text[i : i + KEY_LENGTH] for i in range(len(text) - KEY_LENGTH + 1)} for text in texts
+        ]
+        counts = {}
+        for text_keys in keys:
+            for key in text_keys:
+                counts[key] = counts.get(key, 0) + 1
+        filed = {}
+        for text, text_keys in zip(texts, keys):
+            key = min(sorted(text_keys), key=lambda k: counts[k])
+            filed.setdefault(key, []).append((text, text.index(key)))
+        return filed
+
+    def _find_entry(self, url):
+        if self._hosts:
+            host = get_host(url)
+            if host in self._hosts:
+                return self._hosts[host]
+        for length, prefixes in self._prefixes.items():
+            if url[:length] in prefixes:
+                return prefixes[url[:length]]
+        if self._texts:
+            for i in range(len(url) - KEY_LENGTH + 1):
+                for text, offset in self._texts.get(url[i : i + KEY_LENGTH], ()):
+                    if i >= offset and url.startswith(text, i - offset):
+                        return text
+        if self._pattern is not None:
+            match = self._pattern.search(url)
+            if match is not None:
+                return self._pattern_entries[match.lastgroup]
+        return None
+
+    def matches(self, url):
+        """
+        Returns:
+            True if the link is ignored
+        """
+        try:
+            return self._outcomes[url]
+        except KeyError:
+            pass
+        entry = self._find_entry(url)
+        if entry is not None:
+            with self._lock:
+                self._used.add(entry)
+        self._outcomes[url] = entry is not None
+        return entry is not None
+
+    def used_entries(self):
+        """
+        Returns:
+            The entries which have been the reason a link was ignored
+        """
+        with self._lock:
+            return set(self._used)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_url_matcher(entries):
+    return UrlMatcher(entries)
+
+
+def get_url_matcher(entries):
+    """
+    Returns:
+        The matcher for the ignore list, shared by every page checked against the same list
+    """
+    return _get_url_matcher(tuple(entries))
+
+
+def unused_entries(matchers):
+    """
+    Returns:
+        The entries of any of the matchers which were not the reason any of them ignored a link
+    """
+    used = set()
+    for matcher in matchers:
+        used |= matcher.used_entries()
+    entries = dict.fromkeys(entry for matcher in matchers for entry in matcher.entries)
+    return [entry for entry in entries if entry not in used]
@@ -0,0 +1,55 @@
+import json
+from collections import namedtuple
+
+from utils.ignored_words import IGNORED_URLS, IGNORED_WORDS
+from utils.url_matcher import get_url_matcher
+from wiki import Wiki
+
+DEFAULT_WIKI_CONFIG_PATH = "wikis.json"
+SPELLING_CHECK = "spelling"
+LINKS_CHECK = "links"
+SHADOW_CHECK = "shadow"
+CHECKS = [SPELLING_CHECK, LINKS_CHECK, SHADOW_CHECK]
+
+WikiConfig = namedtuple("WikiConfig", ["wiki", "checks", "ignored_items"])
+
+
+def load_wiki_config(path=DEFAULT_WIKI_CONFIG_PATH):
+    """
+    Reads the wikis to check, and how to check them, from a JSON file of the form:
+
+        {"wikis": [{"name": "IBEX", "url": "...", "checks": ["spelling", "links"],
+                    "ignored_words": ["..."], "ignored_urls": ["..."]}]}
+
+    Only the name is required. The URL defaults to the Github wiki of the repository with the same name, every check
+    is run if none are given, and the ignored words and URLs are added to those in words.txt and ignored_urls.txt.
+
+    Returns:
+        A list of the configuration of each wiki
+
+    Raises:
+        ValueError: if the file is not valid
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    wiki_configs = []
+    for entry in config["wikis"]:
+        checks = entry.get("checks", CHECKS)
+        unknown_checks = set(checks) - set(CHECKS)
+        if unknown_checks:
+            raise ValueError(
+                "Unknown checks for wiki {}: {}".format(
+                    entry["name"], ", ".join(sorted(unknown_checks))
+                )
+            )
+        ignored_items = {
+            "WORDS": IGNORED_WORDS
+            | frozenset(word.lower() for word in entry.get("ignored_words", [])),
+            "URLS": IGNORED_URLS + entry.get("ignored_urls", []),
+        }
+        # Compiled now so that an invalid entry is reported before anything is checked
+        get_url_matcher(ignored_items["URLS"])
+        wiki_configs.append(
+            WikiConfig(Wiki(entry["name"], url=entry.get("url")), checks, ignored_items)
+        )
+    return wiki_configs
@@ -0,0 +1,128 @@
+import os
+import threading
+from urllib.parse import unquote
+
+import utils.global_vars
+from utils.page import as_page
+
+_index_lock = threading.Lock()
+
+
+class WikiIndex(object):
+    """
+    Index of the pages, files and heading anchors of a wiki, built once so that every intra-wiki link can be
+    resolved without touching the disk.
+
+    The files of a whole wiki are only listed if a link to a file needs them. Pages checked on their own may be in any
+    folder, such as a home folder, so links to files from them are looked up on the disk one at a time instead.
+    """
+
+    def __init__(self, wiki_dir, pages, walk_files=False):
+        """
+        Args:
+            wiki_dir: The directory of the wiki, or an empty string if the pages aren't in a wiki
+            pages: Paths of all of the pages in the wiki
+            walk_files: Whether wiki_dir is a whole wiki, whose files are listed once rather than looked up one by one
+        """
+        self.wiki_dir = wiki_dir
+        self.name = os.path.basename(os.path.normpath(wiki_dir)) if wiki_dir else ""
+        self._pages = {}
+        for page in pages:
+            self._pages.setdefault(
+                os.path.splitext(os.path.basename(page))[0].lower(), as_page(page)
+            )
+        self._entries = set(os.listdir(wiki_dir)) if wiki_dir else set()
+        self.walk_files = walk_files
+        self._files = None
+        self._files_lock = threading.Lock()
+
+    def _walk_files(self):
+        with self._files_lock:
+            if self._files is None:
+                files_found = set()
+                for root, dirs, files in os.walk(self.wiki_dir):
+                    dirs[:] = [d for d in dirs if d != ".git"]
+                    for f in files:
+                        files_found.add(
+                            os.path.normcase(os.path.relpath(os.path.join(root, f), self.wiki_dir))
+                        )
+                self._files = files_found
+            return self._files
+
+    def has_page(self, name):
+        """
+        Args:
+            name: The name of a page, without its extension
+        """
+        return name.lower() in self._pages
+
+    def has_entry(self, name):
+        """
+        Args:
+            name: The name of a file or folder at the top level of the wiki
+        """
+        return name in self._entries
+
+    def has_file(self, relative_path):
+        if not self.wiki_dir:
+            return False
+        if not self.walk_files:
+            return os.path.isfile(os.path.join(self.wiki_dir, relative_path))
+        return os.path.normcase(os.path.normpath(relative_path)) in self._walk_files()
+
+    def has_anchor(self, page_name, anchor):
+        """
+        Args:
+            page_name: The name of the page, without its extension
+            anchor: The anchor within the page, without the "#"
+
+        Returns:
+            Whether the page has a heading or HTML anchor with the given anchor. Anchors can only be checked in
+            markdown pages, so this is always True for other pages.
+        """
+        page = self._pages.get(page_name.lower())
+        if page is None or page.extension != ".md":
+            return True
+        try:
+            anchors = page.anchors
+        except OSError:
+            return True
+        return unquote(anchor).lower() in anchors
+
+
+def get_wiki_index(wiki_dir, pages, walk_files=False):
+    """
+    Args:
+        wiki_dir: The directory of the wiki
+        pages: Paths of all of the pages in the wiki
+        walk_files: Whether wiki_dir is a whole wiki, whose files are listed once rather than looked up one by one
+
+    Returns:
+        The index for the wiki in the given directory, built the first time it is asked for in the run
+    """
+    with _index_lock:
+        index = utils.global_vars.wiki_indexes.get(wiki_dir)
+        if index is None:
+            index = WikiIndex(wiki_dir, pages, walk_files)
+            utils.global_vars.wiki_indexes[wiki_dir] = index
+        return index
+
+
+def find_wiki_index(name):
+    """
+    Returns:
+        The index of the wiki with the given name if it has been built this run, otherwise None
+    """
+    with _index_lock:
+        return next(
+            (index for index in utils.global_vars.wiki_indexes.values() if index.name == name), None
+        )
+
+
+def indexed_wiki_names():
+    """
+    Returns:
+        The names of the wikis which have been indexed this run
+    """
+    with _index_lock:
+        return {index.name for index in utils.global_vars.wiki_indexes.values() if index.name}
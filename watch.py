@@ -0,0 +1,253 @@
+import json
+import os
+import socketserver
+import threading
+import time
+import unittest
+
+import utils.global_vars
+from tests.page_tests import PageTests
+from utils.ignored_words import IGNORED_ITEMS
+from utils.link_failures import LinkFailures
+from utils.link_registry import LinkRegistry
+from utils.page import Page
+
+DEFAULT_POLL_INTERVAL = 0.2
+
+
+class WatchLinkFailures(LinkFailures):
+    """
+    Link failures which can also be taken back as they are found, so they can be reported against the page test that
+    found them rather than only in the summary.
+    """
+
+    def __init__(self):
+        super(WatchLinkFailures, self).__init__()
+        self._new = []
+
+    def add(self, error, url, wiki_name, page_name):
+        super(WatchLinkFailures, self).add(error, url, wiki_name, page_name)
+        with self._lock:
+            self._new.append("{} ({})".format(error.strip(), url))
+
+    def take(self):
+        with self._lock:
+            new, self._new = self._new, []
+        return new
+
+
+class WatchResult(unittest.TestResult):
+    """
+    Test result which keeps the outcome of each page test as a plain record that can be written out as JSON.
+    """
+
+    def __init__(self, link_failures):
+        super(WatchResult, self).__init__()
+        self.link_failures = link_failures
+        self.records = []
+
+    def _record(self, test, message):
+        self.records.append(
+            {
+                "page": test.page,
+                "test": test._testMethodName,
+                "passed": message is None,
+                "message": message,
+            }
+        )
+
+    def addSuccess(self, test):  # noqa: N802
+        self._record(test, None)
+
+    def addFailure(self, test, err):  # noqa: N802
+        self._record(test, str(err[1]))
+
+    def addError(self, test, err):  # noqa: N802
+        self._record(test, "{}: {}".format(err[0].__name__, err[1]))
+
+    def stopTest(self, test):  # noqa: N802
+        super(WatchResult, self).stopTest(test)
+        # External links that failed are only collected by the link test, not failed by it
+        failed_links = self.link_failures.take()
+        if failed_links and self.records:
+            record = self.records[-1]
+            messages = [record["message"]] if record["message"] else []
+            record["message"] = "\n".join(messages + failed_links)
+            record["passed"] = False
+
+
+class WatchSession(object):
+    """
+    Checks the pages of a local folder, or a single page, again whenever they change.
+
+    Everything that is expensive to set up, such as the spell checker, the ignored words and the link cache, stays in
+    memory between checks, so only the work for the edited pages is repeated. Links are only reused through the link
+    cache, so they are checked again once it stops trusting them.
+    """
+
+    def __init__(self, folder=None, single_file=None):
+        """
+        Args:
+            folder: The folder of pages to watch, in the same way as --folder
+            single_file: The page to watch, in the same way as --file
+        """
+        self.folder = folder
+        self.single_file = single_file
+        self.wiki_dir = "" if folder else os.path.dirname(single_file)
+        self.test_names = unittest.TestLoader().getTestCaseNames(PageTests)
+        self.results = {}
+        self._signatures = {}
+
+    def find_pages(self):
+        if self.single_file:
+            return [Page(self.single_file)] if os.path.exists(self.single_file) else []
+        return [
+            Page(os.path.join(self.folder, f)) for f in os.listdir(self.folder) if f.endswith(".md")
+        ]
+
+    @staticmethod
+    def _signature(page):
+        try:
+            stat = os.stat(page)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self):
+        """
+        Checks the pages which have changed since the last poll, or every page the first time.
+
+        Returns:
+            The results of the checks which were run, empty if nothing changed
+        """
+        pages = self.find_pages()
+        signatures = {page: self._signature(page) for page in pages}
+        changed = [page for page in pages if self._signatures.get(page) != signatures[page]]
+        removed = set(self._signatures) - set(pages)
+        if not changed and not removed:
+            return []
+        if set(pages) != set(self._signatures):
+            # Pages were added or removed, so links from any page may now be broken or fixed
+            changed = pages
+        for page in removed:
+            self.results.pop(page, None)
+        self._signatures = signatures
+
+        # The index of pages and headings is cheap to build, and any edit may have changed it
+        utils.global_vars.wiki_indexes.pop(self.wiki_dir, None)
+        # Links are only remembered for as long as the link cache trusts them, rather than for the whole session, and
+        # hosts which were down or rate limiting are given another chance
+        utils.global_vars.link_registry = LinkRegistry()
+        if utils.global_vars.link_engine is not None:
+            utils.global_vars.link_engine.host_health.reset()
+        link_failures = WatchLinkFailures()
+        utils.global_vars.link_failures = link_failures
+        result = WatchResult(link_failures)
+        for page in changed:
+            for test in self.test_names:
+                PageTests(test, IGNORED_ITEMS, (page, pages, self.wiki_dir))(result)
+        for record in result.records:
+            self.results.setdefault(record["page"], {})[record["test"]] = record
+        return result.records
+
+
+def current_results(session):
+    """
+    Returns:
+        The latest result of every test on every page of the session
+    """
+    return {
+        "updated_at": time.time(),
+        "results": [record for tests in session.results.values() for record in tests.values()],
+    }
+
+
+class ResultBroadcaster(object):
+    """
+    Sends results as JSON lines to every editor connected to a local socket, starting with the latest results.
+    """
+
+    def __init__(self, port, session):
+        broadcaster = self
+        self.session = session
+        self._lock = threading.Lock()
+        self._clients = []
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with broadcaster._lock:
+                    broadcaster._send(self.request, current_results(broadcaster.session))
+                    broadcaster._clients.append(self.request)
+                # Keep the connection open until the editor closes it
+                try:
+                    while self.request.recv(1024):
+                        pass
+                except OSError:
+                    pass
+                with broadcaster._lock:
+                    if self.request in broadcaster._clients:
+                        broadcaster._clients.remove(self.request)
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def _send(connection, message):
+        connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+    def send(self, records):
+        message = {"updated_at": time.time(), "results": records}
+        with self._lock:
+            for connection in list(self._clients):
+                try:
+                    self._send(connection, message)
+                except OSError:
+                    self._clients.remove(connection)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def print_records(records, seconds):
+    for record in records:
+        if not record["passed"]:
+            print("FAIL {} {}\n    {}".format(record["page"], record["test"], record["message"]))
+    failures = sum(1 for record in records if not record["passed"])
+    print(
+        "[{}] Ran {} checks in {:.2f}s, {} failed".format(
+            time.strftime("%H:%M:%S"), len(records), seconds, failures
+        )
+    )
+
+
+def watch(session, json_path=None, port=None, interval=DEFAULT_POLL_INTERVAL):
+    """
+    Polls the pages of a session for changes until interrupted, reporting the results of each check.
+
+    Args:
+        session: The pages to watch
+        json_path: File to write the latest results of every page to after each check, or None
+        port: Local port to send results to editors on as JSON lines, or None
+        interval: Seconds between looking for changes
+    """
+    broadcaster = ResultBroadcaster(port, session) if port is not None else None
+    print("Watching for changes, press Ctrl+C to stop")
+    try:
+        while True:
+            started = time.perf_counter()
+            records = session.poll()
+            if records:
+                print_records(records, time.perf_counter() - started)
+                if json_path is not None:
+                    with open(json_path, "w", encoding="utf-8") as f:
+                        json.dump(current_results(session), f, indent=1)
+                if broadcaster is not None:
+                    broadcaster.send(records)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if broadcaster is not None:
+            broadcaster.close()
@@ -1,24 +1,41 @@
+import concurrent.futures
+import contextlib
 import os
 
-import git
-
 from utils.file_system_utils import delete_dir, find_files_with_extension
 
+WIKI_URL = "https://github.com/ISISComputingGroup/{}.wiki.git"
+
 
 class Wiki(object):
-    def __init__(self, name):
+    def __init__(self, name, keep_clone=False, url=None):
         """
         Args:
             name: The name of the wiki
+            keep_clone: Whether to keep the clone between runs and update it, rather than cloning afresh each time
+            url: The git URL to clone the wiki from, by default the Github wiki of the repository with the same name
         """
         self.name = name
+        self.keep_clone = keep_clone
+        self.url = url if url is not None else WIKI_URL.format(name)
+        self._pages = None
 
     def __enter__(self):
+        import git
+
+        self._pages = None
+        if self.keep_clone and os.path.isdir(os.path.join(self.get_path(), ".git")):
+            try:
+                self.update_clone()
+                return
+            except git.GitCommandError as ex:
+                print("Unable to update {}, cloning again: {}".format(self.name, ex))
         self.clean_source()
         self.clone_wiki_from_web()
 
     def __exit__(self, *args):
-        self.clean_source()
+        if not self.keep_clone:
+            self.clean_source()
 
     def get_path(self):
         return os.path.join(os.getcwd(), "source", self.name)
@@ -30,11 +47,66 @@ class Wiki(object):
         repo_path = self.get_path()
         if not os.path.exists(repo_path):
             os.makedirs(repo_path)
-        git.Git(repo_path).clone(
-            "https://github.com/ISISComputingGroup/{}.wiki.git".format(self.name), repo_path
-        )
+        # Only the latest version of each page is checked, so the history is not needed
+        import git
+
+        git.Git(repo_path).clone(self.url, repo_path, depth=1)
+
+    def update_clone(self):
+        import git
+
+        repo = git.Repo(self.get_path())
+        repo.git.fetch("origin", depth=1)
+        repo.git.reset("--hard", "origin/HEAD")
+        repo.git.clean("-fdx")
 
     def get_pages(self):
-        files = find_files_with_extension(self.get_path(), "md")
-        files.extend(find_files_with_extension(self.get_path(), "rest"))
-        return files
+        """
+        Returns:
+            The pages of the wiki, found once per clone so that the index and every check share each page's parsed
+            text
+        """
+        if self._pages is None:
+            pages = list(find_files_with_extension(self.get_path(), "md"))
+            pages.extend(find_files_with_extension(self.get_path(), "rest"))
+            self._pages = pages
+        return self._pages
+
+
+@contextlib.contextmanager
+def acquire_wikis(wikis, run_profile=None):
+    """
+    Clones (or updates) all of the given wikis concurrently, keeps them for the duration of the context and then
+    cleans them all up once.
+
+    Args:
+        wikis: The wikis to acquire
+        run_profile: Profile to record the time taken to clone the wikis in, if any
+
+    Yields:
+        A dictionary from each wiki that could not be acquired to the error raised when cloning it
+    """
+    # GitPython is slow to import, so it is only imported by the runs which clone wikis
+    import git
+
+    failures = {}
+    clone_phase = (
+        run_profile.phase("clone") if run_profile is not None else contextlib.nullcontext()
+    )
+    # Any other error, or an interrupt, stops the run, but only once every clone has finished and been cleaned up
+    try:
+        with (
+            clone_phase,
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(len(wikis), 1)) as executor,
+        ):
+            futures = {executor.submit(wiki.__enter__): wiki for wiki in wikis}
+            for future in concurrent.futures.as_completed(futures):
+                wiki = futures[future]
+                try:
+                    future.result()
+                except git.GitCommandError as ex:
+                    failures[wiki] = ex
+        yield failures
+    finally:
+        for wiki in wikis:
+            wiki.__exit__(None, None, None)